@@ -36,6 +36,12 @@ import sys
 import struct
 import platform
 
+#lxml is optional.  If it is installed, iterparse uses it when only some FileObject fields are requested.
+try:
+    import lxml.etree as _lxml_etree
+except ImportError:
+    _lxml_etree = None
+
 _logger = logging.getLogger(os.path.basename(__file__))
 
 #Contains: (namespace, local name) qualified XML element name pairs
@@ -154,6 +160,18 @@ def _strcast(val):
         return None
     return str(val)
 
+def _to_ET(e):
+    """Returns an ElementTree Element for e, which may be an ElementTree or lxml Element.  lxml Elements are copied by serializing and re-parsing them, so this is only meant for small subtrees."""
+    if isinstance(e, (ET.Element, ET.ElementTree)):
+        return e
+    return ET.fromstring(_lxml_etree.tostring(e))
+
+def _internstrcast(val):
+    """Casts as _strcast does, and interns the result.  Use this for values that repeat across many objects, such as uids and byte run types, so each distinct string is only held in memory once."""
+    if val is None:
+        return None
+    return sys.intern(str(val))
+
 def _typecheck(obj, classinfo):
     if not isinstance(obj, classinfo):
         _logger.info("obj = " + repr(obj))
@@ -1261,6 +1279,16 @@ class ByteRun(object):
       "uncompressed_len"
     ])
 
+    __slots__ = (
+      "_file_offset",
+      "_fill",
+      "_fs_offset",
+      "_img_offset",
+      "_len",
+      "_type",
+      "_uncompressed_len"
+    )
+
     def __init__(self, *args, **kwargs):
         for prop in ByteRun._all_properties:
             setattr(self, prop, kwargs.get(prop))
@@ -1332,18 +1360,12 @@ class ByteRun(object):
         (ns, tn) = _qsplit(e.tag)
         assert tn == "byte_run"
 
-        copied_attrib = copy.deepcopy(e.attrib)
-
-        #Populate run properties from element attributes
-        for prop in ByteRun._all_properties:
-            if prop in copied_attrib:
-                val = copied_attrib.get(prop)
+        #Populate run properties from element attributes, noting any remaining properties
+        for (prop, val) in e.attrib.items():
+            if prop in ByteRun._all_properties:
                 if not val is None:
                     setattr(self, prop, val)
-                del copied_attrib[prop]
-        #Note remaining properties
-        for prop in copied_attrib:
-            if prop not in _warned_byterun_attribs:
+            elif prop not in _warned_byterun_attribs:
                 _warned_byterun_attribs.add(prop)
                 _logger.warning("No instructions present for processing this attribute found on a byte run: %r." % prop)
 
@@ -1426,7 +1448,7 @@ class ByteRun(object):
 
     @type.setter
     def type(self, val):
-        self._type = _strcast(val)
+        self._type = _internstrcast(val)
 
     @property
     def uncompressed_len(self):
@@ -1454,6 +1476,8 @@ class ByteRuns(object):
 
     _facet_values = [None, "data", "inode", "name"]
 
+    __slots__ = ("_facet", "_listdata")
+
     def __init__(self, run_list=None, **kwargs):
         self._facet = kwargs.get("facet")
         self._listdata = []
@@ -1655,18 +1679,29 @@ class ByteRuns(object):
             _typecheck(val, str)
         if val not in ByteRuns._facet_values:
             raise ValueError("A ByteRuns facet must be one of these: %r.  Received: %r." % (ByteRuns._facet_values, val))
+        if not val is None:
+            val = sys.intern(val)
         self._facet = val
 
 re_precision = re.compile(r"(?P<num>\d+)(?P<unit>(|m|n)s|d)?")
+re_iso8601 = re.compile(r"\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])[T ]\d\d:\d\d:\d\d(\.\d+)?(Z|[-+]\d\d:?\d\d)?$")
+
+#Parsed precision strings, so TimestampObjects with the same precision share one tuple.
+_precisions = dict()
+
 class TimestampObject(object):
     """
     Encodes the "dftime" type.  Wraps around dfxml.dftime, closely enough that this might just get folded into that class.
 
     TimestampObjects implement a vs-null comparison workaround as in the SAS family of products:  Null, for ordering purposes, is considered to be a value less than negative infinity.
+
+    Numeric and ISO 8601 times are stored as given, and the dfxml.dftime object is only built when .time or .timestamp is first accessed.
     """
 
     timestamp_name_list = ["mtime", "atime", "ctime", "crtime", "dtime", "bkup_time"]
 
+    __slots__ = ("_name", "_prec", "_time", "_time_value")
+
     def __init__(self, *args, **kwargs):
         self.name = kwargs.get("name")
         self.prec = kwargs.get("prec")
@@ -1679,8 +1714,6 @@ class TimestampObject(object):
         else:
             raise ValueError("Unexpected arguments.  Whole args tuple: %r." % (args,))
 
-        self._timestamp = None
-
     def __eq__(self, other):
         #Check type
         if other is None:
@@ -1777,6 +1810,7 @@ class TimestampObject(object):
         if not value is None:
             if not value in TimestampObject.timestamp_name_list:
                 raise ValueError("The timestamp name must be in this list: %r.  Received: %r." % (TimestampObject.timestamp_name_list, value))
+            value = sys.intern(value)
         self._name = value
 
     @property
@@ -1798,10 +1832,13 @@ class TimestampObject(object):
             self._prec = value
             return self._prec
 
-        m = re_precision.match(value)
-        md = m.groupdict()
-        tup = (int(md["num"]), md.get("unit") or "s")
-        #_logger.debug("tup = %r" % (tup,))
+        tup = _precisions.get(value)
+        if tup is None:
+            m = re_precision.match(value)
+            md = m.groupdict()
+            tup = (int(md["num"]), md.get("unit") or "s")
+            #_logger.debug("tup = %r" % (tup,))
+            _precisions[value] = tup
         self._prec = tup
 
     @property
@@ -1809,23 +1846,34 @@ class TimestampObject(object):
         """
         The actual timestamp.  A dfxml.dftime object.  This class might be superfluous and end up collapsing into that...
         """
+        if self._time is None and not self._time_value is None:
+            self._time = dfxml.dftime(self._time_value)
+            self._time_value = None
         return self._time
 
     @time.setter
     def time(self, value):
+        self._time = None
+        self._time_value = None
         if value is None:
-            self._time = None
+            return
+        if type(value) in (int, float) or \
+          (isinstance(value, str) and len(value) > 5 and value[4] == "-"):
+            #dfxml.dftime stores these without checking them, so building it can wait until it is needed.
+            #A string is still checked here, so that a malformed timestamp fails when it is parsed.
+            if isinstance(value, str) and re_iso8601.match(value) is None:
+                raise ValueError("Malformed ISO 8601 timestamp: %r" % value)
+            self._time_value = value
         else:
             checked_value = dfxml.dftime(value)
-            #_logger.debug("checked_value.timestamp() = %r" % checked_value.timestamp())
             self._time = checked_value
-            #Propagate timestamp value to other formats
-            self._timestamp = self._time.timestamp()
 
     @property
     def timestamp(self):
         """A Unix floating-point timestamp, as time.mktime returns.  Currently, there is no setter for this property."""
-        return self._timestamp
+        if self.time is None:
+            return None
+        return self.time.timestamp()
 
 
 class FileObject(object):
@@ -1910,17 +1958,63 @@ class FileObject(object):
       "matched":"delta:matched"
     }
 
+    #One slot per property, instead of a per-instance __dict__.  byte_runs is stored as data_brs.
+    __slots__ = (
+      "_alloc",
+      "_alloc_inode",
+      "_alloc_name",
+      "_annos",
+      "_atime",
+      "_bkup_time",
+      "_compressed",
+      "_crtime",
+      "_ctime",
+      "_data_brs",
+      "_diffs",
+      "_dtime",
+      "_error",
+      "_externals",
+      "_filename",
+      "_filesize",
+      "_gid",
+      "_id",
+      "_inode",
+      "_inode_brs",
+      "_libmagic",
+      "link_target",
+      "_md5",
+      "_meta_type",
+      "_mode",
+      "_mtime",
+      "_name_brs",
+      "_name_type",
+      "_nlink",
+      "_original_fileobject",
+      "_orphan",
+      "_parent_object",
+      "_partition",
+      "_seq",
+      "_sha1",
+      "_sha256",
+      "_sha512",
+      "_uid",
+      "_unalloc",
+      "_unused",
+      "_used",
+      "_volume_object"
+    )
+
     def __init__(self, *args, **kwargs):
-        #Prime all the properties
+        #Null every property directly; the setters would only cast None to None.  The annotation and difference sets, and the externals list, are only created when they are first used.  Most files never need them.
+        for slot in FileObject.__slots__:
+            if slot != "_volume_object":
+                setattr(self, slot, None)
+        #Then set the properties that were passed in
         for prop in FileObject._all_properties:
             if prop == "annos":
                 continue
-            elif prop == "externals":
-                setattr(self, prop, kwargs.get(prop, OtherNSElementList()))
-            else:
-                setattr(self, prop, kwargs.get(prop))
-        self._annos = set()
-        self._diffs = set()
+            elif prop in kwargs:
+                setattr(self, prop, kwargs[prop])
 
     def __eq__(self, other):
         if other is None:
@@ -2080,7 +2174,8 @@ class FileObject(object):
 
         #Map "delta:" attributes of <fileobject>s into the self.annos set
         #_logger.debug("self.annos, before: %r." % self.annos)
-        _read_differential_annotations(FileObject._diff_attr_names, e, self.annos)
+        if len(e.attrib) > 0:
+            _read_differential_annotations(FileObject._diff_attr_names, e, self.annos)
         #_logger.debug("self.annos, after: %r." % self.annos)
 
         #Look through direct-child elements for other properties
@@ -2149,6 +2244,48 @@ class FileObject(object):
                     _warned_elements.add((cns, ctn))
                     _logger.warning("Uncertain what to do with this element: %r" % ce)
 
+    def populate_fields_from_Element(self, e, fields):
+        """Populates only the properties named in fields from a fileobject Element, and leaves the rest null.  This skips the decoding of every other child element, so it is much faster than populate_from_Element when only a few properties are needed.  The Element may come from ElementTree or lxml.  Changed-property annotations are not read."""
+        if "annos" in fields and len(e.attrib) > 0:
+            _read_differential_annotations(FileObject._diff_attr_names, e, self.annos)
+
+        for ce in e:
+            ctag = ce.tag
+            if not isinstance(ctag, str):
+                #lxml yields comments and processing instructions as children.
+                continue
+            ctn = ctag[ctag.rfind("}")+1 : ]
+
+            if ctn == "hashdigest":
+                prop = ce.get("type", "").lower()
+                if prop in ("md5", "sha1", "sha256", "sha512") and prop in fields:
+                    setattr(self, prop, ce.text)
+            elif ctn == "byte_runs":
+                facet = ce.get("facet")
+                if facet is None:
+                    prop = "data_brs"
+                elif facet in FileObject._br_facet_to_property:
+                    prop = FileObject._br_facet_to_property[facet]
+                else:
+                    continue
+                if prop in fields or (prop == "data_brs" and "byte_runs" in fields):
+                    brs = ByteRuns()
+                    brs.populate_from_Element(_to_ET(ce))
+                    setattr(self, prop, brs)
+            elif ctn in ["original_fileobject", "parent_object"]:
+                if ctn in fields:
+                    fobj = FileObject()
+                    fobj.populate_from_Element(_to_ET(ce))
+                    setattr(self, ctn, fobj)
+            elif ctn in TimestampObject.timestamp_name_list:
+                if ctn in fields:
+                    setattr(self, ctn, TimestampObject(ce.text, name=ctn, prec=ce.get("prec")))
+            elif ctn in FileObject._all_properties:
+                if ctn in fields:
+                    setattr(self, ctn, ce.text)
+            elif "externals" in fields and ctag[0] == "{" and ctag[1 : ctag.rfind("}")] != dfxml.XMLNS_DFXML:
+                self.externals.append(_to_ET(ce))
+
     def populate_from_stat(self, s):
         """Populates FileObject fields from a stat() call."""
         import os
@@ -2184,8 +2321,11 @@ class FileObject(object):
         """Creates an ElementTree Element with elements in DFXML schema order."""
         outel = ET.Element("fileobject")
 
-        annos_whittle_set = copy.deepcopy(self.annos)
-        diffs_whittle_set = copy.deepcopy(self.diffs)
+        #Read the backing sets directly, so serializing doesn't create them.
+        annos = self._annos or set()
+        diffs = self._diffs or set()
+        annos_whittle_set = copy.deepcopy(annos)
+        diffs_whittle_set = copy.deepcopy(diffs)
 
         for annodiff in FileObject._diff_attr_names:
             if annodiff in annos_whittle_set:
@@ -2195,12 +2335,12 @@ class FileObject(object):
             _logger.warning("Failed to export some differential annotations: %r." % annos_whittle_set)
 
         def _anno_change(el):
-            if el.tag in self.diffs:
+            if el.tag in diffs:
                 el.attrib["delta:changed_property"] = "1"
                 diffs_whittle_set.remove(el.tag)
 
         def _anno_hash(el):
-            if el.attrib["type"] in self.diffs:
+            if el.attrib["type"] in diffs:
                 el.attrib["delta:changed_property"] = "1"
                 diffs_whittle_set.remove(el.attrib["type"])
 
@@ -2209,7 +2349,7 @@ class FileObject(object):
                 prop = FileObject._br_facet_to_property[el.attrib["facet"]]
             else:
                 prop = "data_brs"
-            if prop in self.diffs:
+            if prop in diffs:
                 el.attrib["delta:changed_property"] = "1"
                 #_logger.debug("diffs_whittle_set = %r." % diffs_whittle_set)
                 diffs_whittle_set.remove(prop)
@@ -2268,7 +2408,7 @@ class FileObject(object):
                 outel.append(tmpel)
 
         def _append_externals():
-            for e in self.externals:
+            for e in self._externals or []:
                 outel.append(e)
 
         def _append_object(name, value, namespace_prefix=None):
@@ -2388,6 +2528,8 @@ class FileObject(object):
     @property
     def annos(self):
         """Set of differential annotations.  Expected members are the keys of this class's _diff_attr_names dictionary."""
+        if self._annos is None:
+            self._annos = set()
         return self._annos
 
     @annos.setter
@@ -2482,6 +2624,8 @@ class FileObject(object):
     @property
     def diffs(self):
         """This property intentionally has no setter.  To populate, call compare_to_original() after assigning an original_fileobject."""
+        if self._diffs is None:
+            self._diffs = set()
         return self._diffs
 
     @property
@@ -2519,6 +2663,8 @@ class FileObject(object):
         This property exposes XML elements of other namespaces.  Since these elements can be of arbitrary complexity, this list is solely comprised ofxml.etree.ElementTree.Element objects.  The tags must be a fully-qualified namespace (of the pattern {URI}localname).  If generating the Elements with a script instead of de-serializing from XML, you should issue an ElementTree register_namespace call with your namespace abbreviation prefix.
         NOTE:  Diffs are currently NOT computed for external elements.
         NOTE:  This property should be considered unstable, as the interface is in an early design phase.  Please notify the maintainers of this library (see the Git history for the Objects.py file) if you are using this interface and wish to be notified of updates."""
+        if self._externals is None:
+            self._externals = OtherNSElementList()
         return self._externals
 
     @externals.setter
@@ -2540,7 +2686,7 @@ class FileObject(object):
 
     @gid.setter
     def gid(self, val):
-        self._gid = _strcast(val)
+        self._gid = _internstrcast(val)
 
     @property
     def id(self):
@@ -2636,7 +2782,7 @@ class FileObject(object):
         if val is None:
             self._name_type = val
         else:
-            cast_val = _strcast(val)
+            cast_val = _internstrcast(val)
             if cast_val not in ["-", "V", "b", "c", "d", "h", "l", "p", "r", "s", "v", "w"]:
                 raise ValueError("Unexpected name_type received: %r (casted to %r)." % (val, cast_val))
             self._name_type = cast_val
@@ -2724,7 +2870,7 @@ class FileObject(object):
 
     @uid.setter
     def uid(self, val):
-        self._uid = _strcast(val)
+        self._uid = _internstrcast(val)
 
     @property
     def unalloc(self):
@@ -3258,6 +3404,7 @@ def iterparse(filename, events=("start","end"), **kwargs):
     @param events: Events.  Optional.  A tuple of strings, containing "start" and/or "end".
     @param dfxmlobject: A DFXMLObject document.  Optional.  A DFXMLObject is created and yielded in the object stream if this argument is not supplied.
     @param fiwalk: Optional.  Path to a particular fiwalk build you want to run.
+    @param fields: Optional.  An iterable of FileObject property names, e.g. ("filename", "filesize", "md5").  Only these properties are populated on each FileObject; the rest are left null.  The document is parsed with lxml if it is installed.  Use this when a caller does not need whole FileObjects - it is several times faster.
     """
 
     #The DFXML stream file handle.
@@ -3279,6 +3426,31 @@ def iterparse(filename, events=("start","end"), **kwargs):
 
     dobj = kwargs.get("dfxmlobject", DFXMLObject())
 
+    fields = kwargs.get("fields")
+    if not fields is None:
+        fields = frozenset(fields)
+        if not fields <= FileObject._all_properties:
+            raise ValueError("Unexpected FileObject fields: %r.  Expecting names from: %r." % (sorted(fields - FileObject._all_properties), sorted(FileObject._all_properties)))
+    use_lxml = not fields is None and not _lxml_etree is None
+    if use_lxml:
+        #Only the stream elements raise events.  Document and volume properties are copied from the tree when the stream starts, in _glom_children.
+        parse_events = _lxml_etree.iterparse(fh, events=("start-ns", "start", "end"), tag=("{*}dfxml", "{*}volume", "{*}fileobject"))
+    else:
+        parse_events = ET.iterparse(fh, events=("start-ns", "start", "end"))
+
+    def _glom_children(proxy, children, document_properties):
+        """lxml only.  Appends copies of already-parsed property elements to a DFXML or volume proxy.  For the DFXML document, only the elements that the ElementTree branch below would glom are copied."""
+        for child in children:
+            if not isinstance(child.tag, str):
+                continue
+            (cns, cln) = _qsplit(child.tag)
+            if document_properties and not (cln in ["metadata", "creator", "source"] or cns != dfxml.XMLNS_DFXML):
+                continue
+            proxy.append(_to_ET(child))
+
+    def _preceding_siblings(elem):
+        return reversed(list(elem.itersiblings(preceding=True)))
+
     #The only way to efficiently populate VolumeObjects is to populate the object when the stream has hit its first FileObject.
     vobj = None
 
@@ -3295,7 +3467,7 @@ def iterparse(filename, events=("start","end"), **kwargs):
     READING_POSTSTREAM = 4 #DFXML metadata, post-Object stream (typically the <rusage> element)
     _state = READING_START
 
-    for (ETevent, elem) in ET.iterparse(fh, events=("start-ns", "start", "end")):
+    for (ETevent, elem) in parse_events:
         #View the object event stream in debug mode
         #_logger.debug("(event, elem) = (%r, %r)" % (ETevent, elem))
         #if ETevent in ("start", "end"):
@@ -3303,8 +3475,15 @@ def iterparse(filename, events=("start","end"), **kwargs):
 
         #Track namespaces
         if ETevent == "start-ns":
-            dobj.add_namespace(*elem)
-            ET.register_namespace(*elem)
+            #lxml reports the default namespace prefix as None.
+            (prefix, uri) = elem
+            prefix = prefix or ""
+            dobj.add_namespace(prefix, uri)
+            ET.register_namespace(prefix, uri)
+            continue
+
+        #While reading files, only the stream elements change state.  The children of each fileobject are read from its "end" event, so skip their own events without splitting the tag.  (The suffix test also lets through original_fileobject, which the branches below ignore.)
+        if _state == READING_FILES and not elem.tag.endswith(("fileobject", "volume", "dfxml")):
             continue
 
         #Split tag name into namespace and local name
@@ -3322,6 +3501,8 @@ def iterparse(filename, events=("start","end"), **kwargs):
             elif ln == "volume":
                 if _state == READING_PRESTREAM:
                     #Cut; yield DFXMLObject now.
+                    if use_lxml:
+                        _glom_children(dfxml_proxy, _preceding_siblings(elem), True)
                     dobj.populate_from_Element(dfxml_proxy)
                     if "start" in _events:
                         yield ("start", dobj)
@@ -3333,6 +3514,8 @@ def iterparse(filename, events=("start","end"), **kwargs):
             elif ln == "fileobject":
                 if _state == READING_PRESTREAM:
                     #Cut; yield DFXMLObject now.
+                    if use_lxml:
+                        _glom_children(dfxml_proxy, _preceding_siblings(elem), True)
                     dobj.populate_from_Element(dfxml_proxy)
                     if "start" in _events:
                         yield ("start", dobj)
@@ -3340,6 +3523,8 @@ def iterparse(filename, events=("start","end"), **kwargs):
                     #_logger.debug("Encountered a fileobject while reading volume properties.  Yielding volume now.")
                     #Cut; yield VolumeObject now.
                     if volume_proxy is not None:
+                        if use_lxml:
+                            _glom_children(volume_proxy, _preceding_siblings(elem), False)
                         vobj = VolumeObject()
                         vobj.populate_from_Element(volume_proxy)
                         if "start" in _events:
@@ -3355,23 +3540,34 @@ def iterparse(filename, events=("start","end"), **kwargs):
                     #More frequently, we hit this point when there are no volume groupings.
                     vobj = None
                 fi = FileObject()
-                fi.populate_from_Element(elem)
+                if fields is None:
+                    fi.populate_from_Element(elem)
+                else:
+                    fi.populate_fields_from_Element(elem, fields)
                 fi.volume_object = vobj
                 #_logger.debug("fi = %r" % fi)
                 if "end" in _events:
                     yield ("end", fi)
                 #Reset
                 elem.clear()
+                if use_lxml:
+                    #lxml keeps cleared elements in the tree, so also drop the siblings already read.
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
             elif ln == "dfxml":
                 if "end" in _events:
                     #_logger.debug("end, dfxml, _state=%r" % _state)
                     if _state == READING_PRESTREAM:
                         #This DFXML document contains no volumes or files, but may contain other metadata.  Populate (which would normally be done before starting a child Object stream) and yield.
+                        if use_lxml:
+                            _glom_children(dfxml_proxy, elem, True)
                         dobj.populate_from_Element(dfxml_proxy)
                         yield ("end", dobj)
             elif ln == "volume":
                 if _state == READING_VOLUMES:
                     #Create and yield VolumeObject now (because there were no file objects to trigger it in the "start" ElementTree events branch above)
+                    if use_lxml:
+                        _glom_children(volume_proxy, elem, False)
                     vobj = VolumeObject()
                     vobj.populate_from_Element(volume_proxy)
                     if "start" in _events:
@@ -3400,11 +3596,11 @@ def iterparse(filename, events=("start","end"), **kwargs):
             raise e
         _logger.debug("...Done.")
 
-def parse(filename):
-    """Returns a DFXMLObject populated from the contents of the (string) filename argument."""
+def parse(filename, **kwargs):
+    """Returns a DFXMLObject populated from the contents of the (string) filename argument.  Keyword arguments, such as fields, are passed to iterparse."""
     retval = None
     appender = None
-    for (event, obj) in iterparse(filename):
+    for (event, obj) in iterparse(filename, **kwargs):
         if event == "start":
             if isinstance(obj, DFXMLObject):
                 retval = obj
@@ -105,17 +105,45 @@ def parse_args(args_):
         '-reproduction_creator',
         help='Enter the person/organisation that created the reproduction. Only suitable for reprodctions, not donations!'
     )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of files to hash at the same time when generating manifests and DFXML. Default is 1.'
+    )
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Reuse checksums from a persistent cache for files whose device, inode, size and modification time have not changed. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. Setting the IFISCRIPTS_CHECKSUM_CACHE environment variable has the same effect.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-chunks', nargs='?', const=ififuncs.CHUNK_SIZE,
+        type=ififuncs.parse_block_size, metavar='CHUNK_SIZE',
+        help='Also write a chunk manifest beside the package manifest, containing an MD5 for every 4M chunk of each file, or every CHUNK_SIZE chunk if a size is given, eg 16M. This is used by validate.py -sample for quick spot checks. The chunk digests are calculated in the same read as the sha512 manifest.'
+    )
     parsed_args = parser.parse_args(args_)
     return parsed_args
 
 
-def make_dfxml(args,new_uuid_path,uuid):
+def make_dfxml(args,new_uuid_path,uuid, manifests=()):
     '''
     Adds Digital Forensics XML to metadata folder and updates manifests.
+    If the checksum cache is enabled, checksums are taken from the package
+    manifests for files that the cache shows are unchanged since they were
+    hashed, and only the other files are read again. Otherwise the DFXML
+    is made without checksums.
     '''
     metadata = os.path.join(new_uuid_path, 'metadata')
     dfxml = os.path.join(metadata, uuid + '_dfxml.xml')
-    makedfxml.main([new_uuid_path, '-n', '-o', dfxml])
+    dfxml_cmd = [new_uuid_path, '-o', dfxml, '-j', str(args.jobs)]
+    if ififuncs.CHECKSUM_CACHE is None:
+        dfxml_cmd.append('-n')
+    else:
+        for manifest in manifests:
+            dfxml_cmd.extend(['-manifest', manifest])
+        dfxml_cmd.extend(['-cache', ififuncs.CHECKSUM_CACHE.cache_path])
+    makedfxml.main(dfxml_cmd)
     return dfxml
 
 def insert_filmographic(filmographic_csv, Reference_Number, package_filmographic):
@@ -221,10 +249,18 @@ def main(args_):
             ' eventIdentifierType=accession number, value=%s'
             % accession_number
         )
+        ififuncs.setup_checksum_cache(args.cache, args.no_cache, sipcreator_log)
         sip_manifest = os.path.join(
             accession_path, uuid
             ) + '_manifest.md5'
-        sha512_log = manifest.main([new_uuid_path, '-sha512', '-s'])
+        sha512_cmd = [new_uuid_path, '-sha512', '-s', '-j', str(args.jobs)]
+        if args.cache is not None:
+            sha512_cmd.extend(['-cache', args.cache])
+        if args.no_cache:
+            sha512_cmd.append('-no_cache')
+        if args.chunks:
+            sha512_cmd.extend(['-chunks', str(args.chunks)])
+        sha512_log = manifest.main(sha512_cmd)
         sha512_manifest = os.path.join(
             os.path.dirname(new_uuid_path), uuid + '_manifest-sha512.txt'
         )
@@ -233,7 +269,9 @@ def main(args_):
         print('Generating Digital Forensics XML')
         dfxml_check = True
         try:
-            dfxml = make_dfxml(args, new_uuid_path, uuid)
+            dfxml = make_dfxml(
+                args, new_uuid_path, uuid, [sip_manifest, sha512_manifest]
+            )
             ififuncs.generate_log(
                 sipcreator_log,
                 'EVENT = Metadata extraction - eventDetail=File system metadata extraction using Digital Forensics XML, eventOutcome=%s, agentName=makedfxml' % (dfxml)
@@ -247,6 +285,8 @@ def main(args_):
         # this is inefficient. The script should not have to ask for reference
         # number twice if someone wants to insert the filmographic but do not
         # want to make the pbcore csv, perhaps because the latter already exists.
+        package_manifest = ififuncs.Manifest(sip_manifest)
+        package_sha512_manifest = ififuncs.Manifest(sha512_manifest)
         if args.filmo_csv:
             metadata_dir = os.path.join(new_uuid_path, 'metadata')
             if '+' in Reference_Number:
@@ -260,18 +300,20 @@ def main(args_):
                     sipcreator_log,
                     'EVENT = Metadata extraction - eventDetail=Filmographic descriptive metadata added to metadata folder, eventOutcome=%s, agentName=accession.py' % (package_filmographic)
                 )
-                ififuncs.manifest_update(sip_manifest, package_filmographic)
-                ififuncs.sha512_update(sha512_manifest, package_filmographic)
+                ififuncs.manifest_update(package_manifest, package_filmographic)
+                ififuncs.sha512_update(package_sha512_manifest, package_filmographic)
                 print('Filmographic descriptive metadata added to metadata folder')
         ififuncs.generate_log(
             sipcreator_log,
             'EVENT = accession.py finished'
         )
-        ififuncs.checksum_replace(sip_manifest, sipcreator_log, 'md5')
-        ififuncs.checksum_replace(sha512_manifest, sipcreator_log, 'sha512')
+        ififuncs.checksum_replace(package_manifest, sipcreator_log, 'md5')
+        ififuncs.checksum_replace(package_sha512_manifest, sipcreator_log, 'sha512')
         if dfxml_check is True:
-            ififuncs.manifest_update(sip_manifest, dfxml)
-            ififuncs.sha512_update(sha512_manifest, dfxml)
+            ififuncs.manifest_update(package_manifest, dfxml)
+            ififuncs.sha512_update(package_sha512_manifest, dfxml)
+        package_manifest.commit()
+        package_sha512_manifest.commit()
         if args.pbcore:
             for ref in reference_list:
                 makepbcore_cmd = [accession_path, '-p', '-user', user, '-reference', ref]
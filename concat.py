@@ -238,9 +238,11 @@ def main(args_):
         shutil.move(fmd5_logfile, os.path.dirname(sipcreator_log))
         shutil.move(validation_logfile.replace('\\\\', '\\').replace('\:', ':'), os.path.dirname(sipcreator_log))
         logs_dir = os.path.dirname(sipcreator_log)
-        ififuncs.manifest_update(sipcreator_manifest, os.path.join(logs_dir, os.path.basename(fmd5_logfile)))
-        ififuncs.manifest_update(sipcreator_manifest, os.path.join(logs_dir,(os.path.basename(validation_logfile.replace('\\\\', '\\').replace('\:', ':')))))
-        ififuncs.merge_logs(log_name_source, sipcreator_log, sipcreator_manifest)
+        package_manifest = ififuncs.Manifest(sipcreator_manifest)
+        ififuncs.manifest_update(package_manifest, os.path.join(logs_dir, os.path.basename(fmd5_logfile)))
+        ififuncs.manifest_update(package_manifest, os.path.join(logs_dir,(os.path.basename(validation_logfile.replace('\\\\', '\\').replace('\:', ':')))))
+        ififuncs.merge_logs(log_name_source, sipcreator_log, package_manifest)
+        package_manifest.commit()
 
 if __name__ == '__main__':
     main(sys.argv[1:])
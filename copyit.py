@@ -14,35 +14,13 @@ import argparse
 import hashlib
 import shutil
 import unicodedata
+import json
+import threading
 from builtins import input
 import ififuncs
 from ififuncs import make_desktop_logs_dir, make_desktop_manifest_dir, generate_log
 
 
-def hashlib_md5(filename):
-    '''
-    Create an md5 checksum. This should use the ififuncs function instead.
-    '''
-    read_size = 0
-    last_percent_done = 0
-    md5_object = hashlib.md5()
-    total_size = os.path.getsize(filename)
-    with open(str(filename), 'rb') as file_object:
-        while True:
-            buf = file_object.read(2**20)
-            if not buf:
-                break
-            read_size += len(buf)
-            md5_object.update(buf)
-            percent_done = 100 * read_size / total_size
-            if percent_done > last_percent_done:
-                sys.stdout.write('[%d%%]\r' % percent_done)
-                sys.stdout.flush()
-                last_percent_done = percent_done
-    md5_output = md5_object.hexdigest()
-    return md5_output + '  ' + os.path.abspath(filename) +  '\n'
-
-
 def test_write_capabilities(directory, log_name_source):
     '''
     Checks if drives have write access.
@@ -74,110 +52,189 @@ def remove_bad_files(root_dir, log_name_source):
     '''
     Stolen and adapted from Ben Fino-Radin. Removes annoying files.
     '''
-    rm_these = ['.DS_Store', 'Thumbs.db', 'desktop.ini', 'Desktop.ini']
-    for root, _, files in os.walk(root_dir):
-        for name in files:
-            path = os.path.join(root, name)
-            for i in rm_these:
-                if name == i:
-                    print(('***********************' + 'removing: ' + path))
-                    if not log_name_source == None:
-                        generate_log(
-                            log_name_source,
-                            'EVENT = Unwanted file removal - %s was removed' % path
-                        )
-                    try:
-                        os.remove(path)
-                    except OSError:
-                        print('can\'t delete as source is read-only')
+    ififuncs.TreeScan(root_dir).remove_bad_files(log_name_source)
 
 
 def make_manifest(
         manifest_dir,
-        manifest_textfile, path_to_remove
+        manifest_textfile, path_to_remove, jobs=1, scan=None,
+        hash_function=ififuncs.hashlib_md5, label='MD5'
     ):
     '''
     Generates a checksum text manifest.
+    jobs sets the number of files that are hashed at the same time.
+    scan is an optional ififuncs.TreeScan of manifest_dir that will be
+    reused instead of walking the directory again.
+    hash_function returns the md5 checksum of a filepath.
+    label describes the checksums in the progress messages.
     '''
-    checksum_list = []
-    manifest_generator = ''
-    source_counter = 0
-    print('Counting the amount of files to be processed.')
-    for root, directories, filenames in os.walk(manifest_dir):
-        directories[:] = [
-            d for d in directories if d[0] != '.'
-        ]
-        directories[:] = [
-            d for d in directories if d != 'System Volume Information'
-        ]
-        directories[:] = [
-                d for d in directories if d != '$RECYCLE.BIN'
-        ]
-        directories[:] = [
-                d for d in directories if d != 'Seagate'
-        ]
-        filenames = [
-            f for f in filenames if os.path.basename(root) != 'System Volume Information'
-        ]
-        filenames = [
-            f for f in filenames if f[0] != '.'
-        ]
-        for files in filenames:
-            source_counter += 1
-    counter2 = 1
+    if scan is None:
+        scan = ififuncs.TreeScan(manifest_dir)
     if os.path.isdir(manifest_dir):
         os.chdir(manifest_dir)
-        for root, directories, filenames in os.walk(manifest_dir):
-            directories[:] = [
-                d for d in directories if d[0] != '.'
-            ]
-            directories[:] = [
-                d for d in directories if d != 'System Volume Information'
-            ]
-            directories[:] = [
-                d for d in directories if d != '$RECYCLE.BIN'
-            ]
-            directories[:] = [
-                d for d in directories if d != 'Seagate'
-            ]
-            filenames = [
-                f for f in filenames if os.path.basename(root) != 'System Volume Information'
-            ]
-            filenames = [
-                f for f in filenames if f[0] != '.'
-            ]
-            for files in filenames:
-                checksum_list.append([root, files])
-    elif os.path.isfile(manifest_dir):
-        checksum_list = [[os.path.dirname(manifest_dir), os.path.basename(manifest_dir)]]
-    if len(checksum_list) == 1:
-        source_counter = 1
+    # each checksum goes straight into the spool as it is hashed, so no
+    # list of paths or dictionary of checksums is built
+    spool = ififuncs.ManifestSpool()
+    filepaths = (os.path.join(files[0], files[1]) for files in scan.iter_files())
+    for filepath, md5 in ififuncs.iter_hashed_files(filepaths, hash_function, jobs, label, scan.file_count()):
+        spool_checksum(spool, os.path.dirname(filepath), os.path.basename(filepath), md5, path_to_remove)
+    return spool.write(manifest_textfile, normalise=False)
+
+
+def spool_checksum(spool, root, filename, md5, path_to_remove):
+    '''
+    Adds the checksum of root/filename to a ManifestSpool with a path
+    relative to path_to_remove.
+    '''
+    root2 = root.replace(path_to_remove, '')
+    try:
+        if root2[0] == '/':
+            root2 = root2[1:]
+        if root2[0] == '\\':
+            root2 = root2[1:]
+    except: IndexError
+    spool.add(md5[:32], os.path.join(
+        root2, filename
+        ).replace("\\", "/"))
+
+
+def write_manifest(checksum_list, checksums, manifest_textfile, path_to_remove):
+    '''
+    Writes a checksum text manifest from a list of [root, filename] pairs
+    and a dictionary of filepath: md5 checksum.
+    '''
+    spool = ififuncs.ManifestSpool()
     for files in checksum_list:
-        print(('Generating MD5 for %s - %d of %d' % (
-            os.path.join(files[0], files[1]), counter2, source_counter)
-            ))
-        md5 = hashlib_md5(os.path.join(files[0], files[1]))
-        root2 = files[0].replace(path_to_remove, '')
-        try:
-            if root2[0] == '/':
-                root2 = root2[1:]
-            if root2[0] == '\\':
-                root2 = root2[1:]
-        except: IndexError
-        manifest_generator += md5[:32] + '  ' + os.path.join(
-            root2, files[1]
-            ).replace("\\", "/") + '\n'
-        counter2 += 1
-    manifest_list = manifest_generator.splitlines()
-    files_in_manifest = len(manifest_list)
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[34:]))
-    with open(manifest_textfile, "w", encoding='utf-8') as text:
-        for i in manifest_list:
-            text.write(i + '\n')
+        spool_checksum(
+            spool, files[0], files[1],
+            checksums[os.path.join(files[0], files[1])], path_to_remove
+        )
+    files_in_manifest = spool.write(manifest_textfile, normalise=False)
     return files_in_manifest
 
 
+class TransferJournal(object):
+    '''
+    A journal of the files that have been copied to one destination by the
+    -tee copy engine, with the md5 of each source file and the size and
+    mtime of the source and destination at the time, and of the destination
+    files that have been hashed for the destination manifest.
+    Files are only journaled once they have been flushed to disk, so if a
+    transfer is interrupted, copyit.py -resume only copies files that are
+    not in the journal and reuses the journaled checksums instead of
+    rereading files that have not changed since.
+    '''
+    def __init__(self, journal_path, resume=False):
+        self.journal_path = journal_path
+        self.copied = {}
+        self.verified = {}
+        self.reused_copies = 0
+        self.reused_checksums = 0
+        self.lock = threading.Lock()
+        if resume and os.path.isfile(journal_path):
+            with open(journal_path, 'r', encoding='utf-8') as fo:
+                for line in fo:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line is cut short if the transfer was killed
+                        continue
+                    if entry['event'] == 'copied':
+                        self.copied[entry['destination']] = entry
+                    else:
+                        self.verified[entry['destination']] = entry
+            self.fo = open(journal_path, 'a', encoding='utf-8')
+        else:
+            self.fo = open(journal_path, 'w', encoding='utf-8')
+
+    def write(self, entry):
+        with self.lock:
+            self.fo.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.fo.flush()
+
+    def lookup_copied(self, source_file, destination_file):
+        '''
+        Returns the md5 of source_file if it was copied to destination_file
+        and neither file has changed since.
+        '''
+        destination_file = os.path.abspath(destination_file)
+        entry = self.copied.get(destination_file)
+        if entry is None or entry['source'] != source_file:
+            return None
+        try:
+            source_stat = os.stat(source_file)
+            destination_stat = os.lstat(destination_file)
+        except OSError:
+            return None
+        if (entry['size'], entry['mtime_ns']) != (source_stat.st_size, source_stat.st_mtime_ns):
+            return None
+        if (entry['destination_size'], entry['destination_mtime_ns']) != (destination_stat.st_size, destination_stat.st_mtime_ns):
+            return None
+        with self.lock:
+            self.reused_copies += 1
+        return entry['md5']
+
+    def record_copied(self, source_file, destination_file, md5):
+        source_stat = os.stat(source_file)
+        destination_stat = os.stat(destination_file)
+        self.write({
+            'event': 'copied',
+            'source': source_file,
+            'destination': os.path.abspath(destination_file),
+            'md5': md5,
+            'size': source_stat.st_size,
+            'mtime_ns': source_stat.st_mtime_ns,
+            'destination_size': destination_stat.st_size,
+            'destination_mtime_ns': destination_stat.st_mtime_ns
+        })
+
+    def hashlib_md5(self, destination_file, progress=True):
+        '''
+        Returns the md5 of destination_file for the destination manifest.
+        The journaled checksum is reused if the file has already been hashed
+        and has not changed since, otherwise the file is hashed and the
+        checksum is journaled.
+        '''
+        destination_file = os.path.abspath(destination_file)
+        entry = self.verified.get(destination_file)
+        if entry is not None:
+            destination_stat = os.stat(destination_file)
+            if (entry['destination_size'], entry['destination_mtime_ns']) == (destination_stat.st_size, destination_stat.st_mtime_ns):
+                with self.lock:
+                    self.reused_checksums += 1
+                return entry['md5']
+        destination_stat = os.stat(destination_file)
+        md5 = ififuncs.hashlib_md5(destination_file, progress)
+        self.write({
+            'event': 'verified',
+            'destination': destination_file,
+            'md5': md5,
+            'destination_size': destination_stat.st_size,
+            'destination_mtime_ns': destination_stat.st_mtime_ns
+        })
+        return md5
+
+    def remove(self):
+        '''
+        Deletes the journal once the transfer has been verified.
+        '''
+        self.fo.close()
+        os.remove(self.journal_path)
+
+
+def get_journal_path(destination_final_path, desktop_logs_dir):
+    '''
+    Returns a transfer journal path in the desktop logs folder that is always
+    the same for the same destination, so that copyit.py -resume can find it.
+    '''
+    destination_final_path = os.path.abspath(destination_final_path)
+    path_hash = hashlib.md5(destination_final_path.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(
+        desktop_logs_dir,
+        '%s_%s_transfer_journal.jsonl' % (os.path.basename(destination_final_path), path_hash)
+    )
+
+
 def copy_dir(
         source, destination_final_path,
         log_name_source, rootpos, destination, dirname, args
@@ -255,60 +312,363 @@ def copy_dir(
                 'EVENT = File Transfer, status=completed'
             )
 
-def diff_report(file1, file2, log_name_source):
+def tee_copy_dir(source, destination_final_path, log_name_source, scan, jobs=1):
     '''
-    Analyzes checksum manifests in order to find mismatches.
+    Copies source to destination_final_path with ififuncs.tee_copy, which
+    hashes each source file while it is being written, so the source only
+    has to be read once. Existing destination files are not overwritten,
+    like cp -n. scan is an ififuncs.TreeScan of source.
+    Every directory is created before any files are copied, and jobs files
+    are copied at the same time, which keeps many small files such as DPX
+    sequences in flight on network storage.
+    Returns a dictionary of source filepath: md5 checksum.
     '''
-    print('Comparing manifests to verify file transfer')
-    try:
-        with open(file1, 'r') as file1_manifest:
-            sourcelist = file1_manifest.readlines()
-    except UnicodeDecodeError:
-        with open(file1, 'r', encoding='cp1252') as file1_manifest:
-            sourcelist = file1_manifest.readlines()
-    try:
-        with open(file2, 'r') as file2_manifest:
-            destlist = file2_manifest.readlines()
-    except UnicodeDecodeError:
-        with open(file2, 'r') as file2_manifest:
-            destlist = file2_manifest.readlines()
-    for i in sourcelist:
-        if i not in destlist:
-            print(('%s was expected, but a different value was found in destination manifest' % i.rstrip()))
+    return fan_out_copy_dir(
+        source, [destination_final_path], [log_name_source], scan, jobs
+    )
+
+
+def fan_out_copy_dir(source, destination_final_paths, log_names, scan, jobs=1, journals=None, resume=False):
+    '''
+    Like tee_copy_dir, but each source block is read and hashed once and
+    then written to every path in destination_final_paths in parallel.
+    log_names holds the log of each destination.
+    journals is an optional list of the TransferJournal of each destination.
+    Every file that is copied is journaled. If resume is True, files that
+    are in the journal and have not changed are not copied again, and any
+    other existing destination file is assumed to be left over from an
+    interrupted transfer, so it is truncated and copied again.
+    '''
+    if journals is None:
+        journals = [None] * len(destination_final_paths)
+    generate_log(
+        log_names, 'EVENT = File Transfer, status=started, agentName=copyit.py, module=ififuncs.tee_copy'
+    )
+    def copy_file(path, progress=False):
+        destination_files = []
+        destination_journals = []
+        md5 = None
+        for destination_final_path, journal in zip(destination_final_paths, journals):
+            destination_file = get_destination_path(path, source, destination_final_path)
+            if os.path.islink(path):
+                if not os.path.lexists(destination_file):
+                    os.symlink(os.readlink(path), destination_file)
+                continue
+            if resume and journal is not None:
+                journaled_md5 = journal.lookup_copied(path, destination_file)
+                if journaled_md5 is not None:
+                    md5 = journaled_md5
+                    continue
+                if os.path.islink(destination_file):
+                    os.remove(destination_file)
+            elif os.path.lexists(destination_file):
+                continue
+            destination_files.append(destination_file)
+            destination_journals.append(journal)
+        if not destination_files:
+            if md5 is None:
+                md5 = ififuncs.hashlib_md5(path, progress=False)
+            return md5
+        md5 = ififuncs.tee_copy(path, destination_files)['md5']
+        for destination_file, journal in zip(destination_files, destination_journals):
+            if journal is not None:
+                journal.record_copied(path, destination_file, md5)
+        return md5
+    make_destination_directories(source, destination_final_paths, scan)
+    filepaths = [os.path.join(entry[0], entry[1]) for entry in scan.entries]
+    file_count = len(filepaths)
+    checksums = {}
+    last_print = 0
+    for counter, (filepath, md5) in enumerate(ififuncs.iter_hashes(filepaths, copy_file, jobs), 1):
+        checksums[filepath] = md5
+        # printing a line per file slows down copies of image sequences
+        if time.time() - last_print > 0.5 or counter == file_count:
+            print((' - Copied %d of %d files - %s' % (counter, file_count, filepath)))
+            last_print = time.time()
+    copy_directory_metadata(source, destination_final_paths, scan)
+    generate_log(
+        log_names,
+        'EVENT = File Transfer, status=completed'
+    )
+    return checksums
+
+
+def zero_copy_dir(source, destination_final_path, log_name_source, scan, jobs=1):
+    '''
+    Copies source to destination_final_path with ififuncs.zero_copy, which
+    uses reflinks or copy_file_range where the storage supports them, so
+    that the data is copied by the kernel or the file server instead of
+    passing through python. Existing destination files are not overwritten,
+    like cp -n. jobs files are copied at the same time.
+    The source manifest is generated before the copy and the destination
+    manifest is generated by rereading the destination, so verification
+    is the same as for the other copy engines.
+    '''
+    generate_log(
+        log_name_source, 'EVENT = File Transfer, status=started, agentName=copyit.py, module=ififuncs.zero_copy'
+    )
+    def copy_file(path, progress=False):
+        destination_file = get_destination_path(path, source, destination_final_path)
+        if os.path.lexists(destination_file):
+            return 'skipped'
+        if os.path.islink(path):
+            os.symlink(os.readlink(path), destination_file)
+            return 'symlink'
+        return ififuncs.zero_copy(path, destination_file)
+    make_destination_directories(source, [destination_final_path], scan)
+    filepaths = [os.path.join(entry[0], entry[1]) for entry in scan.entries]
+    file_count = len(filepaths)
+    methods = {}
+    last_print = 0
+    for counter, (filepath, method) in enumerate(ififuncs.iter_hashes(filepaths, copy_file, jobs), 1):
+        methods[method] = methods.get(method, 0) + 1
+        if time.time() - last_print > 0.5 or counter == file_count:
+            print((' - Copied %d of %d files - %s' % (counter, file_count, filepath)))
+            last_print = time.time()
+    copy_directory_metadata(source, [destination_final_path], scan)
+    generate_log(
+        log_name_source,
+        'EVENT = File Transfer, status=completed, eventDetail=%s' % ', '.join(
+            '%s files: %d' % (method, methods[method]) for method in sorted(methods)
+        )
+    )
+
+
+def move_dir(source, destination_final_path, log_name_source, scan, jobs=1):
+    '''
+    Moves source to a destination_final_path on another filesystem.
+    Each file is copied with ififuncs.tee_copy, which hashes the source
+    while it is written, then the destination file is reread and the
+    source file is only removed once the two checksums match. Files are
+    moved one after the other like this, or jobs at a time, so the source
+    never has to be read twice and a failed file keeps its source.
+    Empty source directories are removed at the end, along with any
+    .DS_Store, Thumbs.db or desktop.ini files that appeared during the move.
+    If anything is left in the source, the move is logged as incomplete.
+    Returns a dictionary of source filepath: md5 checksum and a dictionary
+    of destination filepath: md5 checksum.
+    '''
+    generate_log(
+        log_name_source, 'EVENT = File Transfer, status=started, agentName=copyit.py, module=ififuncs.tee_copy, eventDetail=verified move - each source file is removed once its copy has been verified'
+    )
+    def move_file(path, progress=False):
+        destination_file = get_destination_path(path, source, destination_final_path)
+        if os.path.islink(path):
+            if not os.path.lexists(destination_file):
+                os.symlink(os.readlink(path), destination_file)
+            os.remove(path)
+            return None, None
+        if os.path.lexists(destination_file):
+            source_md5 = ififuncs.hashlib_md5(path, progress=False)
+        else:
+            source_md5 = ififuncs.tee_copy(path, destination_file)['md5']
+        destination_md5 = ififuncs.hashlib_md5(destination_file, progress=False)
+        if source_md5 == destination_md5:
+            os.remove(path)
+        return source_md5, destination_md5
+    make_destination_directories(source, [destination_final_path], scan)
+    # removing files changes the timestamps of the source directories
+    directory_stats = []
+    if os.path.isdir(source):
+        directory_stats = [(directory, os.stat(directory)) for directory in reversed([source] + scan.directories)]
+    filepaths = [os.path.join(entry[0], entry[1]) for entry in scan.entries]
+    file_count = len(filepaths)
+    source_checksums = {}
+    destination_checksums = {}
+    moved_count = 0
+    last_print = 0
+    for counter, (filepath, (source_md5, destination_md5)) in enumerate(ififuncs.iter_hashes(filepaths, move_file, jobs), 1):
+        if source_md5 is not None:
+            source_checksums[filepath] = source_md5
+            destination_checksums[os.path.abspath(get_destination_path(filepath, source, destination_final_path))] = destination_md5
+        if source_md5 == destination_md5:
+            moved_count += 1
+        else:
+            print(('***********%s did not verify, so the source file has been kept*************' % filepath))
             generate_log(
                 log_name_source,
-                'ERROR = %s was expected, but a different value was found in destination manifest' % i.rstrip())
-    print(' - End of Diff report\n')
+                'ERROR = %s did not verify after it was copied, so the source file was not removed' % filepath
+            )
+        if time.time() - last_print > 0.5 or counter == file_count:
+            print((' - Moved %d of %d files - %s' % (counter, file_count, filepath)))
+            last_print = time.time()
+    for directory, stat_result in directory_stats:
+        ififuncs.copy_metadata(get_destination_path(directory, source, destination_final_path), stat_result)
+    for directory_link in scan.directory_links:
+        os.remove(directory_link)
+    if directory_stats:
+        # the Finder or Explorer may have written these while files were moved
+        ififuncs.TreeScan(source).remove_bad_files(log_name_source)
+    for directory, _ in directory_stats:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            generate_log(
+                log_name_source,
+                'EVENT = Source directory removal - %s was not removed as it is not empty' % directory
+            )
+    remaining_count = 0
+    if os.path.lexists(source):
+        remaining_count = ififuncs.TreeScan(source).total_count()
+    if moved_count == file_count and remaining_count == 0:
+        generate_log(
+            log_name_source,
+            'EVENT = File Transfer, status=completed, eventDetail=%d of %d files were verified and removed from the source' % (moved_count, file_count)
+        )
+    else:
+        print(('***********The move is incomplete - %d files are still in %s*************' % (remaining_count, source)))
+        generate_log(
+            log_name_source,
+            'EVENT = File Transfer, status=incomplete, eventDetail=%d of %d files were verified and removed from the source, %d files are still in %s' % (moved_count, file_count, remaining_count, source)
+        )
+    return source_checksums, destination_checksums
 
 
-def check_extra_files(file1, file2, log_name_source):
+def reuse_checksums(checksums):
     '''
-    Are there any extra files in the destination directory?
+    Returns a hash function for make_manifest that looks files up in a
+    dictionary of absolute filepath: md5 checksum, so that files whose
+    checksums are already known are not read again. Any other file is
+    hashed as normal.
+    '''
+    def hash_function(filepath, progress=True):
+        md5 = checksums.get(os.path.abspath(filepath))
+        if md5 is None:
+            md5 = ififuncs.hashlib_md5(filepath, progress)
+        return md5
+    return hash_function
+
+
+def get_destination_path(path, source, destination_final_path):
+    '''
+    Returns the path that a file or directory inside source is copied to.
+    '''
+    if path == source:
+        return destination_final_path
+    return os.path.join(destination_final_path, os.path.relpath(path, source))
+
+
+def make_destination_directories(source, destination_final_paths, scan):
+    '''
+    Creates every directory and directory symlink of source in each of
+    destination_final_paths before any files are copied.
+    scan is an ififuncs.TreeScan of source.
+    '''
+    for destination_final_path in destination_final_paths:
+        if os.path.isdir(source):
+            if not os.path.isdir(destination_final_path):
+                os.makedirs(destination_final_path)
+        for directory in scan.directories:
+            if not os.path.isdir(get_destination_path(directory, source, destination_final_path)):
+                os.makedirs(get_destination_path(directory, source, destination_final_path))
+        for directory_link in scan.directory_links:
+            if not os.path.lexists(get_destination_path(directory_link, source, destination_final_path)):
+                os.symlink(os.readlink(directory_link), get_destination_path(directory_link, source, destination_final_path))
+
+
+def copy_directory_metadata(source, destination_final_paths, scan):
+    '''
+    Copies the mode and timestamps of every directory of source.
+    Directory timestamps change while files are added, so this is done
+    after all files have been copied.
+    '''
+    if os.path.isdir(source):
+        for directory in reversed([source] + scan.directories):
+            stat_result = os.stat(directory)
+            for destination_final_path in destination_final_paths:
+                ififuncs.copy_metadata(get_destination_path(directory, source, destination_final_path), stat_result)
+
+
+def read_manifest(manifest):
+    '''
+    Returns the lines of a checksum manifest, which may be utf-8 or cp1252.
     '''
     try:
-        with open(file1, 'r') as file1_manifest:
-            sourcelist = file1_manifest.readlines()
-    except UnicodeDecodeError:
-        with open(file1, 'r', encoding='cp1251') as file1_manifest:
-            sourcelist = file1_manifest.readlines()
-    try:
-        with open(file2, 'r') as file2_manifest:
-            destlist = file2_manifest.readlines()
+        with open(manifest, 'r', encoding='utf-8') as fo:
+            return fo.readlines()
     except UnicodeDecodeError:
-        with open(file2, 'r') as file2_manifest:
-            destlist = file2_manifest.readlines()
-    destlist_files = []
-    sourcelist_files = []
-    for dest_files in destlist:
-        destlist_files.append(dest_files[32:])
-    for source_files in sourcelist:
-        sourcelist_files.append(source_files[32:])
-    for i in destlist_files:
-        if i not in sourcelist_files:
-            print(('%s is in your destination manifest but is not in the source manifest' % i.rstrip()))
-            generate_log(
-                log_name_source,
-                'ERROR = %s is in your destination manifest but is not in the source manifest' % i.rstrip())
+        with open(manifest, 'r', encoding='cp1252') as fo:
+            return fo.readlines()
+
+
+def manifest_path(line, normalise=False):
+    '''
+    Returns the relative path of a checksum manifest line. If normalise is
+    True, the NFD unicode normalisation of the path is returned, so that
+    paths that only differ in how accented characters are encoded match.
+    '''
+    path = line[34:].rstrip('\r\n')
+    if normalise:
+        path = unicodedata.normalize('NFD', path)
+    return path
+
+
+def compare_manifests(source_lines, destination_lines, normalise=False):
+    '''
+    Classifies the lines of a source and a destination manifest in a single
+    pass over each, using a dictionary keyed by path.
+    Returns three lists of manifest lines:
+    source lines with a different checksum in the destination manifest,
+    source lines that are missing from the destination manifest,
+    and destination lines that are not in the source manifest.
+    '''
+    destination_index = {}
+    for line in destination_lines:
+        destination_index[manifest_path(line, normalise)] = line
+    mismatches = []
+    missing = []
+    source_paths = set()
+    for line in source_lines:
+        path = manifest_path(line, normalise)
+        source_paths.add(path)
+        destination_line = destination_index.get(path)
+        if destination_line is None:
+            missing.append(line)
+        elif destination_line[:32].lower() != line[:32].lower():
+            mismatches.append(line)
+    extras = [
+        line for line in destination_lines
+        if manifest_path(line, normalise) not in source_paths
+    ]
+    return mismatches, missing, extras
+
+
+def diff_report(file1, file2, log_name_source, comparison=None):
+    '''
+    Analyzes checksum manifests in order to find mismatches.
+    comparison is an optional result of compare_manifests for the two
+    manifests, so that they are only compared once.
+    '''
+    print('Comparing manifests to verify file transfer')
+    if comparison is None:
+        comparison = compare_manifests(read_manifest(file1), read_manifest(file2))
+    mismatches, missing, _ = comparison
+    for i in mismatches:
+        print(('%s was expected, but a different value was found in destination manifest' % i.rstrip()))
+        generate_log(
+            log_name_source,
+            'ERROR = %s was expected, but a different value was found in destination manifest' % i.rstrip())
+    for i in missing:
+        print(('%s was expected, but it is missing from the destination manifest' % i.rstrip()))
+        generate_log(
+            log_name_source,
+            'ERROR = %s was expected, but it is missing from the destination manifest' % i.rstrip())
+    print(' - End of Diff report\n')
+
+
+def check_extra_files(file1, file2, log_name_source, comparison=None):
+    '''
+    Are there any extra files in the destination directory?
+    comparison is an optional result of compare_manifests for the two
+    manifests, so that they are only compared once.
+    '''
+    if comparison is None:
+        comparison = compare_manifests(read_manifest(file1), read_manifest(file2))
+    for i in comparison[2]:
+        print(('%s is in your destination manifest but is not in the source manifest' % manifest_path(i)))
+        generate_log(
+            log_name_source,
+            'ERROR = %s is in your destination manifest but is not in the source manifest' % manifest_path(i))
     print(' - End of extra file report - if source and destination manifests appear visually identical, perhaps one manifest is utf-8 and the other is cp1252')
 
 
@@ -367,7 +727,9 @@ def check_for_sip(args):
     This checks if the input folder contains the actual payload, eg:
     the UUID folder(containing logs/metadata/objects) and the manifest sidecar.
     '''
-    remove_bad_files(args, None)
+    for filenames in os.listdir(args):
+        if filenames in ififuncs.TreeScan.bad_files:
+            remove_bad_files(os.path.join(args, filenames), None)
     for filenames in os.listdir(args):
         # make sure that it's an IFI SIP.
         if 'manifest.md5' in filenames:
@@ -377,12 +739,9 @@ def check_for_sip(args):
                     return os.path.join(args, dircheck)
 
 
-def setup(args_):
+def parse_args(args_):
     '''
-    Sets a bunch of filename variables and parses command line.
-    some examples:
-    if manifest_sidecar = /home/kieranjol/fakeeeeee/fakeeeeee_manifest.md5
-    then manifes_root = /home/kieranjol/fakeeeeee_manifest.md5
+    Parses command line arguments.
     '''
     parser = argparse.ArgumentParser(
         description='Copy directory with checksum comparison'
@@ -391,8 +750,8 @@ def setup(args_):
         'source', help='Input directory'
     )
     parser.add_argument(
-        'destination',
-        help='Destination directory'
+        'destination', nargs='+',
+        help='Destination directory. Enter several destinations to read the source once and copy it to all of them at the same time, with a log for each destination.'
     )
     parser.add_argument(
         '-l', '-lto',
@@ -402,7 +761,7 @@ def setup(args_):
     parser.add_argument(
         '-move',
         action='store_true',
-        help='Move files instead of copying - much faster!'
+        help='Move files instead of copying - much faster! Within one filesystem the source is renamed and the data is not read again. Across filesystems each file is copied, verified against the source checksum, and only then removed from the source.'
     )
     parser.add_argument(
         '-justcopy',
@@ -414,19 +773,91 @@ def setup(args_):
         action='store_true',
         help='Answers YES to the question: Not enough free space, would you like to continue?'
     )
+    parser.add_argument(
+        '-batch',
+        action='store_true',
+        help='Never ask a question, eg. when masscopy.py or multicopy.py run several copies at the same time. If a destination manifest or directory already exists, it is not overwritten and the copy exits. If there is not enough free space, the copy exits unless -y is used.'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int, default=1,
+        help='Number of files to hash at the same time when generating manifests. Default is 1.'
+    )
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Reuse checksums from a persistent cache for files whose device, inode, size and modification time have not changed. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. Setting the IFISCRIPTS_CHECKSUM_CACHE environment variable has the same effect.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-tee',
+        action='store_true',
+        help='Copy with python instead of cp/rsync/robocopy, hashing each source file while it is being copied. The source is only read once, and the destination is reread once for verification.'
+    )
+    parser.add_argument(
+        '-copy_jobs', type=int, metavar='N',
+        help='Number of files to copy at the same time with the -tee copy engine, eg 16 for image sequences on a NAS. Implies -tee. The default is the value of -j.'
+    )
+    parser.add_argument(
+        '-resume',
+        action='store_true',
+        help='Resume an interrupted -tee transfer. Files that the transfer journal lists as copied are not copied again and their journaled checksums are reused, while any other existing destination files are assumed to be incomplete and are copied again. Implies -tee.'
+    )
+    parser.add_argument(
+        '-zero_copy',
+        action='store_true',
+        help='Copy with reflinks on copy-on-write filesystems such as Btrfs and XFS, or with copy_file_range so that the kernel or an NFS 4.2 server copies the data, and fall back to a normal copy otherwise. The destination is still reread for verification. Use -copy_jobs to copy several files at the same time.'
+    )
+    parser.add_argument(
+        '-max_read_mbps', '--max-read-mbps',
+        type=ififuncs.parse_mbps, metavar='MBPS',
+        help='Limit file reads to this many megabytes per second, eg 50, so that a long running job does not starve other users of shared storage. The default is unlimited.'
+    )
+    parser.add_argument(
+        '-max_write_mbps', '--max-write-mbps',
+        type=ififuncs.parse_mbps, metavar='MBPS',
+        help='Limit file writes to this many megabytes per second, eg 50. Limits imply -tee unless -zero_copy is used, as cp, rsync and robocopy can not be throttled. The default is unlimited.'
+    )
+    parser.add_argument(
+        '-physical_order',
+        action='store_true',
+        help='Read files in the order of their location on the storage instead of in directory order, using LTFS start blocks, FIEMAP extents or inode numbers. This avoids seeking on LTO tapes and fragmented hard drives. Manifests are still written in path order. Implies -tee unless -zero_copy is used.'
+    )
+    parser.add_argument(
+        '-ionice', choices=['idle', 'best-effort'],
+        help='Set the IO scheduling class of the process with ionice on Linux. idle only uses the disk when nobody else is, best-effort is the normal class.'
+    )
+    parsed_args = parser.parse_args(args_)
+    if parsed_args.zero_copy and (parsed_args.tee or parsed_args.resume):
+        parser.error('-zero_copy can not be used with -tee or -resume')
+    return parsed_args
+
+
+def setup(args_, destination_index=0, source_scan=None):
+    '''
+    Sets a bunch of filename variables and parses command line.
+    destination_index picks one of several destinations. source_scan can be
+    passed in so that the source is only walked once for all destinations.
+    some examples:
+    if manifest_sidecar = /home/kieranjol/fakeeeeee/fakeeeeee_manifest.md5
+    then manifes_root = /home/kieranjol/fakeeeeee_manifest.md5
+    '''
     rootpos = ''
     dircheck = None
-    args = parser.parse_args(args_)
+    args = parse_args(args_)
+    destination_dir = args.destination[destination_index]
     if os.path.isdir(args.source):
         dircheck = check_for_sip(args.source)
     if dircheck != None:
         if os.path.isdir(dircheck):
-            source = check_for_sip(args.source)
-            destination = os.path.join(args.destination, os.path.basename(args.source))
+            source = dircheck
+            destination = os.path.join(destination_dir, os.path.basename(args.source))
             os.makedirs(destination)
     else:
         source = os.path.abspath(args.source)
-        destination = args.destination
+        destination = destination_dir
     normpath = os.path.normpath(source)
     #is there any benefit to this over os.path.basename
     dirname = os.path.split(os.path.basename(source))[1]
@@ -460,6 +891,8 @@ def setup(args_):
     )
     manifest_root = source + '/%s_manifest.md5' % os.path.basename(source)
     log_name_filename = dirname + time.strftime("_%Y_%m_%dT%H_%M_%S")
+    if len(args.destination) > 1:
+        log_name_filename += '_destination%d' % (destination_index + 1)
     desktop_logs_dir = make_desktop_logs_dir()
     log_name_source = "%s/%s.log" % (desktop_logs_dir, log_name_filename)
     generate_log(log_name_source, 'copyit.py started.')
@@ -468,14 +901,21 @@ def setup(args_):
         'eventDetail=copyit.py %s' % ififuncs.get_script_version('copyit.py'))
     generate_log(log_name_source, 'Source: %s' % source)
     generate_log(log_name_source, 'Destination: %s'  % destination)
+    ififuncs.setup_checksum_cache(args.cache, args.no_cache, log_name_source)
+    ififuncs.setup_bandwidth_limits(args.max_read_mbps, args.max_write_mbps, args.ionice, log_name_source)
+    ififuncs.setup_physical_read_order(args.physical_order, log_name_source)
     print('Checking total size of input folder')
-    total_input_size = ififuncs.get_folder_size(os.path.abspath(args.source))
+    if source_scan is None:
+        source_scan = ififuncs.TreeScan(source)
+    total_input_size = source_scan.size()
     print('Checking if enough space in destination folder')
-    free_space = ififuncs.get_free_space(args.destination)
+    free_space = ififuncs.get_free_space(destination_dir)
     if total_input_size > free_space:
         print('You do not have enough free space!')
         if args.y:
             go_forth_blindly = 'Y'
+        elif args.batch:
+            go_forth_blindly = 'N'
         else:
             go_forth_blindly = ififuncs.ask_yes_no('Would you like to continue anyway? Press Y or N')
         if go_forth_blindly == 'Y':
@@ -483,14 +923,20 @@ def setup(args_):
         else:
             generate_log(log_name_source, 'You do not have enough free space! - Exiting')
             sys.exit()
-    return args, rootpos, manifest_sidecar, log_name_source, destination_final_path, manifest_root, manifest_destination, manifest, destination, dirname, desktop_manifest_dir
+    return args, rootpos, manifest_sidecar, log_name_source, destination_final_path, manifest_root, manifest_destination, manifest, destination, dirname, desktop_manifest_dir, source, source_scan
 
 def overwrite_check(
         destination, log_name_source,
-        destination_final_path, manifest_destination
+        destination_final_path, manifest_destination, resume=False,
+        batch=False
     ):
     '''
     Possibly redundant - this launches other overwrite functions.
+    If resume is True, the destination directory is expected to exist
+    already and any destination manifest will be regenerated, so the user
+    is not asked.
+    If batch is True, nothing is overwritten and the copy exits instead of
+    asking.
     '''
     try:
         test_write_capabilities(destination, log_name_source)
@@ -501,6 +947,23 @@ def overwrite_check(
             'EVENT = I/O Test - Failure - No write access to destination directory.'
         )
         sys.exit()
+    if resume:
+        if os.path.isfile(manifest_destination):
+            return 'Y', None
+        return None, None
+    if batch:
+        if os.path.isfile(manifest_destination):
+            existing = 'manifest %s' % manifest_destination
+        elif os.path.isdir(destination_final_path) and len(os.listdir(destination_final_path)) > 1:
+            existing = 'directory %s' % destination_final_path
+        else:
+            return None, None
+        print('The destination %s already exists and -batch does not overwrite it - exiting' % existing)
+        generate_log(
+            log_name_source,
+            'EVENT = Exiting as the destination %s already exists and -batch does not allow overwriting' % existing
+        )
+        sys.exit()
     overwrite_destination_manifest = check_overwrite(manifest_destination)
     overwrite_destination_dir = check_overwrite_dir(destination_final_path)
     return overwrite_destination_manifest, overwrite_destination_dir
@@ -535,11 +998,13 @@ def manifest_existence(
     if proceed == 'y':
         if source_count != count_in_manifest:
             print('checking which files are different')
+            manifest_file_set = set(manifest_files)
+            file_set = set(file_list)
             for i in file_list:
-                if i not in manifest_files:
+                if i not in manifest_file_set:
                     print((i, 'is present in your source directory but not in the source manifest'))
             for i in manifest_files:
-                if i not in file_list:
+                if i not in file_set:
                     print((i, 'is present in manifest but is missing in your source files'))
             print('This manifest may be outdated as the number of files in your directory does not match the number of files in the manifest')
             print(('There are', source_count, 'files in your source directory', count_in_manifest, 'in the manifest'))
@@ -551,26 +1016,44 @@ def manifest_existence(
 def make_destination_manifest(
         overwrite_destination_manifest, log_name_source,
         rootpos, destination_final_path,
-        manifest_destination, destination
+        manifest_destination, destination, jobs=1, scan=None,
+        hash_function=ififuncs.hashlib_md5, reuse_detail=None
     ):
     '''
     Um, write destination manifest
+    scan is an optional ififuncs.TreeScan of destination_final_path.
+    hash_function returns the md5 checksum of a filepath.
+    reuse_detail describes where the checksums come from if hash_function
+    reuses known checksums instead of reading the files, so that no message
+    digest calculation is logged.
     '''
+    if scan is None:
+        scan = ififuncs.TreeScan(destination_final_path)
     if overwrite_destination_manifest not in ('N', 'n'):
-        if overwrite_destination_manifest == None:
+        if overwrite_destination_manifest != None:
             generate_log(
-                log_name_source, 'EVENT = Generating destination manifest: status=started, eventType=message digest calculation, module=hashlib'
+                log_name_source,
+                'EVENT = Destination Manifest Overwrite - Destination manifest already exists - Overwriting.'
             )
-        else:
+        if reuse_detail is not None:
             generate_log(
                 log_name_source,
-                'EVENT = Destination Manifest Overwrite - Destination manifest already exists - Overwriting.'
+                'EVENT = Generating destination manifest - %s' % reuse_detail
             )
-        print('Generating destination manifest')
+            print('Generating destination manifest from reused checksums')
+            label = 'reused MD5'
+        else:
+            if overwrite_destination_manifest == None:
+                generate_log(
+                    log_name_source, 'EVENT = Generating destination manifest: status=started, eventType=message digest calculation, module=hashlib'
+                )
+            print('Generating destination manifest')
+            label = 'MD5'
         if rootpos == 'y':
             files_in_manifest = make_manifest(
                 destination_final_path,
-                manifest_destination, os.path.dirname(destination)
+                manifest_destination, os.path.dirname(destination), jobs, scan,
+                hash_function, label
             )
             generate_log(
                 log_name_source,
@@ -579,7 +1062,8 @@ def make_destination_manifest(
         else:
             files_in_manifest = make_manifest(
                 destination_final_path,
-                manifest_destination, destination
+                manifest_destination, destination, jobs, scan,
+                hash_function, label
             )
             generate_log(
                 log_name_source,
@@ -589,11 +1073,15 @@ def make_destination_manifest(
             log_name_source,
             'EVENT = File Transfer Overwrite - Destination directory already exists - Not Overwriting.'
         )
-    remove_bad_files(destination_final_path, log_name_source)
+    scan.remove_bad_files(log_name_source)
     return files_in_manifest
 
 
 def verify_copy(manifest, manifest_destination, log_name_source, overwrite_destination_manifest, files_in_manifest, destination_count, source_count):
+    '''
+    Compares the source and destination manifests.
+    Returns True if the transfer was a success.
+    '''
     unicode_mismatch = False
     try:
         with open(manifest, 'r', encoding='utf-8') as source_manifest_object:
@@ -615,40 +1103,56 @@ def verify_copy(manifest, manifest_destination, log_name_source, overwrite_desti
             log_name_source,
             'EVENT = File Transfer Judgement - Success, eventOutcome=pass'
         )
-    elif unicode_mismatch is True:
+        return True
+    comparison = None
+    if unicode_mismatch is True:
         print(' - Checking if there is a text encoding mismatch that is triggering a false negative')
         print(' - Using python to normalise the characters using unicodedata.normalize() purely for comparison')
-        source_manifest_casefolded = unicodedata.normalize('NFD', source_manifest_lines)
-        destination_manifest_casefolded = unicodedata.normalize('NFD', destination_manifest_lines)
         generate_log(
             log_name_source,
             ' Using python to normalise the characters using unicodedata.normalize() purely for comparison'
         )
-        if source_manifest_casefolded == destination_manifest_casefolded:
+        comparison = compare_manifests(
+            source_manifest_lines.splitlines(True),
+            destination_manifest_lines.splitlines(True),
+            normalise=True
+        )
+        if not any(comparison):
             generate_log(
                 log_name_source,
                 'EVENT = File Transfer Judgement - Success, eventOutcome=pass, eventDetail=source and destination manifests appear to have different encodings and are only identical when compared by eye or when normalized'
             )
             print(' - Source and destination manifests appear to have different encodings and are only identical when compared by eye or when normalized')
-    else:
-        print("***********YOUR CHECKSUMS DO NOT MATCH*************")
-        if overwrite_destination_manifest not in ('N', 'n'):
-            generate_log(
-                log_name_source,
-                'EVENT = File Transfer Outcome - Failure, eventOutcome=fail'
+            return True
+    print("***********YOUR CHECKSUMS DO NOT MATCH*************")
+    if overwrite_destination_manifest not in ('N', 'n'):
+        generate_log(
+            log_name_source,
+            'EVENT = File Transfer Outcome - Failure, eventOutcome=fail'
+        )
+        print((' There are: \n %s files in your destination manifest \n' % files_in_manifest))
+        print((' %s files in your destination \n %s files at source' % (
+            destination_count, source_count)
+        ))
+        if comparison is None:
+            comparison = compare_manifests(
+                source_manifest_lines.splitlines(True),
+                destination_manifest_lines.splitlines(True)
             )
-            print((' There are: \n %s files in your destination manifest \n' % files_in_manifest))
-            print((' %s files in your destination \n %s files at source' % (
-                destination_count, source_count)
-            ))
-            diff_report(manifest, manifest_destination, log_name_source)
-            check_extra_files(manifest, manifest_destination, log_name_source)
-            generate_log(log_name_source, 'EVENT = File Transfer Failure Explanation -  %s files in your destination,  %s files at source' % (destination_count, source_count))
-        else:
-            print((' %s files in your destination \n %s files at source' % (
-                destination_count, source_count)
-            ))
-def control_flow(manifest_sidecar, log_name_source, manifest, rootpos, args, source):
+        diff_report(manifest, manifest_destination, log_name_source, comparison)
+        check_extra_files(manifest, manifest_destination, log_name_source, comparison)
+        generate_log(log_name_source, 'EVENT = File Transfer Failure Explanation -  %s files in your destination,  %s files at source' % (destination_count, source_count))
+    else:
+        print((' %s files in your destination \n %s files at source' % (
+            destination_count, source_count)
+        ))
+    return False
+def control_flow(manifest_sidecar, log_name_source, manifest, rootpos, args, source, source_scan=None, tee=False):
+    '''
+    Generates a source manifest unless one exists already.
+    If tee is True, the source manifest will be written by tee_copy_dir
+    instead, so only the start of the event is logged here.
+    '''
     if os.path.isfile(manifest_sidecar):
         print('Manifest Sidecar exists - Source manifest Generation will be skipped.')
         generate_log(
@@ -660,16 +1164,20 @@ def control_flow(manifest_sidecar, log_name_source, manifest, rootpos, args, sou
         try:
             print('Generating source manifest')
             generate_log(log_name_source, 'EVENT = Generating source manifest: status=started, eventType=message digest calculation, module=hashlib')
-            if rootpos == 'y':
+            if tee:
+                pass
+            elif rootpos == 'y':
                 make_manifest(
-                    os.path.abspath(args.source), manifest, os.path.abspath(args.source)
+                    os.path.abspath(args.source), manifest, os.path.abspath(args.source),
+                    args.jobs, source_scan
                 )
             else:
                 make_manifest(
                     source, manifest,
-                    os.path.dirname(source)
+                    os.path.dirname(source), args.jobs, source_scan
                 )
-            generate_log(log_name_source, 'EVENT = Generating source manifest: status=completed')
+            if not tee:
+                generate_log(log_name_source, 'EVENT = Generating source manifest: status=completed')
         except OSError:
             print('You do not have access to this directory. Perhaps it is read only, perhaps some files or folders have illegal characters, or the wrong file system\n')
             sys.exit()
@@ -677,73 +1185,174 @@ def control_flow(manifest_sidecar, log_name_source, manifest, rootpos, args, sou
 def main(args_):
     '''
     Launches the functions that will safely copy and paste your files.
+    If several destinations are given, the source is read once and copied
+    to all of them, each destination is verified against the same source
+    manifest and gets its own log, and a list of log names is returned.
     '''
-    manifest_temp = '--' # add two characters so that I can slice for manifest_temp[1] later.
-    dircheck = None
-    args, rootpos, manifest_sidecar, log_name_source, destination_final_path, manifest_root, manifest_destination, manifest, destination, dirname, desktop_manifest_dir = setup(args_)
-    if os.path.isdir(args.source):
-        dircheck = check_for_sip(args.source)
-    if dircheck != None:
-        if os.path.isdir(dircheck):
-            source = check_for_sip(args.source)
+    destination_total = len(parse_args(args_).destination)
+    copies = []
+    source_scan = None
+    for destination_index in range(destination_total):
+        copies.append(setup(args_, destination_index, source_scan))
+        source_scan = copies[0][-1]
+    args, rootpos, manifest_sidecar, log_name_source, destination_final_path, manifest_root, manifest_destination, manifest, destination, dirname, desktop_manifest_dir, source, source_scan = copies[0]
+    log_names = [copy[3] for copy in copies]
+    if destination_total == 1:
+        source_log = log_name_source
     else:
-        source = os.path.abspath(args.source)
-        destination = args.destination
-    overwrite_destination_manifest, overwrite_destination_dir = overwrite_check(
-        destination, log_name_source,
-        destination_final_path, manifest_destination
-    )
-    remove_bad_files(
-        source, log_name_source
-    )
-    source_count, file_list = ififuncs.count_stuff(
-        source
-    )
+        # events that concern the source are written to every log
+        source_log = log_names
+        if args.move:
+            print('-move can only be used with a single destination')
+            generate_log(source_log, 'EVENT = Exiting as -move can only be used with a single destination')
+            sys.exit()
+    overwrites = []
+    for args, rootpos, manifest_sidecar, log_name_source, destination_final_path, manifest_root, manifest_destination, manifest, destination, dirname, desktop_manifest_dir, source, source_scan in copies:
+        overwrites.append(overwrite_check(
+            destination, log_name_source,
+            destination_final_path, manifest_destination, args.resume,
+            args.batch
+        ))
+    source_scan.remove_bad_files(source_log)
+    source_count, file_list = source_scan.count_stuff()
     manifest_existence(
         manifest_root, manifest_sidecar,
         manifest, source_count,
-        file_list, log_name_source
+        file_list, source_log
     )
+    throttled = args.max_read_mbps is not None or args.max_write_mbps is not None
+    if ((args.copy_jobs or throttled or args.physical_order) and not args.zero_copy) or args.resume:
+        args.tee = True
+    if not args.copy_jobs:
+        args.copy_jobs = args.jobs
+    targets = [
+        copy for copy, (_, overwrite_destination_dir) in zip(copies, overwrites)
+        if overwrite_destination_dir not in ('N', 'n')
+    ]
+    # several destinations can only be written at once by the tee engine
+    tee = (args.tee or destination_total > 1) and not args.move and not args.zero_copy and len(targets) > 0
+    rename = False
+    verified_move = False
+    if args.move and targets:
+        # a move within one filesystem doesn't touch the data, so the files
+        # only need to be read again if they are copied to another filesystem
+        if rootpos != 'y' and not os.path.lexists(destination_final_path) and ififuncs.get_device(source) == ififuncs.get_device(destination):
+            rename = True
+        else:
+            verified_move = True
+    journals = {}
+    if tee:
+        desktop_logs_dir = make_desktop_logs_dir()
+        for copy in targets:
+            journal_path = get_journal_path(copy[4], desktop_logs_dir)
+            if args.resume:
+                if os.path.isfile(journal_path):
+                    generate_log(copy[3], 'EVENT = File Transfer Resume - Resuming an interrupted transfer with the journal at %s' % journal_path)
+                else:
+                    generate_log(copy[3], 'EVENT = File Transfer Resume - No transfer journal was found at %s - all existing destination files will be copied again' % journal_path)
+            journals[copy[4]] = TransferJournal(journal_path, args.resume)
     manifest_sidecar, manifest, rootpos = control_flow(
-        manifest_sidecar, log_name_source, manifest, rootpos, args, source
+        manifest_sidecar, source_log, manifest, rootpos, args, source, source_scan, tee or verified_move
     )
-    if overwrite_destination_dir not in ('N', 'n'):
-        if overwrite_destination_dir != None:
+    for copy, (_, overwrite_destination_dir) in zip(copies, overwrites):
+        log_name_source = copy[3]
+        if overwrite_destination_dir not in ('N', 'n'):
+            if overwrite_destination_dir != None:
+                generate_log(
+                    log_name_source,
+                    'EVENT = File Transfer Overwrite - Destination directory already exists - Overwriting.'
+                )
+        else:
+            generate_log(
+                log_name_source,
+                'EVENT = File Transfer Overwrite - Destination directory already exists - Not Overwriting.'
+            )
+    destination_checksums = None
+    reuse_detail = None
+    if verified_move:
+        checksums, destination_checksums = move_dir(
+            source, destination_final_path, log_name_source, source_scan, args.copy_jobs
+        )
+        reuse_detail = 'the checksums of files that were verified during the move are reused instead of reading the files again'
+    elif tee:
+        checksums = fan_out_copy_dir(
+            source, [copy[4] for copy in targets], [copy[3] for copy in targets],
+            source_scan, args.copy_jobs, [journals[copy[4]] for copy in targets],
+            args.resume
+        )
+        if args.resume:
+            for copy in targets:
+                generate_log(
+                    copy[3],
+                    'EVENT = File Transfer Resume - %d files had already been copied and were not copied again' % journals[copy[4]].reused_copies
+                )
+    if tee or verified_move:
+        if not os.path.isfile(manifest):
+            if rootpos == 'y':
+                path_to_remove = os.path.abspath(args.source)
+            else:
+                path_to_remove = os.path.dirname(source)
+            write_manifest(source_scan.files(), checksums, manifest, path_to_remove)
+            generate_log(source_log, 'EVENT = Generating source manifest: status=completed')
+    elif targets:
+        if rename:
+            generate_log(
+                log_name_source,
+                'EVENT = File Transfer, status=started, agentName=copyit.py, module=os.rename, eventDetail=source and destination are on the same filesystem so the source is renamed'
+            )
+            os.rename(source, destination_final_path)
             generate_log(
                 log_name_source,
-                'EVENT = File Transfer Overwrite - Destination directory already exists - Overwriting.'
+                'EVENT = File Transfer, status=completed'
             )
-        if not args.move:
+            # the data has not changed, so the source checksums still apply
+            reuse_detail = 'the source was renamed, so the checksums in the source manifest are reused instead of reading the files again'
+            destination_checksums = {}
+            for line in read_manifest(manifest):
+                destination_checksums[os.path.abspath(os.path.join(destination, manifest_path(line)))] = line[:32]
+        elif args.zero_copy:
+            for copy in targets:
+                zero_copy_dir(source, copy[4], copy[3], source_scan, args.copy_jobs)
+        else:
             copy_dir(
                 source, destination_final_path,
                 log_name_source, rootpos, destination, dirname, args
             )
-        else:
-            shutil.move(source, destination_final_path)
-    else:
-        generate_log(
-            log_name_source,
-            'EVENT = File Transfer Overwrite - Destination directory already exists - Not Overwriting.'
-        )
     if args.justcopy:
+        for journal in journals.values():
+            journal.remove()
         generate_log(
-            log_name_source,
+            source_log,
             'EVENT = Exiting without destination manifest or verification due to the use of -justcopy'
         )
         print('Exiting without destination manifest or verification due to the use of -justcopy')
         sys.exit()
-    else:
+    source_manifest = manifest
+    for copy, (overwrite_destination_manifest, _) in zip(copies, overwrites):
+        log_name_source, destination_final_path, manifest_destination, destination = copy[3], copy[4], copy[6], copy[8]
+        manifest = source_manifest
+        manifest_temp = '--' # add two characters so that I can slice for manifest_temp[1] later.
+        destination_scan = ififuncs.TreeScan(destination_final_path)
+        journal = journals.get(destination_final_path)
+        if destination_checksums is not None:
+            hash_function = reuse_checksums(destination_checksums)
+        elif journal is None:
+            hash_function = ififuncs.hashlib_md5
+        else:
+            hash_function = journal.hashlib_md5
         files_in_manifest = make_destination_manifest(
             overwrite_destination_manifest, log_name_source,
             rootpos, destination_final_path,
             manifest_destination,
-            destination
+            destination, args.jobs, destination_scan, hash_function,
+            reuse_detail
         )
-        destination_count = 0
-        # dear god do this better, this is dreadful code!
-        for _, _, filenames in os.walk(destination_final_path):
-            for _ in filenames:
-                destination_count += 1 #works in windows at least
+        if journal is not None and journal.reused_checksums:
+            generate_log(
+                log_name_source,
+                'EVENT = File Transfer Resume - Reused the journaled destination checksums of %d files that had already been hashed and have not changed since' % journal.reused_checksums
+            )
+        destination_count = destination_scan.total_count()
         if rootpos == 'y':
             manifest_temp = tempfile.mkstemp(
                 dir=desktop_manifest_dir, suffix='.md5'
@@ -754,19 +1363,16 @@ def main(args_):
                 with open(manifest_temp[1], 'w') as temp_object:
                     for i in dest_manifest_list:
                         temp_object.write(i[:33] + ' ' + os.path.basename(os.path.dirname(destination_final_path)) + '/' +  i[34:])
-                legacy_manifest = manifest
                 manifest = manifest_temp[1]
-        verify_copy(
+        transfer_success = verify_copy(
             manifest, manifest_destination, log_name_source, overwrite_destination_manifest, files_in_manifest, destination_count, source_count
         )
-        manifest_rename = manifest[:-4] + time.strftime("_%Y_%m_%dT%H_%M_%S") + '.md5'
-        if os.path.normpath(os.path.dirname(manifest)) == os.path.normpath(desktop_manifest_dir):
+        if journal is not None and transfer_success:
+            journal.remove()
+        if rootpos == 'y':
+            manifest_rename = manifest[:-4] + time.strftime("_%Y_%m_%dT%H_%M_%S") + '.md5'
             os.rename(manifest, manifest_rename)
             shutil.move(manifest_rename, os.path.join(desktop_manifest_dir, 'old_manifests'))
-            if rootpos == 'y':
-                legacy_manifest_rename = legacy_manifest[:-4] + time.strftime("_%Y_%m_%dT%H_%M_%S") + '.md5'
-                os.rename(legacy_manifest, legacy_manifest_rename)
-                shutil.move(legacy_manifest_rename, os.path.join(desktop_manifest_dir, 'old_manifests'))
         # hack to also copy the sha512 manifest :(
         # Stop the temp manifest from copying
         if not os.path.basename(manifest_temp[1]) == os.path.basename(manifest):
@@ -774,6 +1380,13 @@ def main(args_):
             if os.path.isfile(sha512_manifest):
                 shutil.copy2(sha512_manifest, os.path.dirname(destination_final_path))
                 print(('%s has been copied to %s' % (sha512_manifest, os.path.dirname(destination_final_path))))
+    manifest = source_manifest
+    if rootpos == 'y' or os.path.normpath(os.path.dirname(manifest)) == os.path.normpath(desktop_manifest_dir):
+        manifest_rename = manifest[:-4] + time.strftime("_%Y_%m_%dT%H_%M_%S") + '.md5'
+        os.rename(manifest, manifest_rename)
+        shutil.move(manifest_rename, os.path.join(desktop_manifest_dir, 'old_manifests'))
+    if destination_total == 1:
         return log_name_source
+    return log_names
 if __name__ == '__main__':
     main(sys.argv[1:])
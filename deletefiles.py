@@ -36,24 +36,16 @@ def parse_args(args_):
 def remove_from_manifest(manifest, old_oe, new_log_textfile):
     '''
     Removes a file from a manifest and logs the result in the logfile.
+    manifest is an ififuncs.Manifest object, so the change is only written
+    when manifest.commit() is called.
     '''
-    updated_lines = []
-    with open(manifest, 'r') as file_object:
-        checksums = file_object.readlines()
-        for line in checksums:
-            if old_oe in line:
-                print(('%s has been removed from the package manifest' % line))
-                ififuncs.generate_log(
-                    new_log_textfile,
-                    'EVENT = eventType=metadata modification,'
-                    ' agentName=deletefiles.py,'
-                    ' eventDetail=%s has been removed from the package manifest' % line)
-                continue
-            else:
-                updated_lines.append(line)
-    with open(manifest, 'w') as updated_manifest:
-        for updated_line in updated_lines:
-            updated_manifest.write(updated_line)
+    for line in manifest.remove(old_oe):
+        print(('%s has been removed from the package manifest' % line))
+        ififuncs.generate_log(
+            new_log_textfile,
+            'EVENT = eventType=metadata modification,'
+            ' agentName=deletefiles.py,'
+            ' eventDetail=%s has been removed from the package manifest' % line)
 
 
 def main(args_):
@@ -103,6 +95,7 @@ def main(args_):
         'EVENT = agentName=%s' % user
     )
     metadata_dir = os.path.join(sip_path, 'metadata')
+    package_manifest = ififuncs.Manifest(sip_manifest)
     for filename in args.i:
         # add test to see if it actually deleted - what if read only?
         os.remove(filename)
@@ -125,13 +118,14 @@ def main(args_):
                     ' agentName=os.remove()'
                     % os.path.join(metadata_dir, metadata)
                 )
-        remove_from_manifest(sip_manifest, os.path.basename(filename), new_log_textfile)
-        ififuncs.sort_manifest(sip_manifest)
+        remove_from_manifest(package_manifest, os.path.basename(filename), new_log_textfile)
+    package_manifest.sort()
     ififuncs.generate_log(
         new_log_textfile,
         'EVENT = deletefiles.py finished'
     )    
-    ififuncs.checksum_replace(sip_manifest, new_log_textfile, 'md5')
+    ififuncs.checksum_replace(package_manifest, new_log_textfile, 'md5')
+    package_manifest.commit()
     finish = datetime.datetime.now()
     print('\n- %s ran this script at %s and it finished at %s' % (user, start, finish))
 
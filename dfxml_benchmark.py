@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+'''
+Measures the time and peak memory that Objects.py takes to parse a large
+Digital Forensics XML file. A synthetic DFXML file is written first,
+unless an existing one is given with -i.
+With -throughput, the number of fileobjects read per second is compared
+between whole fileobjects and only the -fields that a caller needs.
+Usage: dfxml_benchmark.py -files 1000000
+Run this against two copies of the repository to compare them.
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import Objects
+
+
+def parse_args(args_):
+    '''
+    Parse command line arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Measures the time and peak memory needed to parse'
+        ' a large DFXML file with Objects.py.'
+    )
+    parser.add_argument(
+        '-i',
+        help='full path of an existing DFXML file to parse. If this is not'
+        ' used, a synthetic DFXML file is written and then deleted.'
+    )
+    parser.add_argument(
+        '-files',
+        type=int, default=1000000,
+        help='number of fileobjects in the synthetic DFXML file.'
+        ' The default is 1000000.'
+    )
+    parser.add_argument(
+        '-o',
+        help='full path of the synthetic DFXML file. It is kept afterwards'
+        ' so that the same file can be parsed by another copy of the scripts.'
+    )
+    parser.add_argument(
+        '-throughput',
+        action='store_true',
+        help='compare fileobjects per second with Objects.iterparse, first'
+        ' populating whole fileobjects and then only the -fields,'
+        ' instead of measuring memory.'
+    )
+    parser.add_argument(
+        '-fields',
+        default='filename,filesize,md5',
+        help='comma separated FileObject properties for -throughput.'
+        ' The default is filename,filesize,md5'
+    )
+    parsed_args = parser.parse_args(args_)
+    return parsed_args
+
+
+def write_synthetic_dfxml(dfxml_path, number_of_files):
+    '''
+    Writes a DFXML file with number_of_files fileobjects that look like
+    the output of makedfxml.py with hashes, plus one data byte run each.
+    '''
+    with open(dfxml_path, 'w') as dfxml_fh:
+        dfxml_fh.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<dfxml xmlns="http://www.forensicswiki.org/wiki/Category:Digital_Forensics_XML"'
+            ' xmlns:dc="http://purl.org/dc/elements/1.1/"'
+            ' xmlns:delta="http://www.forensicswiki.org/wiki/Separating_file_system_differences"'
+            ' version="1.1.1">\n'
+            '  <metadata>\n'
+            '    <dc:type>File system walk</dc:type>\n'
+            '  </metadata>\n'
+            '  <creator>\n'
+            '    <program>dfxml_benchmark.py</program>\n'
+            '  </creator>\n'
+        )
+        for number in range(number_of_files):
+            filesize = number * 4096
+            dfxml_fh.write(
+                '  <fileobject>\n'
+                '    <filename>objects/reel_%03d/frame_%08d.dpx</filename>\n'
+                '    <name_type>r</name_type>\n'
+                '    <filesize>%d</filesize>\n'
+                '    <alloc>1</alloc>\n'
+                '    <inode>%d</inode>\n'
+                '    <mode>33188</mode>\n'
+                '    <nlink>1</nlink>\n'
+                '    <uid>1000</uid>\n'
+                '    <gid>1000</gid>\n'
+                '    <mtime prec="1ns">2018-05-%02dT10:%02d:%02dZ</mtime>\n'
+                '    <ctime prec="1ns">2018-05-%02dT10:%02d:%02dZ</ctime>\n'
+                '    <atime prec="1ns">2018-05-%02dT10:%02d:%02dZ</atime>\n'
+                '    <byte_runs>\n'
+                '      <byte_run file_offset="0" img_offset="%d" len="%d"/>\n'
+                '    </byte_runs>\n'
+                '    <hashdigest type="md5">%032x</hashdigest>\n'
+                '    <hashdigest type="sha512">%0128x</hashdigest>\n'
+                '  </fileobject>\n' % (
+                    number // 10000, number, filesize, number + 2,
+                    number % 28 + 1, number // 60 % 60, number % 60,
+                    number % 28 + 1, number // 60 % 60, number % 60,
+                    number % 28 + 1, number // 60 % 60, number % 60,
+                    filesize * 2, filesize, number, number
+                )
+            )
+        dfxml_fh.write('</dfxml>\n')
+
+
+def get_peak_rss():
+    '''
+    Returns the peak resident memory of this process in bytes.
+    Linux reports ru_maxrss in kilobytes and macOS reports it in bytes.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def measure_throughput(dfxml_path, fields=None):
+    '''
+    Streams every fileobject in dfxml_path through Objects.iterparse and
+    returns a tuple of (number of fileobjects, seconds taken).
+    '''
+    number_of_files = 0
+    start = time.time()
+    for (_, obj) in Objects.iterparse(dfxml_path, fields=fields):
+        if isinstance(obj, Objects.FileObject):
+            number_of_files += 1
+    return number_of_files, time.time() - start
+
+
+def print_throughput(dfxml_path, fields):
+    '''
+    Prints the fileobjects per second for whole fileobjects and for fields.
+    '''
+    for description, selection in (
+            ('whole fileobjects', None),
+            ('fields %s' % ','.join(fields), fields)
+    ):
+        number_of_files, seconds = measure_throughput(dfxml_path, selection)
+        print(
+            'Objects.iterparse, %s: %d fileobjects in %.1f seconds,'
+            ' %d fileobjects per second' % (
+                description, number_of_files, seconds,
+                number_of_files / max(seconds, 0.001)
+            )
+        )
+
+
+def main(args_):
+    '''
+    Writes the synthetic DFXML if needed, then parses it with
+    Objects.parse and prints the time taken and the peak memory.
+    '''
+    args = parse_args(args_)
+    remove_dfxml = False
+    if args.i:
+        dfxml_path = args.i
+    else:
+        if args.o:
+            dfxml_path = args.o
+        else:
+            dfxml_fh, dfxml_path = tempfile.mkstemp(suffix='_dfxml.xml')
+            os.close(dfxml_fh)
+            remove_dfxml = True
+        print('Writing %d fileobjects to %s' % (args.files, dfxml_path))
+        write_synthetic_dfxml(dfxml_path, args.files)
+    try:
+        if args.throughput:
+            print_throughput(dfxml_path, args.fields.split(','))
+            return
+        rss_before = get_peak_rss()
+        start = time.time()
+        dobj = Objects.parse(dfxml_path)
+        seconds = time.time() - start
+        rss_after = get_peak_rss()
+        number_of_files = sum(
+            1 for obj in dobj if isinstance(obj, Objects.FileObject)
+        )
+    finally:
+        if remove_dfxml:
+            os.remove(dfxml_path)
+    print('Objects.py version: %s' % Objects.__version__)
+    print('Fileobjects parsed: %d' % number_of_files)
+    print('Parse time: %.1f seconds' % seconds)
+    print('Peak memory: %.1f MB' % (rss_after / 1000000.0))
+    if number_of_files:
+        print(
+            'Memory per fileobject: %d bytes'
+            % ((rss_after - rss_before) // number_of_files)
+        )
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
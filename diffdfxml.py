@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+'''
+Compares two Digital Forensics XML files that describe the same package,
+such as the DFXML that was made during accession and a fresh makedfxml.py
+walk of the AIP, and reports new, deleted, renamed and modified files.
+Usage: diffdfxml.py old_dfxml.xml new_dfxml.xml -csv report.csv
+Run diffdfxml.py -h for help.
+'''
+import sys
+import csv
+import argparse
+import collections
+import Objects
+
+# The FileObject properties that are read from each DFXML file.
+FIELDS = (
+    'filename', 'name_type', 'filesize', 'inode', 'mtime',
+    'md5', 'sha1', 'sha256', 'sha512'
+)
+# The properties that are compared when a file is in both DFXML files.
+COMPARED_FIELDS = (
+    'name_type', 'filesize', 'mtime', 'md5', 'sha1', 'sha256', 'sha512'
+)
+HASH_FIELDS = ('sha512', 'sha256', 'sha1', 'md5')
+
+FileRecord = collections.namedtuple('FileRecord', FIELDS)
+
+
+class NotSortedError(Exception):
+    '''
+    Raised when a DFXML file turns out not to be sorted by filename,
+    so the sort-merge comparison can not be used.
+    '''
+    pass
+
+
+def parse_args(args_):
+    '''
+    Parse command line arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Compares two DFXML files of the same package and'
+        ' reports new, deleted, renamed and modified files.'
+        ' Files are renamed if the inode or the checksum is unchanged.'
+    )
+    parser.add_argument(
+        'old',
+        help='full path of the older DFXML file, eg. from accession'
+    )
+    parser.add_argument(
+        'new',
+        help='full path of the newer DFXML file, eg. a fresh makedfxml.py walk'
+    )
+    parser.add_argument(
+        '-csv',
+        help='full path of a CSV report with one row per difference'
+    )
+    parser.add_argument(
+        '-ignore',
+        nargs='+', default=[], choices=COMPARED_FIELDS,
+        help='properties that are not compared, eg. -ignore mtime'
+    )
+    parsed_args = parser.parse_args(args_)
+    return parsed_args
+
+
+def iter_records(dfxml_path):
+    '''
+    Yields a FileRecord for every fileobject in a DFXML file. Only the
+    FIELDS are decoded, and no fileobjects are kept in memory.
+    '''
+    for _, obj in Objects.iterparse(dfxml_path, events=('end',), fields=FIELDS):
+        if not isinstance(obj, Objects.FileObject) or obj.filename is None:
+            continue
+        mtime = None
+        if obj.mtime is not None and obj.mtime.time is not None:
+            mtime = str(obj.mtime.time)
+        hashes = []
+        for field in ('md5', 'sha1', 'sha256', 'sha512'):
+            digest = getattr(obj, field)
+            if digest is not None:
+                digest = digest.lower()
+            hashes.append(digest)
+        yield FileRecord(
+            obj.filename, obj.name_type, obj.filesize, obj.inode, mtime,
+            *hashes
+        )
+
+
+def iter_sorted_records(dfxml_path):
+    '''
+    Yields the records of a DFXML file, and raises NotSortedError as soon
+    as a filename is not greater than the one before it.
+    makedfxml.py writes its fileobjects sorted by filename.
+    '''
+    previous = None
+    for record in iter_records(dfxml_path):
+        if previous is not None and record.filename <= previous:
+            raise NotSortedError(
+                '%s is not sorted by filename at %s' % (dfxml_path, record.filename)
+            )
+        previous = record.filename
+        yield record
+
+
+def merge_sorted(old_records, new_records):
+    '''
+    Yields (old, new) pairs of records with the same filename from two
+    streams that are sorted by filename. One side of the pair is None if
+    the filename is only in one stream. Only one record from each stream
+    is held in memory at a time.
+    '''
+    old = next(old_records, None)
+    new = next(new_records, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.filename < new.filename):
+            yield old, None
+            old = next(old_records, None)
+        elif old is None or new.filename < old.filename:
+            yield None, new
+            new = next(new_records, None)
+        else:
+            yield old, new
+            old = next(old_records, None)
+            new = next(new_records, None)
+
+
+def merge_indexed(old_dfxml, new_dfxml, duplicates):
+    '''
+    Yields (old, new) pairs of records with the same filename, for DFXML
+    files that are not sorted. The old records are held in a
+    filename-keyed index while the new DFXML is streamed.
+    A filename that is in the same DFXML more than once is only paired
+    the first time, and each repeat is appended to duplicates as a
+    ('old', record) or ('new', record) tuple instead.
+    '''
+    index = {}
+    for record in iter_records(old_dfxml):
+        if record.filename in index:
+            duplicates.append(('old', record))
+        else:
+            index[record.filename] = record
+    seen = set()
+    for new in iter_records(new_dfxml):
+        if new.filename in seen:
+            duplicates.append(('new', new))
+            continue
+        seen.add(new.filename)
+        yield index.pop(new.filename, None), new
+    for old in index.values():
+        yield old, None
+
+
+def compare_records(old, new, ignore=()):
+    '''
+    Returns a list of the properties that differ between two records.
+    A property that is missing from either record is not compared, so a
+    DFXML file made without checksums does not report every checksum as
+    changed. Only the type of directories is compared, as their size and
+    mtime change whenever their contents do.
+    '''
+    changes = []
+    for field in COMPARED_FIELDS:
+        if field in ignore:
+            continue
+        if field != 'name_type' and 'd' in (old.name_type, new.name_type):
+            continue
+        old_value = getattr(old, field)
+        new_value = getattr(new, field)
+        if old_value is None or new_value is None:
+            continue
+        if old_value != new_value:
+            changes.append(field)
+    return changes
+
+
+def classify_pairs(pairs, ignore=()):
+    '''
+    Sorts (old, new) pairs into modified files, deleted files and new
+    files. Returns a tuple of (modified, deleted, added, unchanged) where
+    modified is a list of (old, new, changes) and unchanged is a count,
+    so memory only grows with the number of differences.
+    '''
+    modified = []
+    deleted = []
+    added = []
+    unchanged = 0
+    for old, new in pairs:
+        if new is None:
+            deleted.append(old)
+        elif old is None:
+            added.append(new)
+        else:
+            changes = compare_records(old, new, ignore)
+            if changes:
+                modified.append((old, new, changes))
+            else:
+                unchanged += 1
+    return modified, deleted, added, unchanged
+
+
+def same_content(old, new):
+    '''
+    Returns True if two records have the same checksum, or if neither
+    DFXML has a common checksum, the same size.
+    '''
+    for field in HASH_FIELDS:
+        old_digest = getattr(old, field)
+        new_digest = getattr(new, field)
+        if old_digest is not None and new_digest is not None:
+            return old_digest == new_digest
+    return old.filesize == new.filesize
+
+
+def find_renames(deleted, added, ignore=()):
+    '''
+    Pairs deleted files with new files that are the same file under a new
+    name. The inode is tried first, as it survives a rename within a file
+    system, but only if the content is the same, as inodes of deleted
+    files are reused. A checksum is tried next, as it survives a migration
+    to new storage. Empty files are not paired by checksum, as they all
+    match.
+    Returns a tuple of (renamed, deleted, added) where renamed is a list of
+    (old, new, changes).
+    '''
+    inode_index = {}
+    hash_index = {}
+    for old in deleted:
+        if old.inode is not None:
+            inode_index.setdefault(old.inode, []).append(old)
+        if old.filesize:
+            for field in HASH_FIELDS:
+                digest = getattr(old, field)
+                if digest is not None:
+                    hash_index.setdefault((field, digest), []).append(old)
+    renamed = []
+    paired = set()
+    still_added = []
+
+    def take(candidates, new):
+        '''
+        Returns the first candidate with the same content that has not been
+        paired yet.
+        '''
+        for old in candidates:
+            if old.filename not in paired and old.name_type == new.name_type \
+                    and same_content(old, new):
+                paired.add(old.filename)
+                return old
+        return None
+
+    for new in added:
+        old = None
+        if new.inode is not None:
+            old = take(inode_index.get(new.inode, []), new)
+        if old is None and new.filesize:
+            for field in HASH_FIELDS:
+                digest = getattr(new, field)
+                if digest is not None:
+                    old = take(hash_index.get((field, digest), []), new)
+                    if old is not None:
+                        break
+        if old is None:
+            still_added.append(new)
+        else:
+            renamed.append((old, new, compare_records(old, new, ignore)))
+    still_deleted = [old for old in deleted if old.filename not in paired]
+    return renamed, still_deleted, still_added
+
+
+def diff_dfxml(old_dfxml, new_dfxml, ignore=()):
+    '''
+    Compares two DFXML files. If both are sorted by filename, they are
+    streamed side by side in a single pass. Otherwise the old DFXML is
+    indexed by filename and the new one is streamed against the index.
+    Returns a dictionary with the lists of modified, renamed, deleted, new
+    and duplicate files, the count of unchanged files and the method that
+    was used.
+    '''
+    duplicates = []
+    try:
+        classified = classify_pairs(
+            merge_sorted(
+                iter_sorted_records(old_dfxml), iter_sorted_records(new_dfxml)
+            ), ignore
+        )
+        method = 'sort-merge'
+    except NotSortedError as error:
+        print(' - %s, so comparing with a filename index instead' % error)
+        classified = classify_pairs(
+            merge_indexed(old_dfxml, new_dfxml, duplicates), ignore
+        )
+        method = 'index'
+    modified, deleted, added, unchanged = classified
+    renamed, deleted, added = find_renames(deleted, added, ignore)
+    return {
+        'modified': modified,
+        'renamed': renamed,
+        'deleted': deleted,
+        'new': added,
+        'duplicates': duplicates,
+        'unchanged': unchanged,
+        'method': method
+    }
+
+
+def describe_changes(old, new, changes):
+    '''
+    Returns the old and new values of the changed properties as two
+    strings, eg. ('filesize=10; md5=abc', 'filesize=12; md5=def').
+    '''
+    old_values = '; '.join('%s=%s' % (field, getattr(old, field)) for field in changes)
+    new_values = '; '.join('%s=%s' % (field, getattr(new, field)) for field in changes)
+    return old_values, new_values
+
+
+def iter_rows(differences):
+    '''
+    Yields one report row per difference:
+    (status, filename, new filename, changed properties, old values, new values)
+    A duplicate row holds the values of the repeated record in the old or
+    new values column, depending on which DFXML it was found in.
+    '''
+    for old, new, changes in differences['modified']:
+        old_values, new_values = describe_changes(old, new, changes)
+        yield ('modified', old.filename, '', ', '.join(changes), old_values, new_values)
+    for old, new, changes in differences['renamed']:
+        old_values, new_values = describe_changes(old, new, changes)
+        yield ('renamed', old.filename, new.filename, ', '.join(changes), old_values, new_values)
+    for old in differences['deleted']:
+        yield ('deleted', old.filename, '', '', '', '')
+    for new in differences['new']:
+        yield ('new', new.filename, '', '', '', '')
+    for side, record in differences['duplicates']:
+        fields = [field for field in COMPARED_FIELDS if getattr(record, field) is not None]
+        values = describe_changes(record, record, fields)[0]
+        if side == 'old':
+            yield ('duplicate', record.filename, '', '', values, '')
+        else:
+            yield ('duplicate', record.filename, '', '', '', values)
+
+
+def main(args_):
+    '''
+    Compares the two DFXML files, prints each difference and a summary,
+    and writes the CSV report if one was requested.
+    Returns the dictionary of differences.
+    '''
+    args = parse_args(args_)
+    differences = diff_dfxml(args.old, args.new, args.ignore)
+    for status, filename, new_filename, changes, old_values, _ in iter_rows(differences):
+        if status == 'renamed':
+            filename = '%s -> %s' % (filename, new_filename)
+        if changes:
+            filename = '%s (%s)' % (filename, changes)
+        if status == 'duplicate':
+            filename = '%s (repeated in the %s DFXML)' % (
+                filename, 'old' if old_values else 'new'
+            )
+        print('%s: %s' % (status.upper(), filename))
+    if args.csv:
+        with open(args.csv, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([
+                'status', 'filename', 'new_filename',
+                'changed_properties', 'old_values', 'new_values'
+            ])
+            writer.writerows(iter_rows(differences))
+        print(' - Report written to %s' % args.csv)
+    print(
+        ' - Compared with %s: %d modified, %d renamed, %d deleted,'
+        ' %d new, %d duplicate, %d unchanged' % (
+            differences['method'], len(differences['modified']),
+            len(differences['renamed']), len(differences['deleted']),
+            len(differences['new']), len(differences['duplicates']),
+            differences['unchanged']
+        )
+    )
+    return differences
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
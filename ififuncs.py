@@ -5,6 +5,7 @@ A collection of functions that other scripts can use.
 from __future__ import print_function
 
 import subprocess
+import argparse
 import sys
 import time
 import smtplib
@@ -22,8 +23,18 @@ import json
 import ctypes
 import platform
 import itertools
+import functools
+import heapq
+import zlib
+import concurrent.futures
 import unicodedata
 import shutil
+import sqlite3
+import threading
+import stat
+import queue
+import errno
+import struct
 from builtins import input
 import makedfxml
 from glob import glob
@@ -37,6 +48,11 @@ try:
 except ImportError:
     print('ERROR - lxml is not installed - try pip install lxml')
     sys.exit()
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
 
 def diff_textfiles(source_textfile, other_textfile):
     '''
@@ -308,6 +324,11 @@ def set_environment(logfile):
 
 
 def generate_log(log, what2log):
+    if isinstance(log, list):
+        # the same event is written to several logs, eg one per destination
+        for log_name in log:
+            generate_log(log_name, what2log)
+        return
     if not os.path.isfile(log):
         with open(log, "w", encoding='utf-8') as fo:
             fo.write(time.strftime("%Y-%m-%dT%H:%M:%S ")
@@ -320,163 +341,1058 @@ def generate_log(log, what2log):
                      + ' ' + what2log + ' \n')
 
 
-def hashlib_md5(filename):
+class Crc32(object):
     '''
-    uses hashlib to return an MD5 checksum of an input filename
+    Wraps zlib.crc32 so that it can be fed alongside hashlib objects.
+    '''
+    name = 'crc32'
+
+    def __init__(self):
+        self.crc = 0
+
+    def update(self, buf):
+        self.crc = zlib.crc32(buf, self.crc)
+
+    def hexdigest(self):
+        return '%08x' % (self.crc & 0xffffffff)
+
+
+def new_hash_object(algorithm):
+    '''
+    Returns a hash object for md5, sha512, crc32 or any other
+    algorithm that hashlib supports.
+    '''
+    if algorithm == 'crc32':
+        return Crc32()
+    return hashlib.new(algorithm)
+
+
+# Set by setup_checksum_cache(). None means that every file is reread.
+CHECKSUM_CACHE = None
+CHECKSUM_CACHE_MAX_ENTRIES = 1000000
+
+
+class ChecksumCache(object):
+    '''
+    A persistent SQLite store of checksums, keyed on device and inode.
+    A cached checksum is only trusted if the size and mtime_ns of the file
+    are unchanged since it was hashed. The least recently used entries are
+    evicted once max_entries is exceeded.
+    '''
+    def __init__(self, cache_path, max_entries=CHECKSUM_CACHE_MAX_ENTRIES):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.puts_since_eviction = 0
+        # the number of files whose checksums were answered by get()
+        self.hits = 0
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS checksums ('
+                'device INTEGER, inode INTEGER, algorithm TEXT,'
+                ' size INTEGER, mtime_ns INTEGER, checksum TEXT, last_used REAL,'
+                ' PRIMARY KEY (device, inode, algorithm))'
+            )
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS checksums_last_used ON checksums (last_used)'
+            )
+
+    def get(self, algorithms, stat_result):
+        '''
+        Returns a dictionary of algorithm: checksum if every algorithm is
+        cached for an unchanged file, otherwise None.
+        '''
+        checksums = {}
+        with self.lock:
+            for algorithm in algorithms:
+                row = self.connection.execute(
+                    'SELECT size, mtime_ns, checksum FROM checksums'
+                    ' WHERE device=? AND inode=? AND algorithm=?',
+                    (stat_result.st_dev, stat_result.st_ino, algorithm)
+                ).fetchone()
+                if row is None or tuple(row[:2]) != (stat_result.st_size, stat_result.st_mtime_ns):
+                    return None
+                checksums[algorithm] = row[2]
+            with self.connection:
+                self.connection.execute(
+                    'UPDATE checksums SET last_used=? WHERE device=? AND inode=?',
+                    (time.time(), stat_result.st_dev, stat_result.st_ino)
+                )
+            self.hits += 1
+        return checksums
+
+    def put(self, checksums, stat_result):
+        '''
+        Stores a dictionary of algorithm: checksum for a file.
+        '''
+        with self.lock:
+            with self.connection:
+                for algorithm, checksum in checksums.items():
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (
+                            stat_result.st_dev, stat_result.st_ino, algorithm,
+                            stat_result.st_size, stat_result.st_mtime_ns,
+                            checksum, time.time()
+                        )
+                    )
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction >= 1000:
+                self.puts_since_eviction = 0
+                self.evict()
+
+    def evict(self):
+        '''
+        Deletes the least recently used entries beyond max_entries.
+        '''
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM checksums WHERE rowid IN (SELECT rowid FROM checksums'
+                ' ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+
+def setup_checksum_cache(cache_path, no_cache, log_name_source=None, use_environment=True):
+    '''
+    Turns the checksum cache on or off for the rest of the process.
+    cache_path is the value of a -cache argument: None when absent and an
+    empty string if -cache was used without a path. The
+    IFISCRIPTS_CHECKSUM_CACHE environment variable turns the cache on by
+    default, unless use_environment is False, so that a fixity check only
+    trusts the cache when -cache is asked for. no_cache always wins, so that
+    formal fixity events reread every byte.
+    '''
+    global CHECKSUM_CACHE
+    if cache_path is None and use_environment:
+        cache_path = os.environ.get('IFISCRIPTS_CHECKSUM_CACHE')
+    if no_cache or cache_path is None:
+        CHECKSUM_CACHE = None
+        return None
+    if cache_path == '':
+        cache_path = os.path.join(make_desktop_logs_dir(), 'checksum_cache.sqlite')
+    if CHECKSUM_CACHE is None or CHECKSUM_CACHE.cache_path != cache_path:
+        CHECKSUM_CACHE = ChecksumCache(cache_path)
+    if log_name_source is not None:
+        generate_log(
+            log_name_source,
+            'EVENT = Checksum cache enabled - eventDetail=checksums of files with an unchanged device, inode, size and mtime are reused from %s instead of being recalculated' % cache_path
+        )
+    return CHECKSUM_CACHE
+
+
+READ_BLOCK_SIZE = None
+DEFAULT_READ_BLOCK_SIZE = 2**20
+NETWORK_READ_BLOCK_SIZE = 2**23
+NETWORK_FILESYSTEMS = (
+    'ltfs', 'fuse.ltfs', 'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'fuse.sshfs'
+)
+MOUNTS = None
+
+
+def parse_block_size(block_size):
+    '''
+    Converts a block size such as 4194304, 512K or 8M into a number of bytes.
+    Used as an argparse type for --read-block-size.
     '''
+    multipliers = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+    suffix = block_size[-1:].upper()
+    try:
+        if suffix in multipliers:
+            size = int(block_size[:-1]) * multipliers[suffix]
+        else:
+            size = int(block_size)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a valid block size' % block_size)
+    if size <= 0:
+        raise argparse.ArgumentTypeError('%s is not a valid block size' % block_size)
+    return size
+
+
+def setup_read_block_size(block_size, log_name_source=None):
+    '''
+    Sets the read block size used by hashlib_multi for the rest of the
+    process. None restores the automatic choice based on the filesystem.
+    '''
+    global READ_BLOCK_SIZE
+    READ_BLOCK_SIZE = block_size
+    if block_size is not None and log_name_source is not None:
+        generate_log(
+            log_name_source,
+            'EVENT = Read block size - %d bytes' % block_size
+        )
+
+
+def get_filesystem_type(filename):
+    '''
+    Returns the type of the filesystem that filename is on, eg ext4 or nfs,
+    by finding the longest matching mount point in /proc/mounts.
+    Returns None where /proc/mounts is not available, eg on macOS or Windows.
+    '''
+    global MOUNTS
+    if MOUNTS is None:
+        MOUNTS = []
+        try:
+            with open('/proc/mounts', 'r') as fo:
+                for line in fo:
+                    fields = line.split()
+                    if len(fields) > 2:
+                        mount_point = fields[1].replace('\\040', ' ')
+                        MOUNTS.append((mount_point, fields[2]))
+        except (IOError, OSError):
+            pass
+        MOUNTS.sort(key=lambda mount: len(mount[0]), reverse=True)
+    path = os.path.realpath(filename)
+    for mount_point, filesystem_type in MOUNTS:
+        if mount_point == '/' or path == mount_point or path.startswith(mount_point + os.sep):
+            return filesystem_type
+    return None
+
+
+def get_read_block_size(filename):
+    '''
+    Returns the block size that should be used to read filename. A size set
+    with --read-block-size always wins, otherwise LTFS and network shares get
+    larger blocks, as each request on those has a high fixed cost.
+    '''
+    if READ_BLOCK_SIZE is not None:
+        return READ_BLOCK_SIZE
+    if get_filesystem_type(filename) in NETWORK_FILESYSTEMS:
+        return NETWORK_READ_BLOCK_SIZE
+    return DEFAULT_READ_BLOCK_SIZE
+
+
+READ_LIMITER = None
+WRITE_LIMITER = None
+IONICE_CLASSES = {'idle': '3', 'best-effort': '2'}
+
+
+def parse_mbps(mbps):
+    '''
+    Converts a bandwidth in megabytes per second, such as 50 or 12.5, into
+    bytes per second. Used as an argparse type for --max-read-mbps.
+    '''
+    try:
+        rate = float(mbps) * 10**6
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a valid bandwidth' % mbps)
+    if rate <= 0:
+        raise argparse.ArgumentTypeError('%s is not a valid bandwidth' % mbps)
+    return rate
+
+
+class TokenBucket(object):
+    '''
+    Limits the rate of reads or writes to rate bytes per second, shared by
+    every thread in the process. Each read or write takes tokens from the
+    bucket, which refills at rate, and callers sleep when it runs out.
+    Up to a second of unused bandwidth can be saved up.
+    '''
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(self.rate, DEFAULT_READ_BLOCK_SIZE)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= size
+            # threads that arrive while the bucket is empty queue up behind
+            # each other, as each one waits for the debt that is in front of it
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+def throttle_read(size):
+    if READ_LIMITER is not None:
+        READ_LIMITER.consume(size)
+
+
+def throttle_write(size):
+    if WRITE_LIMITER is not None:
+        WRITE_LIMITER.consume(size)
+
+
+def setup_bandwidth_limits(max_read_rate, max_write_rate, ionice_class=None, log_name_source=None):
+    '''
+    Limits the bandwidth of file reads and writes for the rest of the
+    process, so that long running fixity and copy jobs do not starve other
+    users of shared storage. Rates are in bytes per second, None means
+    unlimited. ionice_class is 'idle' or 'best-effort' and sets the IO
+    scheduling class of the process with ionice where it is available.
+    This should be called before any worker threads or processes start,
+    as they inherit the IO class of the process that starts them.
+    '''
+    global READ_LIMITER
+    global WRITE_LIMITER
+    READ_LIMITER = None
+    WRITE_LIMITER = None
+    if max_read_rate is not None:
+        READ_LIMITER = TokenBucket(max_read_rate)
+    if max_write_rate is not None:
+        WRITE_LIMITER = TokenBucket(max_write_rate)
+    if log_name_source is not None:
+        for label, rate in (('Read', max_read_rate), ('Write', max_write_rate)):
+            if rate is not None:
+                generate_log(
+                    log_name_source,
+                    'EVENT = %s bandwidth limit - %g MB/s' % (label, rate / 10**6)
+                )
+    if ionice_class is not None:
+        try:
+            subprocess.check_call([
+                'ionice', '-c', IONICE_CLASSES[ionice_class], '-p', str(os.getpid())
+            ])
+            message = 'EVENT = IO scheduling class - %s' % ionice_class
+        except (OSError, subprocess.CalledProcessError):
+            message = 'EVENT = IO scheduling class - ionice is not available, so the IO scheduling class was not changed'
+        print(message)
+        if log_name_source is not None:
+            generate_log(log_name_source, message)
+
+
+def fadvise(fileno, offset, length, advice):
+    '''
+    Passes an access pattern hint to the kernel where posix_fadvise exists.
+    advice is the name of the constant, eg 'POSIX_FADV_SEQUENTIAL'.
+    '''
+    if hasattr(os, 'posix_fadvise') and hasattr(os, advice):
+        try:
+            os.posix_fadvise(fileno, offset, length, getattr(os, advice))
+        except OSError:
+            pass
+
+
+class ReadAheadReader(object):
+    '''
+    Iterates over the blocks of a file while a background thread reads the
+    next block, so that the disk is busy while the previous block is being
+    hashed. At most two blocks are held in memory at a time.
+    The kernel is told that the file is read sequentially, and pages that
+    have been read are dropped from the page cache, so that hashing a large
+    package does not push out files that other jobs are using.
+    '''
+    def __init__(self, filename, block_size=None):
+        self.filename = filename
+        if block_size is None:
+            block_size = get_read_block_size(filename)
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=2)
+        self.stopped = threading.Event()
+
+    def read_blocks(self, fo):
+        fileno = fo.fileno()
+        offset = 0
+        while not self.stopped.is_set():
+            buf = fo.read(self.block_size)
+            if not buf:
+                break
+            throttle_read(len(buf))
+            fadvise(fileno, offset, len(buf), 'POSIX_FADV_DONTNEED')
+            offset += len(buf)
+            yield buf
+
+    def prefetch(self, fo):
+        try:
+            for buf in self.read_blocks(fo):
+                self.put(buf)
+        except Exception as e:
+            self.put(e)
+        self.put(None)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        with open(str(self.filename), 'rb') as fo:
+            fadvise(fo.fileno(), 0, 0, 'POSIX_FADV_SEQUENTIAL')
+            if os.fstat(fo.fileno()).st_size <= self.block_size:
+                # not worth starting a thread for a single read
+                for buf in self.read_blocks(fo):
+                    yield buf
+                return
+            reader = threading.Thread(target=self.prefetch, args=(fo,))
+            reader.daemon = True
+            reader.start()
+            try:
+                while True:
+                    buf = self.blocks.get()
+                    if buf is None:
+                        break
+                    if isinstance(buf, Exception):
+                        raise buf
+                    yield buf
+            finally:
+                self.stopped.set()
+                reader.join()
+
+
+class ChunkHasher(object):
+    '''
+    Collects the MD5 of every chunk_size block of a file from buffers of
+    any size, so that chunk digests for a chunk manifest can be calculated
+    in the same read as the whole file checksums.
+    '''
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.digests = []
+        self.hash_object = None
+        self.filled = 0
+
+    def update(self, buf):
+        view = memoryview(buf)
+        offset = 0
+        while offset < len(view):
+            if self.hash_object is None:
+                self.hash_object = hashlib.md5()
+                self.filled = 0
+            size = min(self.chunk_size - self.filled, len(view) - offset)
+            self.hash_object.update(view[offset:offset + size])
+            self.filled += size
+            offset += size
+            if self.filled == self.chunk_size:
+                self.digests.append(self.hash_object.hexdigest())
+                self.hash_object = None
+
+    def hexdigests(self):
+        '''
+        Returns the list of chunk MD5s, including a shorter last chunk.
+        '''
+        if self.hash_object is not None:
+            self.digests.append(self.hash_object.hexdigest())
+            self.hash_object = None
+        return self.digests
+
+
+def hashlib_multi(filename, algorithms=('md5', 'sha512'), progress=True, chunk_size=None):
+    '''
+    Reads a file once, with read-ahead, and feeds every buffer into one hash
+    object per algorithm. Returns a dictionary of algorithm: hexdigest.
+    If the checksum cache is enabled, unchanged files are not reread.
+    If chunk_size is given, the dictionary also holds a list of the MD5 of
+    every chunk_size block under 'chunks', for a chunk manifest. The file
+    is always read then, as the cache does not hold chunk digests.
+    '''
+    if CHECKSUM_CACHE is not None:
+        stat_result = os.stat(filename)
+        if chunk_size is None:
+            cached_checksums = CHECKSUM_CACHE.get(algorithms, stat_result)
+            if cached_checksums is not None:
+                return cached_checksums
     read_size = 0
     last_percent_done = 0
-    m = hashlib.md5()
+    hash_objects = [(algorithm, new_hash_object(algorithm)) for algorithm in algorithms]
+    if chunk_size is not None:
+        chunk_hasher = ChunkHasher(chunk_size)
+        hash_objects.append(('chunks', chunk_hasher))
     total_size = os.path.getsize(filename)
-    with open(str(filename), 'rb') as f:
-        while True:
-            buf = f.read(2**20)
-            if not buf:
-                break
-            read_size += len(buf)
-            m.update(buf)
+    for buf in ReadAheadReader(filename):
+        read_size += len(buf)
+        for _, hash_object in hash_objects:
+            hash_object.update(buf)
+        if progress:
             percent_done = 100 * read_size / total_size
             if percent_done > last_percent_done:
                 sys.stdout.write('[%d%%]\r' % percent_done)
                 sys.stdout.flush()
                 last_percent_done = percent_done
-    md5_output = m.hexdigest()
-    return md5_output
+    checksums = dict((algorithm, hash_object.hexdigest()) for algorithm, hash_object in hash_objects[:len(algorithms)])
+    if CHECKSUM_CACHE is not None:
+        CHECKSUM_CACHE.put(checksums, stat_result)
+    if chunk_size is not None:
+        checksums['chunks'] = chunk_hasher.hexdigests()
+    return checksums
+
+
+class DestinationWriter(object):
+    '''
+    Writes blocks to one destination file on its own thread, so that when a
+    file is copied to several drives at once, each drive is written in
+    parallel and a slow drive only holds back the others by a few blocks.
+    An error is raised from write() or close() in the calling thread.
+    '''
+    def __init__(self, destination_file):
+        self.destination_file = destination_file
+        self.blocks = queue.Queue(maxsize=4)
+        self.error = None
+        self.writer = threading.Thread(target=self.write_blocks)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def write_blocks(self):
+        try:
+            with open(self.destination_file, 'wb') as fo:
+                while True:
+                    buf = self.blocks.get()
+                    if buf is None:
+                        break
+                    throttle_write(len(buf))
+                    fo.write(buf)
+                sync_and_drop(fo)
+        except Exception as e:
+            self.error = e
+            # keep draining so that write() never blocks on a full queue
+            while self.blocks.get() is not None:
+                pass
+
+    def write(self, buf):
+        if self.error is not None:
+            raise self.error
+        self.blocks.put(buf)
+
+    def close(self):
+        self.blocks.put(None)
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+
+def sync_and_drop(fo):
+    '''
+    Flushes a file that has just been written to disk and drops it from the
+    page cache, so that a verification reread comes from the disk rather
+    than from memory.
+    '''
+    fo.flush()
+    os.fsync(fo.fileno())
+    fadvise(fo.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+def tee_copy(source_file, destination_files, algorithms=('md5',), stat_result=None):
+    '''
+    Copies source_file to one destination file, or to a list of destination
+    files, while hashing the source stream, so that the source is only read
+    once. Returns a dictionary of algorithm: hexdigest of the source, like
+    hashlib_multi. The mode and timestamps of the source are preserved.
+    Each destination is flushed to disk and dropped from the page cache.
+    '''
+    if not isinstance(destination_files, list):
+        destination_files = [destination_files]
+    if stat_result is None:
+        stat_result = os.stat(source_file)
+    hash_objects = [(algorithm, new_hash_object(algorithm)) for algorithm in algorithms]
+    if len(destination_files) == 1:
+        with open(destination_files[0], 'wb') as fo:
+            for buf in ReadAheadReader(source_file):
+                throttle_write(len(buf))
+                fo.write(buf)
+                for _, hash_object in hash_objects:
+                    hash_object.update(buf)
+            sync_and_drop(fo)
+    else:
+        writers = [DestinationWriter(destination_file) for destination_file in destination_files]
+        try:
+            for buf in ReadAheadReader(source_file):
+                for writer in writers:
+                    writer.write(buf)
+                for _, hash_object in hash_objects:
+                    hash_object.update(buf)
+        finally:
+            errors = []
+            for writer in writers:
+                try:
+                    writer.close()
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+    for destination_file in destination_files:
+        copy_metadata(destination_file, stat_result)
+    checksums = dict((algorithm, hash_object.hexdigest()) for algorithm, hash_object in hash_objects)
+    if CHECKSUM_CACHE is not None:
+        CHECKSUM_CACHE.put(checksums, stat_result)
+    return checksums
+
+
+def copy_metadata(destination, stat_result):
+    '''
+    Sets the permissions and the access and modification times of
+    destination from the stat result of its source, like
+    cp --preserve=mode,timestamps
+    '''
+    os.chmod(destination, stat.S_IMODE(stat_result.st_mode))
+    os.utime(destination, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+
+
+# from linux/fs.h - _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# errors that mean that a kernel copy method is not available between two files
+UNSUPPORTED_COPY_ERRORS = (
+    errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL,
+    errno.ENOTTY, errno.EBADF, errno.EPERM
+)
+
+
+def zero_copy(source_file, destination_file, stat_result=None):
+    '''
+    Copies source_file to destination_file without passing the data through
+    python where the storage allows it. A reflink is tried first, which
+    shares the blocks of the source on copy-on-write filesystems such as
+    Btrfs and XFS. Then os.copy_file_range is tried, which copies inside the
+    kernel and lets NFS 4.2 and SMB servers copy on the server side.
+    Otherwise the file is copied block by block.
+    The mode and timestamps of the source are preserved, and the destination
+    is flushed to disk and dropped from the page cache.
+    Returns the method that was used: 'reflink', 'copy_file_range' or
+    'buffered'.
+    '''
+    if stat_result is None:
+        stat_result = os.stat(source_file)
+    method = None
+    with open(source_file, 'rb') as source_object:
+        with open(destination_file, 'wb') as destination_object:
+            if fcntl is not None and stat_result.st_size > 0:
+                try:
+                    fcntl.ioctl(destination_object.fileno(), FICLONE, source_object.fileno())
+                    method = 'reflink'
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_COPY_ERRORS:
+                        raise
+            if method is None and hasattr(os, 'copy_file_range'):
+                # copy a block at a time when the bandwidth is limited
+                if READ_LIMITER is None and WRITE_LIMITER is None:
+                    count = 2**30
+                else:
+                    count = get_read_block_size(source_file)
+                try:
+                    while True:
+                        copied = os.copy_file_range(source_object.fileno(), destination_object.fileno(), count)
+                        if not copied:
+                            break
+                        throttle_read(copied)
+                        throttle_write(copied)
+                    method = 'copy_file_range'
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_COPY_ERRORS:
+                        raise
+                    # start again if the kernel gave up part of the way through
+                    os.lseek(source_object.fileno(), 0, os.SEEK_SET)
+                    os.lseek(destination_object.fileno(), 0, os.SEEK_SET)
+                    os.ftruncate(destination_object.fileno(), 0)
+            if method is None:
+                for buf in ReadAheadReader(source_file):
+                    throttle_write(len(buf))
+                    destination_object.write(buf)
+                method = 'buffered'
+            sync_and_drop(destination_object)
+    copy_metadata(destination_file, stat_result)
+    return method
+
+
+def hashlib_md5(filename, progress=True):
+    '''
+    uses hashlib to return an MD5 checksum of an input filename
+    '''
+    return hashlib_multi(filename, ['md5'], progress)['md5']
 
 
-def hashlib_sha512(filename):
+def hashlib_sha512(filename, progress=True):
     '''
-    Note, this should eventually merged with the hashlib_md5 function.
     uses hashlib to return an sha512 checksum of an input filename
     '''
-    read_size = 0
-    last_percent_done = 0
-    m = hashlib.sha512()
-    total_size = os.path.getsize(filename)
-    with open(str(filename), 'rb') as f:
-        while True:
-            buf = f.read(2**20)
-            if not buf:
-                break
-            read_size += len(buf)
-            m.update(buf)
-            percent_done = 100 * read_size / total_size
-            if percent_done > last_percent_done:
-                sys.stdout.write('[%d%%]\r' % percent_done)
-                sys.stdout.flush()
-                last_percent_done = percent_done
-    sha512_output = m.hexdigest()
-    return sha512_output
+    return hashlib_multi(filename, ['sha512'], progress)['sha512']
+
+
+PHYSICAL_READ_ORDER = False
+# from linux/fiemap.h - struct fiemap and struct fiemap_extent
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
 
-def hashlib_manifest(manifest_dir, manifest_textfile, path_to_remove):
+
+def setup_physical_read_order(enabled, log_name_source=None):
     '''
-    Creates an MD5 manifest with relative filepaths.
+    If enabled, hash_files and iter_hashes read files in the order of their
+    location on disk or tape for the rest of the process, instead of in
+    directory order. Manifests are still written in path order.
+    '''
+    global PHYSICAL_READ_ORDER
+    PHYSICAL_READ_ORDER = enabled
+    if enabled and log_name_source is not None:
+        generate_log(
+            log_name_source,
+            'EVENT = Physical read order - files are read in the order of their location on the storage'
+        )
+
+
+def get_physical_location(filename):
+    '''
+    Returns a (method, sort key) pair that describes where the start of a
+    file is stored. On LTFS the start block is read from the
+    ltfs.startblock extended attribute. Otherwise the physical offset of the
+    first extent is asked for with the FIEMAP ioctl, which works on most
+    linux filesystems. Where neither is available, the inode number is
+    used, which roughly follows the order that files were written in.
+    '''
+    stat_result = os.stat(filename)
+    if hasattr(os, 'getxattr'):
+        try:
+            start_block = int(os.getxattr(filename, 'user.ltfs.startblock'))
+            partition = os.getxattr(filename, 'user.ltfs.partition').decode('utf-8')
+            return 'ltfs', (stat_result.st_dev, partition, start_block)
+        except (OSError, ValueError):
+            pass
+    if fcntl is not None and stat_result.st_size > 0:
+        try:
+            with open(filename, 'rb') as fo:
+                request = FIEMAP_HEADER.pack(0, 2**64 - 1, 0, 0, 1, 0) + bytes(FIEMAP_EXTENT.size)
+                response = fcntl.ioctl(fo.fileno(), FS_IOC_FIEMAP, request)
+            if FIEMAP_HEADER.unpack_from(response)[3]:
+                physical = FIEMAP_EXTENT.unpack_from(response, FIEMAP_HEADER.size)[1]
+                return 'fiemap', (stat_result.st_dev, '', physical)
+        except (OSError, IOError):
+            pass
+    return 'inode', (stat_result.st_dev, '', stat_result.st_ino)
+
+
+def sort_by_physical_location(filepaths):
+    '''
+    Returns filepaths sorted by where each file starts on the storage, so
+    that an LTFS tape or a fragmented hard drive is read in one sweep
+    instead of seeking back and forth.
+    '''
+    methods = {}
+    locations = {}
+    for filepath in filepaths:
+        try:
+            method, location = get_physical_location(filepath)
+        except OSError:
+            method, location = 'unknown', (0, '', 0)
+        methods[method] = methods.get(method, 0) + 1
+        locations[filepath] = location
+    print(' - Sorted %d files by physical location (%s)' % (
+        len(filepaths),
+        ', '.join('%s: %d' % (method, methods[method]) for method in sorted(methods))
+    ))
+    return sorted(filepaths, key=locations.get)
+
+
+def iter_hashed_files(filepaths, hash_function, jobs=1, label='MD5', file_count=None):
+    '''
+    Yields (filepath, checksum) pairs like iter_hashes and prints the
+    progress of each file. filepaths can be a generator, so that a manifest
+    of millions of files never needs a list of every path, in which case
+    file_count has to be given for the progress messages.
+    '''
+    if file_count is None:
+        file_count = len(filepaths)
+    if jobs <= 1 or file_count < 2:
+        if PHYSICAL_READ_ORDER:
+            filepaths = sort_by_physical_location(list(filepaths))
+        for counter, filepath in enumerate(filepaths, 1):
+            print(' - Generating %s for %s - file %d of %d' % (label, filepath, counter, file_count))
+            yield filepath, hash_function(filepath)
+        return
+    for counter, (filepath, checksum) in enumerate(iter_hashes(filepaths, hash_function, jobs), 1):
+        print(' - Generated %s for %s - file %d of %d' % (label, filepath, counter, file_count))
+        yield filepath, checksum
+
+
+def hash_files(filepaths, hash_function, jobs=1, label='MD5'):
+    '''
+    Hashes a list of filepaths and returns a dictionary of filepath: checksum.
+    If jobs is greater than 1, files are hashed in a pool of worker threads.
+    hashlib releases the GIL while digesting, so several files can be read
+    and hashed at the same time.
+    '''
+    return dict(iter_hashed_files(filepaths, hash_function, jobs, label))
+
+
+def iter_hashes(filepaths, hash_function, jobs=1):
+    '''
+    Yields (filepath, checksum) pairs as soon as each file has been hashed.
+    If jobs is greater than 1, files are hashed in a pool of worker threads
+    and are yielded in the order that they finish. Workers pick up files in
+    the order that they are given, so pass the largest files first in order
+    to keep a large file from being left until the end of the run.
+    filepaths can be any iterable, and is only read as workers free up.
+    If setup_physical_read_order has been enabled, files are picked up in
+    the order of their location on the storage instead.
+    '''
+    if PHYSICAL_READ_ORDER:
+        filepaths = sort_by_physical_location(list(filepaths))
+    if jobs <= 1:
+        for filepath in filepaths:
+            yield filepath, hash_function(filepath)
+        return
+    remaining_paths = iter(filepaths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        # only a few files per worker are queued at a time, so that a list of
+        # hundreds of thousands of files doesn't become as many futures.
+        future_to_path = {}
+        def submit(count):
+            for filepath in itertools.islice(remaining_paths, count):
+                future_to_path[executor.submit(hash_function, filepath, progress=False)] = filepath
+        submit(jobs * 4)
+        try:
+            while future_to_path:
+                done, _ = concurrent.futures.wait(
+                    future_to_path, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                submit(len(done))
+                for future in done:
+                    yield future_to_path.pop(future), future.result()
+        finally:
+            # don't hash the rest of the files if the caller stops early
+            for future in future_to_path:
+                future.cancel()
+
+
+def iter_manifest_files(manifest_dir):
+    '''
+    Yields the path of every non-hidden file in manifest_dir, in os.walk
+    order, without building a list of every file.
     '''
-    file_count = 0
-    for root, directories, filenames in os.walk(manifest_dir):
-        filenames = [f for f in filenames if not f[0] == '.']
-        directories[:] = [d for d in directories if not d[0] == '.']
-        for files in filenames:
-            #print(" - Calculating number of files to process in current directory -  %s files        \r "% file_count)
-            print("- Calculating number of files to process in current directory - {0} files ".format(file_count), end="\r")
-            file_count += 1
-    manifest_generator = ''
-    md5_counter = 1
     for root, directories, filenames in os.walk(manifest_dir):
         filenames = [f for f in filenames if f[0] != '.']
         directories[:] = [d for d in directories if d[0] != '.']
         for files in filenames:
-            print(' - Generating MD5 for %s - file %d of %d' % (os.path.join(root, files), md5_counter, file_count))
-            md5 = hashlib_md5(os.path.join(root, files))
-            md5_counter += 1
-            root2 = os.path.abspath(root).replace(path_to_remove, '')
-            try:
-                if root2[0] == '/':
-                    root2 = root2[1:]
-                if root2[0] == '\\':
-                    root2 = root2[1:]
-            except: IndexError
-            manifest_generator += md5[:32] + '  ' + os.path.join(root2, files).replace("\\", "/") + '\n'
-    manifest_list = manifest_generator.splitlines()
-    files_in_manifest = len(manifest_list)
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[34:]))
-    with open(manifest_textfile, "w", encoding='utf-8') as fo:
-        for i in manifest_list:
-            fo.write((unicodedata.normalize('NFC', i) + '\n'))
-
-def sha512_manifest(manifest_dir, manifest_textfile, path_to_remove):
-    '''
-    Note: This should be merged with hashlib_manifest()
-    Creates a sha512 manifest with relative filepaths.
+            yield os.path.join(root, files)
+
+
+def get_manifest_file_list(manifest_dir):
+    '''
+    Returns a list of [root, filename] pairs for all non-hidden files
+    in manifest_dir, in os.walk order.
+    '''
+    file_list = []
+    for filepath in iter_manifest_files(manifest_dir):
+        file_list.append([os.path.dirname(filepath), os.path.basename(filepath)])
+        print("- Calculating number of files to process in current directory - {0} files ".format(len(file_list)), end="\r")
+    return file_list
+
+
+def count_manifest_files(manifest_dir):
+    '''
+    Returns the number of non-hidden files in manifest_dir.
     '''
     file_count = 0
-    for root, directories, filenames in os.walk(manifest_dir):
-        filenames = [f for f in filenames if not f[0] == '.']
-        directories[:] = [d for d in directories if not d[0] == '.']
-        for files in filenames:
-            print(" - Calculating number of files to process in current directory -  %s files        \r"% file_count,)
-            file_count += 1
-    manifest_generator = ''
-    md5_counter = 1
-    for root, directories, filenames in os.walk(manifest_dir):
-        filenames = [f for f in filenames if f[0] != '.']
-        directories[:] = [d for d in directories if d[0] != '.']
-        for files in filenames:
-            print(' - Generating SHA512 for %s - file %d of %d' % (os.path.join(root, files), md5_counter, file_count))
-            sha512 = hashlib_sha512(os.path.join(root, files))
-            md5_counter += 1
-            root2 = os.path.abspath(root).replace(path_to_remove, '')
-            try:
-                if root2[0] == '/':
-                    root2 = root2[1:]
-                if root2[0] == '\\':
-                    root2 = root2[1:]
-            except: IndexError
-            manifest_generator += sha512[:128] + '  ' + os.path.join(root2, files).replace("\\", "/") + '\n'
-    manifest_list = manifest_generator.splitlines()
-    files_in_manifest = len(manifest_list)
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[130:]))
-    with open(manifest_textfile, "w", encoding='utf-8') as fo:
-        for i in manifest_list:
-            fo.write((unicodedata.normalize('NFC', i) + '\n'))
-
-def hashlib_append(manifest_dir, manifest_textfile, path_to_remove):
+    for _ in iter_manifest_files(manifest_dir):
+        file_count += 1
+        print("- Calculating number of files to process in current directory - {0} files ".format(file_count), end="\r")
+    return file_count
+
+
+class ManifestSpool(object):
+    '''
+    Collects checksum manifest lines and writes them sorted by path.
+    Lines are held in memory until max_lines is reached, then sorted and
+    spilled to a temporary run file. write() merges the runs, so memory use
+    is bounded no matter how many files are in the manifest. The sort key
+    is the same x[digest_length + 2:] slice that the manifest functions
+    have always used, so the output is unchanged.
+    '''
+    def __init__(self, digest_length=32, max_lines=100000):
+        self.digest_length = digest_length
+        self.max_lines = max_lines
+        self.lines = []
+        self.runs = []
+        self.line_count = 0
+
+    def sort_key(self, line):
+        return line[self.digest_length + 2:]
+
+    def add(self, checksum, relative_path):
+        '''
+        Adds a checksum and relative path to the spool.
+        '''
+        for line in (checksum + '  ' + relative_path + '\n').splitlines():
+            self.lines.append(line)
+            self.line_count += 1
+        if len(self.lines) >= self.max_lines:
+            self.spill()
+
+    def spill(self):
+        '''
+        Sorts the lines in memory and writes them to a temporary run file.
+        '''
+        run = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+        # http://stackoverflow.com/a/31306961/2188572
+        for line in sorted(self.lines, key=self.sort_key):
+            run.write(line + '\n')
+        run.seek(0)
+        self.runs.append(run)
+        self.lines = []
+
+    def sorted_lines(self):
+        '''
+        Yields every line in sorted order by merging the run files.
+        '''
+        if not self.runs:
+            for line in sorted(self.lines, key=self.sort_key):
+                yield line
+            return
+        if self.lines:
+            self.spill()
+        runs = [(line[:-1] for line in run) for run in self.runs]
+        for line in heapq.merge(*runs, key=self.sort_key):
+            yield line
+
+    def write(self, manifest_textfile, mode='w', normalise=True):
+        '''
+        Writes the sorted manifest and returns the number of lines written.
+        '''
+        try:
+            with open(manifest_textfile, mode, encoding='utf-8') as fo:
+                for line in self.sorted_lines():
+                    if normalise:
+                        line = unicodedata.normalize('NFC', line)
+                    fo.write(line + '\n')
+        finally:
+            for run in self.runs:
+                run.close()
+            self.runs = []
+        return self.line_count
+
+
+def multi_manifest(manifest_dir, manifest_textfiles, path_to_remove, mode='w', jobs=1, chunk_manifest_path=None, chunk_size=None):
+    '''
+    Creates one manifest with relative filepaths per algorithm while only
+    reading each file once.
+    manifest_textfiles is a dictionary of algorithm: manifest path,
+    eg {'md5': 'x_manifest.md5', 'sha512': 'x_manifest-sha512.txt'}
+    mode='a' will append the sorted entries to existing manifests.
+    If chunk_manifest_path is given, a chunk manifest with the MD5 of every
+    chunk_size block of each file is written from the same read.
+    '''
+    algorithms = sorted(manifest_textfiles.keys())
+    # the directory is walked once to count the files and again while
+    # hashing, and each checksum goes straight into the spools, so memory
+    # use doesn't grow with the number of files
+    file_count = count_manifest_files(manifest_dir)
+    spools = dict(
+        (algorithm, ManifestSpool(len(new_hash_object(algorithm).hexdigest())))
+        for algorithm in algorithms
+    )
+    if chunk_manifest_path is None:
+        chunk_size = None
+    elif chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    chunk_records = []
+    for filepath, checksums in iter_hashed_files(
+            iter_manifest_files(manifest_dir),
+            functools.partial(hashlib_multi, algorithms=algorithms, chunk_size=chunk_size), jobs,
+            '/'.join(algorithms).upper() or 'chunk MD5s', file_count
+    ):
+        relative_path = get_relative_manifest_path(
+            os.path.dirname(filepath), os.path.basename(filepath), path_to_remove
+        )
+        for algorithm in algorithms:
+            spools[algorithm].add(checksums[algorithm], relative_path)
+        if chunk_size is not None:
+            chunk_records.append({
+                'path': unicodedata.normalize('NFC', relative_path),
+                'size': os.path.getsize(filepath),
+                'chunk_size': chunk_size,
+                'md5': checksums['chunks']
+            })
+    for algorithm in algorithms:
+        spools[algorithm].write(manifest_textfiles[algorithm], mode)
+    if chunk_size is not None:
+        write_chunk_manifest(chunk_records, chunk_manifest_path)
+
+
+def get_relative_manifest_path(root, files, path_to_remove):
+    '''
+    Returns the path of a file as it is written in a manifest, relative to
+    path_to_remove and with forward slashes.
+    '''
+    root2 = os.path.abspath(root).replace(path_to_remove, '')
+    try:
+        if root2[0] == '/':
+            root2 = root2[1:]
+        if root2[0] == '\\':
+            root2 = root2[1:]
+    except: IndexError
+    return os.path.join(root2, files).replace("\\", "/")
+
+
+CHUNK_SIZE = 2**22
+
+
+def get_chunk_manifest_path(manifest):
+    '''
+    Returns the path of the chunk manifest that belongs beside an md5 or
+    sha512 manifest, eg uuid_manifest.md5 becomes uuid_chunk-manifest.jsonl
+    '''
+    for suffix in ('_manifest.md5', '_manifest-sha512.txt'):
+        if manifest.endswith(suffix):
+            return manifest[:-len(suffix)] + '_chunk-manifest.jsonl'
+    return os.path.splitext(manifest)[0] + '_chunk-manifest.jsonl'
+
+
+def hashlib_chunk(filename, chunk_index, chunk_size=CHUNK_SIZE):
+    '''
+    Returns the MD5 of a single chunk_size block of a file.
+    '''
+    with open(filename, 'rb') as fo:
+        fo.seek(chunk_index * chunk_size)
+        buf = fo.read(chunk_size)
+        throttle_read(len(buf))
+        return hashlib.md5(buf).hexdigest()
+
+
+def write_chunk_manifest(chunk_records, chunk_manifest_path):
+    '''
+    Writes a JSONL chunk manifest with one line per file, sorted by path,
+    containing the relative path, the size and the MD5 of every chunk.
+    validate.py -sample uses this to check a random sample of chunks.
+    '''
+    with open(chunk_manifest_path, 'w', encoding='utf-8') as fo:
+        for record in sorted(chunk_records, key=operator.itemgetter('path')):
+            fo.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def read_chunk_manifest(chunk_manifest_path):
+    '''
+    Returns a dictionary of relative path: chunk manifest record.
+    '''
+    records = {}
+    with open(chunk_manifest_path, 'r', encoding='utf-8') as fo:
+        for line in fo:
+            record = json.loads(line)
+            records[record['path']] = record
+    return records
+
+
+def checksum_manifest(manifest_dir, manifest_textfile, path_to_remove, algorithm='md5', mode='w', jobs=1):
+    '''
+    Creates an MD5 or SHA512 manifest with relative filepaths.
+    mode='a' will append the sorted entries to an existing manifest.
+    '''
+    multi_manifest(manifest_dir, {algorithm: manifest_textfile}, path_to_remove, mode, jobs)
+
+
+def hashlib_manifest(manifest_dir, manifest_textfile, path_to_remove, jobs=1):
+    '''
+    Creates an MD5 manifest with relative filepaths.
+    '''
+    checksum_manifest(manifest_dir, manifest_textfile, path_to_remove, 'md5', 'w', jobs)
+
+
+def sha512_manifest(manifest_dir, manifest_textfile, path_to_remove, jobs=1):
+    '''
+    Creates a sha512 manifest with relative filepaths.
+    '''
+    checksum_manifest(manifest_dir, manifest_textfile, path_to_remove, 'sha512', 'w', jobs)
+
+
+def hashlib_append(manifest_dir, manifest_textfile, path_to_remove, jobs=1):
     '''
     Lazy rehash of hashlib_manifest, except this just adds files to an existing manifest.
     '''
-    file_count = 0
-    for root, directories, filenames in os.walk(manifest_dir):
-        filenames = [f for f in filenames if not f[0] == '.']
-        directories[:] = [d for d in directories if not d[0] == '.']
-        for files in filenames:
-            print(" - Calculating number of files to process in current directory -  %s files        \r"% file_count,)
-            file_count += 1
-    manifest_generator = ''
-    md5_counter = 1
-    for root, directories, filenames in os.walk(manifest_dir):
-        filenames = [f for f in filenames if not f[0] == '.']
-        directories[:] = [d for d in directories if not d[0] == '.']
-        for files in filenames:
-            print(' - Generating MD5 for %s - file %d of %d' % (os.path.join(root, files), md5_counter, file_count))
-            md5 = hashlib_md5(os.path.join(root, files))
-            md5_counter += 1
-            root2 = os.path.abspath(root).replace(path_to_remove, '')
-            try:
-                if root2[0] == '/':
-                    root2 = root2[1:]
-                if root2[0] == '\\':
-                    root2 = root2[1:]
-            except: IndexError
-            manifest_generator += md5[:32] + '  ' + os.path.join(root2, files).replace("\\", "/") + '\n'
-    manifest_list = manifest_generator.splitlines()
-    files_in_manifest = len(manifest_list)
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[34:]))
-    with open(manifest_textfile, "a", encoding='utf-8') as fo:
-        for i in manifest_list:
-            fo.write((unicodedata.normalize('NFC', i) + '\n'))
+    checksum_manifest(manifest_dir, manifest_textfile, path_to_remove, 'md5', 'a', jobs)
 
 
 def make_manifest(manifest_dir, relative_manifest_path, manifest_textfile):
@@ -571,21 +1487,16 @@ def sort_csv(csv_file, key):
 
 def make_desktop_manifest_dir():
     desktop_manifest_dir = os.path.expanduser("~/Desktop/moveit_manifests")
-    if not os.path.isdir(desktop_manifest_dir):
-        #I should probably ask permission here, or ask for alternative location
-        os.makedirs(desktop_manifest_dir)
-        os.makedirs(os.path.join(desktop_manifest_dir, 'old_manifests'))
-    else:
-        if not os.path.isdir(os.path.join(desktop_manifest_dir, 'old_manifests')):
-            os.makedirs(os.path.join(desktop_manifest_dir, 'old_manifests'))
+    # exist_ok, as concurrent masscopy.py jobs can create these at the same time
+    #I should probably ask permission here, or ask for alternative location
+    os.makedirs(os.path.join(desktop_manifest_dir, 'old_manifests'), exist_ok=True)
     return desktop_manifest_dir
 
 
 def make_desktop_logs_dir():
     desktop_logs_dir = os.path.expanduser("~/Desktop/ifiscripts_logs")
-    if not os.path.isdir(desktop_logs_dir):
-        #I should probably ask permission here, or ask for alternative location
-        os.makedirs(desktop_logs_dir)
+    #I should probably ask permission here, or ask for alternative location
+    os.makedirs(desktop_logs_dir, exist_ok=True)
     return desktop_logs_dir
 
 def get_image_sequence_files(directory):
@@ -1032,6 +1943,147 @@ def ask_yes_no(question):
         elif answer in ('N,' 'n'):
             return 'N'
 
+class Manifest(object):
+    '''
+    Loads a checksum manifest once into a list of [checksum, path] entries,
+    indexed by path. Many entries can then be added, removed, renamed or
+    rehashed before the manifest is written back once, atomically, with
+    commit(). The algorithm is guessed from the filename unless it is given.
+    '''
+    def __init__(self, manifest, algorithm=None):
+        if algorithm is None:
+            if manifest.endswith('sha512.txt'):
+                algorithm = 'sha512'
+            else:
+                algorithm = 'md5'
+        self.manifest = manifest
+        self.algorithm = algorithm
+        self.digest_length = len(new_hash_object(algorithm).hexdigest())
+        self.entries = []
+        self.index = {}
+        self.sort_on_commit = False
+        self.normalise_on_commit = False
+        try:
+            with open(manifest, 'r', encoding='utf-8') as fo:
+                manifest_lines = fo.read().splitlines()
+        except UnicodeDecodeError:
+            with open(manifest, 'r', encoding='cp1252') as fo:
+                manifest_lines = fo.read().splitlines()
+        for line in manifest_lines:
+            entry = [line[:self.digest_length], line[self.digest_length + 2:]]
+            self.entries.append(entry)
+            self.index[entry[1]] = entry
+
+    def hash(self, path):
+        return hashlib_multi(path, [self.algorithm])[self.algorithm]
+
+    def add(self, path, checksum=None):
+        '''
+        Hashes path and adds it to the manifest. The path in the manifest is
+        relative to the grandparent of the folder that contains the file,
+        eg uuid/objects/file.mkv. An existing entry for that path is replaced.
+        The manifest will be sorted and normalised to NFC when committed.
+        Returns the relative path.
+        '''
+        if checksum is None:
+            checksum = self.hash(path)
+        path_to_remove = os.path.dirname(os.path.dirname(os.path.dirname(path)))
+        root2 = os.path.abspath(path).replace(path_to_remove, '')
+        try:
+            if root2[0] == '/':
+                root2 = root2[1:]
+            if root2[0] == '\\':
+                root2 = root2[1:]
+        except: IndexError
+        relative_path = root2.replace("\\", "/")
+        if relative_path in self.index:
+            self.index[relative_path][0] = checksum[:self.digest_length]
+        else:
+            entry = [checksum[:self.digest_length], relative_path]
+            self.entries.append(entry)
+            self.index[relative_path] = entry
+        self.sort_on_commit = True
+        self.normalise_on_commit = True
+        return relative_path
+
+    def remove(self, match):
+        '''
+        Removes every entry whose path contains match.
+        Returns the removed lines.
+        '''
+        removed_lines = []
+        remaining_entries = []
+        for entry in self.entries:
+            if match in entry[1]:
+                removed_lines.append(self.format_entry(entry))
+                del self.index[entry[1]]
+            else:
+                remaining_entries.append(entry)
+        self.entries = remaining_entries
+        return removed_lines
+
+    def rename(self, old_path, new_path):
+        '''
+        Replaces old_path with new_path in every path that contains it.
+        Returns the number of entries that were updated.
+        '''
+        renamed = 0
+        for entry in self.entries:
+            if old_path in entry[1]:
+                del self.index[entry[1]]
+                entry[1] = entry[1].replace(old_path, new_path)
+                self.index[entry[1]] = entry
+                renamed += 1
+        return renamed
+
+    def rehash(self, path):
+        '''
+        Rehashes path and updates every entry that contains its filename.
+        This is mostly used to update the checksum of a log that has changed.
+        '''
+        checksum = self.hash(path)
+        for entry in self.entries:
+            if os.path.basename(path) in entry[1]:
+                entry[0] = checksum[:self.digest_length]
+
+    def sort(self):
+        '''
+        Sort the manifest by path when committed.
+        '''
+        self.sort_on_commit = True
+
+    def format_entry(self, entry):
+        return entry[0] + '  ' + entry[1] + '\n'
+
+    def commit(self):
+        '''
+        Writes the manifest to a temporary file beside the original and
+        renames it over the original in one atomic step.
+        '''
+        entries = self.entries
+        if self.sort_on_commit:
+            # http://stackoverflow.com/a/31306961/2188572
+            entries = sorted(entries, key=lambda x: (x[1]))
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest))
+        temp_fd, temp_manifest = tempfile.mkstemp(dir=manifest_dir, suffix='.tmp')
+        try:
+            with os.fdopen(temp_fd, 'w', encoding='utf-8') as fo:
+                for entry in entries:
+                    line = self.format_entry(entry)
+                    if self.normalise_on_commit:
+                        line = unicodedata.normalize('NFC', line)
+                    fo.write(line)
+            if os.path.isfile(self.manifest):
+                shutil.copymode(self.manifest, temp_manifest)
+            os.replace(temp_manifest, self.manifest)
+        except:
+            if os.path.isfile(temp_manifest):
+                os.remove(temp_manifest)
+            raise
+        self.sort_on_commit = False
+        self.normalise_on_commit = False
+
+
 def manifest_replace(manifest, to_be_replaced, replaced_with):
     '''
     Replace strings in a checksum manifest (or any textfile)
@@ -1048,55 +2100,27 @@ def manifest_replace(manifest, to_be_replaced, replaced_with):
 def manifest_update(manifest, path):
     '''
     Adds a new entry to your manifest and sort.
+    manifest can be a path or a Manifest object. A Manifest object is only
+    updated in memory, so that several changes can be written with one commit().
     '''
-    manifest_generator = ''
-    with open(manifest, 'r', encoding='utf-8') as fo:
-        original_lines = fo.readlines()
-        md5 = hashlib_md5(path)
-        path_to_remove = os.path.dirname(os.path.dirname(os.path.dirname(path)))
-        root2 = os.path.abspath(path).replace(path_to_remove, '')
-        try:
-            if root2[0] == '/':
-                root2 = root2[1:]
-            if root2[0] == '\\':
-                root2 = root2[1:]
-        except: IndexError
-        manifest_generator += md5[:32] + '  ' + root2.replace("\\", "/") + '\n'
-        for i in original_lines:
-            manifest_generator += i
-    manifest_list = manifest_generator.splitlines()
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[34:]))
-    with open(manifest, "w", encoding='utf-8') as fo:
-        for i in manifest_list:
-            fo.write((unicodedata.normalize('NFC', i) + '\n'))
+    if isinstance(manifest, Manifest):
+        manifest.add(path)
+    else:
+        manifest_object = Manifest(manifest, 'md5')
+        manifest_object.add(path)
+        manifest_object.commit()
 
 def sha512_update(manifest, path):
     '''
     Adds a new entry to your sha512 manifest and sort.
-    Yet another SHA512 script that needs to be merged with the MD5 functions.
+    manifest can be a path or a Manifest object.
     '''
-    manifest_generator = ''
-    with open(manifest, 'r', encoding='utf-8') as fo:
-        original_lines = fo.readlines()
-        sha512 = hashlib_sha512(path)
-        path_to_remove = os.path.dirname(os.path.dirname(os.path.dirname(path)))
-        root2 = os.path.abspath(path).replace(path_to_remove, '')
-        try:
-            if root2[0] == '/':
-                root2 = root2[1:]
-            if root2[0] == '\\':
-                root2 = root2[1:]
-        except: IndexError
-        manifest_generator += sha512[:128] + '  ' + root2.replace("\\", "/") + '\n'
-        for i in original_lines:
-            manifest_generator += i
-    manifest_list = manifest_generator.splitlines()
-    # http://stackoverflow.com/a/31306961/2188572
-    manifest_list = sorted(manifest_list, key=lambda x: (x[130:]))
-    with open(manifest, "w", encoding='utf-8') as fo:
-        for i in manifest_list:
-            fo.write((unicodedata.normalize('NFC', i) + '\n'))
+    if isinstance(manifest, Manifest):
+        manifest.add(path)
+    else:
+        manifest_object = Manifest(manifest, 'sha512')
+        manifest_object.add(path)
+        manifest_object.commit()
 def check_for_uuid(args):
     '''
     Tries to check if a filepath contains a UUID.
@@ -1177,24 +2201,14 @@ def checksum_replace(manifest, logname, algorithm):
     '''
     Update a value in a checksum manifest.
     Variables just refer to lognames right now, which is the only thing that needs to change at the moment.
+    manifest can be a path or a Manifest object.
     '''
-    updated_manifest = []
-    if algorithm == 'md5':
-        new_checksum = hashlib_md5(logname)
-    elif algorithm == 'sha512':
-        new_checksum = hashlib_sha512(logname)
-    with open(manifest, 'r', encoding='utf-8') as manifesto:
-        manifest_lines = manifesto.readlines()
-        for lines in manifest_lines:
-            if os.path.basename(logname) in lines:
-                if algorithm == 'md5':
-                    lines = lines[31:].replace(lines[31:], new_checksum + lines[32:])
-                elif algorithm == 'sha512':
-                    lines = lines[127:].replace(lines[127:], new_checksum + lines[128:])
-            updated_manifest.append(lines)
-    with open(manifest, 'w', encoding='utf-8') as fo:
-        for lines in updated_manifest:
-            fo.write(lines)
+    if isinstance(manifest, Manifest):
+        manifest.rehash(logname)
+    else:
+        manifest_object = Manifest(manifest, algorithm)
+        manifest_object.rehash(logname)
+        manifest_object.commit()
 
 def img_seq_pixfmt(start_number, path):
     '''
@@ -1275,7 +2289,7 @@ def read_lines(infile):
 def merge_logs(log_name_source, sipcreator_log, sipcreator_manifest):
     '''
     merges the contents of one log with another.
-    updates checksums in your manifest.
+    updates checksums in your manifest, which can be a path or a Manifest object.
     '''
     with open(log_name_source, 'r') as concat_log:
         concat_lines = concat_log.readlines()
@@ -1294,6 +2308,7 @@ def merge_logs_append(log_name_source, sipcreator_log, sipcreator_manifest):
     updates checksums in your manifest.
     This is almost identical to the merge_logs function,except that log_name_source
     is appended to sipcreator_log,not prepended.
+    sipcreator_manifest can be a path or a Manifest object.
     '''
     with open(log_name_source, 'r', encoding='utf-8') as concat_log:
         concat_lines = concat_log.readlines()
@@ -1519,6 +2534,111 @@ def get_free_space(dirname):
         return st.f_bavail * st.f_frsize
 
 
+def get_device(path):
+    '''
+    Returns the st_dev of the drive that path is on. If path does not exist
+    yet, the nearest parent directory that does exist is used.
+    '''
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def max_concurrent_jobs(job_devices, device_jobs=1):
+    '''
+    Returns how many of the jobs in job_devices, a list of sets of drives,
+    can run at the same time if no more than device_jobs jobs may use the
+    same drive at once. Jobs are packed greedily, starting with the jobs
+    that use the fewest drives. The packing can miss the best answer, but
+    1 is only returned if no two jobs can ever run side by side.
+    '''
+    device_usage = {}
+    count = 0
+    for devices in sorted(job_devices, key=len):
+        if all(device_usage.get(device, 0) < device_jobs for device in devices):
+            for device in devices:
+                device_usage[device] = device_usage.get(device, 0) + 1
+            count += 1
+    if count == 1:
+        for first, second in itertools.combinations(job_devices, 2):
+            if device_jobs > 1 or not first & second:
+                return 2
+    return count
+
+
+def describe_job_failure(error):
+    '''
+    Returns a short description of an exception or SystemExit raised by a
+    job in run_device_jobs, for summary reports.
+    '''
+    if isinstance(error, SystemExit):
+        if error.code in (None, 0):
+            return 'exited early'
+        return 'exited early - %s' % error.code
+    return '%s: %s' % (type(error).__name__, error)
+
+
+def run_device_jobs(jobs, function, device_jobs=1, pool_args=()):
+    '''
+    Runs function(job_args) for each (job_args, paths) pair in jobs and
+    yields (job_args, result, error) as each job finishes.
+    Jobs are grouped by the drives that their paths are on, and no more than
+    device_jobs jobs ever use the same drive at once, so jobs on different
+    drives run at the same time while one spindle or LTO drive is never
+    asked to seek between more jobs than it can handle. Jobs that share a
+    drive, such as copies to the same destination, are therefore limited to
+    device_jobs at a time. Jobs run in separate processes, as copyit.py
+    changes the working directory. input() can not be answered there, so
+    pool_args are added to the job_args of those jobs to stop function from
+    asking any questions, eg ['-batch'] for copyit.main. If only one job can
+    run at a time, jobs run in this process, in order, and can still ask.
+    A job that raises an exception or calls sys.exit() does not stop the
+    other jobs - result is None and error describes what went wrong.
+    error is None for jobs that finished.
+    '''
+    device_jobs = max(1, device_jobs)
+    jobs = [(job_args, set(get_device(path) for path in paths)) for job_args, paths in jobs]
+    max_workers = max_concurrent_jobs([devices for _, devices in jobs], device_jobs)
+    if max_workers <= 1:
+        for job_args, _ in jobs:
+            try:
+                yield job_args, function(job_args), None
+            except (SystemExit, Exception) as error:
+                yield job_args, None, describe_job_failure(error)
+        return
+    device_usage = {}
+    for _, devices in jobs:
+        for device in devices:
+            device_usage[device] = 0
+    pending = list(jobs)
+    running = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # start every waiting job whose drives all have a free slot,
+            # so a job on a busy drive doesn't block jobs on idle drives
+            for job in list(pending):
+                job_args, devices = job
+                if all(device_usage[device] < device_jobs for device in devices):
+                    for device in devices:
+                        device_usage[device] += 1
+                    running[executor.submit(function, list(job_args) + list(pool_args))] = job
+                    pending.remove(job)
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                job_args, devices = running.pop(future)
+                for device in devices:
+                    device_usage[device] -= 1
+                try:
+                    result = future.result()
+                except (SystemExit, Exception) as error:
+                    yield job_args, None, describe_job_failure(error)
+                else:
+                    yield job_args, result, None
+
+
 def get_digital_object_descriptor(source_folder):
     '''
     Returns high level identifier for simple identification purposes in our
@@ -2003,6 +3123,157 @@ def count_stuff(source):
             source_count = 1
     return source_count, file_list
 
+
+class TreeScan(object):
+    '''
+    Walks a file or directory once with os.scandir and caches every file
+    along with its stat result, so that the size, count, cleanup and
+    manifest steps don't each have to walk the tree again.
+    Files that are hidden, or that live in hidden, System Volume Information,
+    $RECYCLE.BIN or Seagate directories, are marked as excluded.
+    '''
+    excluded_dirs = ('System Volume Information', '$RECYCLE.BIN', 'Seagate')
+    bad_files = ('.DS_Store', 'Thumbs.db', 'desktop.ini', 'Desktop.ini')
+
+    def __init__(self, top):
+        self.top = top
+        # each entry is [root, filename, stat_result, excluded]
+        self.entries = []
+        # subdirectories of top, in the order that they were found
+        self.directories = []
+        # symlinks to directories, which are not followed
+        self.directory_links = []
+        if os.path.isfile(top):
+            self.add_entry(os.path.dirname(top), os.path.basename(top), False, None)
+        else:
+            self.scan_dir(top, False)
+
+    def add_entry(self, root, filename, excluded, dir_entry):
+        '''
+        Caches a file with its stat result. stat_result is None if the file
+        can not be stat'ed, eg a broken symlink.
+        '''
+        try:
+            if dir_entry is None:
+                stat_result = os.stat(os.path.join(root, filename))
+            else:
+                stat_result = dir_entry.stat()
+        except OSError:
+            stat_result = None
+        self.entries.append([root, filename, stat_result, excluded])
+
+    def scan_dir(self, root, excluded):
+        '''
+        Caches the files in root, then descends into subdirectories in the
+        same top-down order as os.walk. Symlinked directories are not followed.
+        '''
+        subdirectories = []
+        try:
+            with os.scandir(root) as iterator:
+                dir_entries = list(iterator)
+        except OSError:
+            return
+        for dir_entry in dir_entries:
+            try:
+                is_dir = dir_entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if dir_entry.is_symlink():
+                    self.directory_links.append(dir_entry.path)
+                else:
+                    subdirectories.append(dir_entry.name)
+            else:
+                self.add_entry(
+                    root, dir_entry.name,
+                    excluded or dir_entry.name[0] == '.' or os.path.basename(root) == 'System Volume Information',
+                    dir_entry
+                )
+        for name in subdirectories:
+            self.directories.append(os.path.join(root, name))
+            self.scan_dir(
+                os.path.join(root, name),
+                excluded or name[0] == '.' or name in self.excluded_dirs
+            )
+
+    def files(self):
+        '''
+        Returns a list of [root, filename] pairs for files that are not excluded.
+        '''
+        return list(self.iter_files())
+
+    def iter_files(self):
+        '''
+        Yields the [root, filename] pairs of files() without building a list.
+        '''
+        for root, filename, _, excluded in self.entries:
+            if not excluded:
+                yield [root, filename]
+
+    def file_count(self):
+        '''
+        Returns the number of files that are not excluded.
+        '''
+        return sum(1 for entry in self.entries if not entry[3])
+
+    def size(self):
+        '''
+        Returns the size in bytes of every file, including excluded files.
+        '''
+        return sum(entry[2].st_size for entry in self.entries if entry[2] is not None)
+
+    def total_count(self):
+        '''
+        Returns the number of files, including excluded files.
+        '''
+        return len(self.entries)
+
+    def count_stuff(self):
+        '''
+        Equivalent to ififuncs.count_stuff() but uses the cached walk.
+        Returns the number of files and a list of relative paths that begin
+        with the name of the top directory. Like ififuncs.count_stuff(),
+        only hidden files and directories are left out, so files in System
+        Volume Information, $RECYCLE.BIN and Seagate directories are counted
+        even though the other steps exclude them.
+        '''
+        if os.path.isfile(self.top):
+            return 1, []
+        file_list = []
+        for root, filename, _, _ in self.entries:
+            relative_root = os.path.relpath(root, self.top)
+            if filename[0] == '.' or any(
+                    name[0] == '.' for name in relative_root.split(os.sep) if name != os.curdir
+            ):
+                continue
+            relative_path = unicodedata.normalize('NFC', os.path.join(root, filename).replace(os.path.dirname(self.top), ''))[1:]
+            file_list.append(relative_path.replace("\\", "/"))
+        return len(file_list), file_list
+
+    def remove_bad_files(self, log_name_source):
+        '''
+        Removes .DS_Store, Thumbs.db and desktop.ini files from disk and
+        from the cached walk.
+        '''
+        remaining_entries = []
+        for entry in self.entries:
+            if entry[1] in self.bad_files:
+                path = os.path.join(entry[0], entry[1])
+                print(('***********************' + 'removing: ' + path))
+                if not log_name_source == None:
+                    generate_log(
+                        log_name_source,
+                        'EVENT = Unwanted file removal - %s was removed' % path
+                    )
+                try:
+                    os.remove(path)
+                    continue
+                except OSError:
+                    print('can\'t delete as source is read-only')
+            remaining_entries.append(entry)
+        self.entries = remaining_entries
+
+
 def check_existence(dependency_list):
     '''
     Process a list of subprocess strings and check if they're installed
@@ -6,7 +6,7 @@ import os
 import sys
 import argparse
 import walk_to_dfxml
-from lxml import etree
+import ififuncs
 
 
 def parse_args(args_):
@@ -30,6 +30,27 @@ def parse_args(args_):
         '-n',
         action="store_true", help="Do not calculate any hashes"
     )
+    parser.add_argument(
+        '-manifest', '--manifest',
+        action='append', default=[],
+        help='full path to an md5 or sha512 checksum manifest. Digests are'
+        ' taken from the manifests for files that the checksum cache shows'
+        ' have not changed since they were hashed, rather than reading the'
+        ' files again. Use this once for each manifest. This needs -cache.'
+    )
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Only reuse a -manifest checksum if the persistent checksum cache holds the same checksum for the current device, inode, size and modification time of the file. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. Setting the IFISCRIPTS_CHECKSUM_CACHE environment variable has the same effect.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int, default=1,
+        help='number of processes that hash the remaining files in parallel.'
+    )
     parsed_args = parser.parse_args(args_)
     return parsed_args
 
@@ -44,19 +65,28 @@ def main(args_):
         if not args.o.endswith("xml"):
             print('output file must be XML')
     source = args.input
+    # manifest paths are resolved before changing directory
+    manifests = [os.path.abspath(manifest) for manifest in args.manifest]
+    if args.cache:
+        args.cache = os.path.abspath(args.cache)
+    checksum_cache = ififuncs.setup_checksum_cache(args.cache, args.no_cache)
     os.chdir(source)
     if args.n:
         hash_arg = ["-n"]
     else:
         hash_arg = []
-    output = walk_to_dfxml.main(hash_arg)
-    parser = etree.XMLParser(remove_blank_text=True)
-    dfxml_out = etree.fromstring((output), parser=parser)
+    hash_arg.extend(['-j', str(args.jobs)])
+    for manifest in manifests:
+        hash_arg.extend(['-m', manifest])
+    if checksum_cache is not None:
+        hash_arg.extend(['--cache', checksum_cache.cache_path])
+    # each fileobject is written as soon as it is ready, rather than
+    # building the whole document in memory
     if args.o:
         with open(args.o, 'w') as xml_doc:
-            xml_doc.write(etree.tostring(dfxml_out, pretty_print=True).decode('ascii'))
+            walk_to_dfxml.main(hash_arg, xml_doc)
     else:
-        print(etree.tostring(dfxml_out, pretty_print=True).decode('ascii'))
+        walk_to_dfxml.main(hash_arg, sys.stdout)
 
 
 if __name__ == '__main__':
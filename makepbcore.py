@@ -870,12 +870,16 @@ def main(args_):
         ififuncs.generate_log(
             sipcreator_log,
             'EVENT = makepbcore.py finished')
-        ififuncs.checksum_replace(md5_manifest, sipcreator_log, 'md5')
-        ififuncs.checksum_replace(sha512_manifest, sipcreator_log, 'sha512')
-        ififuncs.manifest_update(md5_manifest, csv_filename)
+        package_manifest = ififuncs.Manifest(md5_manifest)
+        package_sha512_manifest = ififuncs.Manifest(sha512_manifest)
+        ififuncs.checksum_replace(package_manifest, sipcreator_log, 'md5')
+        ififuncs.checksum_replace(package_sha512_manifest, sipcreator_log, 'sha512')
+        ififuncs.manifest_update(package_manifest, csv_filename)
         print((' - Updating %s with %s' % (md5_manifest, csv_filename)))
-        ififuncs.sha512_update(sha512_manifest, csv_filename)
+        ififuncs.sha512_update(package_sha512_manifest, csv_filename)
         print((' - Updating %s with %s' % (sha512_manifest, csv_filename)))
+        package_manifest.commit()
+        package_sha512_manifest.commit()
         print(metadata_error)
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -10,7 +10,6 @@ import shutil
 import ififuncs
 from ififuncs import generate_log
 from ififuncs import manifest_file_count
-from ififuncs import hashlib_manifest
 from ififuncs import make_desktop_logs_dir, make_desktop_manifest_dir
 
 
@@ -61,7 +60,51 @@ def main(args_):
         action='store_true',
         help='Generates sha512 checksums instead of md5'
     )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int, default=1,
+        help='Number of files to hash at the same time. Default is 1.'
+    )
+    parser.add_argument(
+        '-both',
+        action='store_true',
+        help='Generates md5 and sha512 manifests while only reading each file once. -sha512 is ignored.'
+    )
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Reuse checksums from a persistent cache for files whose device, inode, size and modification time have not changed. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. Setting the IFISCRIPTS_CHECKSUM_CACHE environment variable has the same effect.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-read_block_size', '--read-block-size',
+        type=ififuncs.parse_block_size, metavar='SIZE',
+        help='Size of each read when hashing files, in bytes or with a K, M or G suffix, eg 8M. The default is 1M, or 8M on LTFS and network shares.'
+    )
+    parser.add_argument(
+        '-max_read_mbps', '--max-read-mbps',
+        type=ififuncs.parse_mbps, metavar='MBPS',
+        help='Limit file reads to this many megabytes per second, eg 50, so that a long running job does not starve other users of shared storage. The default is unlimited.'
+    )
+    parser.add_argument(
+        '-physical_order',
+        action='store_true',
+        help='Read files in the order of their location on the storage instead of in directory order, using LTFS start blocks, FIEMAP extents or inode numbers. This avoids seeking on LTO tapes and fragmented hard drives. Manifests are still written in path order.'
+    )
+    parser.add_argument(
+        '-ionice', choices=['idle', 'best-effort'],
+        help='Set the IO scheduling class of the process with ionice on Linux. idle only uses the disk when nobody else is, best-effort is the normal class.'
+    )
+    parser.add_argument(
+        '-chunks', nargs='?', const=ififuncs.CHUNK_SIZE,
+        type=ififuncs.parse_block_size, metavar='CHUNK_SIZE',
+        help='Also write a chunk manifest containing an MD5 for every 4M chunk of each file, or every CHUNK_SIZE chunk if a size is given, eg 16M. This is used by validate.py -sample for quick spot checks. The chunk digests are calculated in the same read as the manifest, so checksums are never reused from the checksum cache.'
+    )
     args = parser.parse_args(args_)
+    if args.both:
+        args.sha512 = False
     source = args.source
     source_parent_dir = os.path.dirname(source)
     normpath = os.path.normpath(source)
@@ -91,9 +134,15 @@ def main(args_):
         desktop_logs_dir = make_desktop_logs_dir()
         log_name_source = "%s/%s.log" % (desktop_logs_dir, log_name_source_)
     if args.sha512:
-        module = 'hashlib.sha512'
+        manifests = {'sha512': manifest}
     else:
-        module = 'hashlib.md5'
+        manifests = {'md5': manifest}
+    if args.both:
+        if args.s or args.f:
+            manifests['sha512'] = source_parent_dir + '/%s_manifest-sha512.txt' % relative_path
+        else:
+            manifests['sha512'] = "%s/%s_manifest-sha512.txt" % (desktop_manifest_dir, relative_path)
+    module = ', '.join(['hashlib.' + algorithm for algorithm in sorted(manifests)])
     generate_log(log_name_source, 'manifest.py started.')
     if sys.platform == "win32":
             generate_log(
@@ -114,6 +163,10 @@ def main(args_):
         log_name_source,
         'eventDetail=manifest.py %s' % ififuncs.get_script_version('manifest.py'))
     generate_log(log_name_source, 'Source: %s' % source)
+    ififuncs.setup_checksum_cache(args.cache, args.no_cache, log_name_source)
+    ififuncs.setup_read_block_size(args.read_block_size, log_name_source)
+    ififuncs.setup_bandwidth_limits(args.max_read_mbps, None, args.ionice, log_name_source)
+    ififuncs.setup_physical_read_order(args.physical_order, log_name_source)
     if os.path.isfile(source):
         print('\nFile checksum is not currently supported, only directories.\n')
         generate_log(log_name_source, 'Error: Attempted to generate manifest for file. Only Directories/Folders are currently supported')
@@ -130,34 +183,41 @@ def main(args_):
         # There has to be a better way to count the files..
         for _ in filenames:
             source_count += 1 #works in windows at least
-    if os.path.isfile(manifest):
-        count_in_manifest = manifest_file_count(manifest)
-        if source_count != count_in_manifest:
-            print('This manifest may be outdated as the number of files in your directory does not match the number of files in the manifest')
-            generate_log(log_name_source, 'EVENT = Existing source manifest check - Failure - The number of files in the source directory is not equal to the number of files in the source manifest ')
-            sys.exit()
+    for existing_manifest in manifests.values():
+        if os.path.isfile(existing_manifest):
+            count_in_manifest = manifest_file_count(existing_manifest)
+            if source_count != count_in_manifest:
+                print('This manifest may be outdated as the number of files in your directory does not match the number of files in the manifest')
+                generate_log(log_name_source, 'EVENT = Existing source manifest check - Failure - The number of files in the source directory is not equal to the number of files in the source manifest ')
+                sys.exit()
     if not os.path.isfile(manifest):
         try:
             print('Generating source manifest')
             generate_log(log_name_source, 'EVENT = Generating source manifest')
             if args.f:
-                if args.sha512:
-                    ififuncs.sha512_manifest(source, manifest, source)
-                else:
-                    hashlib_manifest(source, manifest, source)
-                shutil.move(log_name_source, source)
+                path_to_remove = source
             else:
-                if args.sha512:
-                    ififuncs.sha512_manifest(source, manifest, source_parent_dir)
-                else:
-                    hashlib_manifest(source, manifest, source_parent_dir)
+                path_to_remove = source_parent_dir
+            chunk_manifest = None
+            if args.chunks:
+                chunk_manifest = ififuncs.get_chunk_manifest_path(manifest)
+            ififuncs.multi_manifest(
+                source, manifests, path_to_remove, jobs=args.jobs,
+                chunk_manifest_path=chunk_manifest, chunk_size=args.chunks
+            )
+            if args.chunks:
+                generate_log(log_name_source, 'EVENT = Chunk manifest created in %s - chunk size %d bytes' % (chunk_manifest, args.chunks))
+                print(('Chunk manifest created in %s' % chunk_manifest))
+            if args.f:
+                shutil.move(log_name_source, source)
         except OSError:
             print('You do not have access to this directory. Perhaps it is read only, or the wrong file system\n')
             sys.exit()
     else:
         generate_log(log_name_source, 'EVENT = Existing source manifest check - Source manifest already exists. Script will exit. ')
-    print(('Manifest created in %s' % manifest))
-    generate_log(log_name_source, 'Manifest created in %s' % manifest)
+    for created_manifest in sorted(manifests.values()):
+        print(('Manifest created in %s' % created_manifest))
+        generate_log(log_name_source, 'Manifest created in %s' % created_manifest)
     return log_name_source
 
 if __name__ == '__main__':
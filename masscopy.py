@@ -6,6 +6,7 @@ import os
 import argparse
 import time
 import copyit
+import ififuncs
 from ififuncs import make_desktop_logs_dir
 
 
@@ -49,6 +50,10 @@ def parse_args():
         action='store_true',
         help='Answers YES to the question: Not enough free space, would you like to continue?'
     )
+    parser.add_argument(
+        '-device_jobs', type=int, default=1,
+        help='Number of copies that can read from or write to the same drive at the same time. Copies that use different drives run at the same time, but every copy writes to the -o drive, so no more than this many copies ever run at once. The default of 1 suits hard drives and LTO, a fast RAID or SSD can take more. Copies that run at the same time use copyit.py -batch, so they never ask a question.'
+    )
     args = parser.parse_args()
     return args
 
@@ -91,11 +96,15 @@ def find_manifest(args):
     return dirlist # the dirlist is sent back out to the rest of the script.
 
 
-def analyze_reports(log_names, desktop_logs_dir):
+def analyze_reports(log_names, desktop_logs_dir, failures=()):
     '''
     Tries to locate copyit.py logs on the desktop and analyzes them.
+    failures is a list of (source, reason) pairs for copyit.py jobs that
+    stopped without returning a log name.
     '''
     print(' - SUMMARY REPORT')
+    for source, reason in failures:
+        print(" - %-*s   : failure - %s" % (50, os.path.basename(os.path.normpath(source)), reason))
     for i in log_names:
         if os.path.isfile(i):
             print(" - %-*s   : %s" % (50, os.path.basename(i)[:-24], analyze_log(i)))
@@ -129,22 +138,28 @@ def main():
         else:
             print(' - %s will be copied' % i)
     time.sleep(2)
+    jobs = []
+    desktop_logs_dir = make_desktop_logs_dir()
     for i in all_files:
         absolute_path = os.path.join(args.o, os.path.basename(i))
         if os.path.isdir(absolute_path):
             print(' - %s already exists, skipping' % absolute_path)
         else:
-            desktop_logs_dir = make_desktop_logs_dir()
             copyit_cmd = [os.path.join(args.input, i), args.o]
             if args.l:
                 copyit_cmd.append('-l')
             elif args.y:
                 copyit_cmd.append('-y')
-            log_name = copyit.main(copyit_cmd)
+            jobs.append((copyit_cmd, [copyit_cmd[0], args.o]))
+    failures = []
+    for copyit_cmd, log_name, error in ififuncs.run_device_jobs(jobs, copyit.main, args.device_jobs, ['-batch']):
+        if error is None:
             log_names.append(log_name)
-            processed_dirs.append(os.path.basename(os.path.join(args.input, i)))
-            print(' - ********\nWARNING - Please check the ifiscripts_logs directory on your Desktop to verify if ALL of your transfers were successful')
-            analyze_reports(log_names, desktop_logs_dir)
+        else:
+            failures.append((copyit_cmd[0], error))
+        processed_dirs.append(os.path.basename(copyit_cmd[0]))
+        print(' - ********\nWARNING - Please check the ifiscripts_logs directory on your Desktop to verify if ALL of your transfers were successful')
+        analyze_reports(log_names, desktop_logs_dir, failures)
 
 
 if __name__ == '__main__':
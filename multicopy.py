@@ -39,6 +39,10 @@ def parse_args():
         action='store_true',
         help='Answers YES to the question: Not enough free space, would you like to continue?'
     )
+    parser.add_argument(
+        '-device_jobs', type=int, default=1,
+        help='Number of copies that can read from or write to the same drive at the same time. Copies that use different drives run at the same time, but every copy writes to the -o drive, so no more than this many copies ever run at once. The default of 1 suits hard drives and LTO, a fast RAID or SSD can take more. Copies that run at the same time use copyit.py -batch, so they never ask a question.'
+    )
     args = parser.parse_args()
     return args
 
@@ -50,15 +54,22 @@ def main():
     log_names = []
     args = parse_args()
     desktop_logs_dir = ififuncs.make_desktop_logs_dir()
+    jobs = []
     for i in args.i:
         copyit_cmd = [i, args.o]
         if args.l:
             copyit_cmd.append('-l')
         elif args.y:
             copyit_cmd.append('-y')
-        log_names.append(copyit.main(copyit_cmd))
+        jobs.append((copyit_cmd, [i, args.o]))
+    failures = []
+    for copyit_cmd, log_name, error in ififuncs.run_device_jobs(jobs, copyit.main, args.device_jobs, ['-batch']):
+        if error is None:
+            log_names.append(log_name)
+        else:
+            failures.append((copyit_cmd[0], error))
     print('********\nWARNING - Please check the ifiscripts_logs directory on your Desktop to verify if ALL of your transfers were successful')
-    masscopy.analyze_reports(log_names, desktop_logs_dir)
+    masscopy.analyze_reports(log_names, desktop_logs_dir, failures)
 
 
 
@@ -45,26 +45,17 @@ def parse_args(args_):
 def update_manifest(manifest, old_path, new_path, new_log_textfile):
     '''
     Updates the path in a checksum manifest to reflect the new location.
+    manifest is an ififuncs.Manifest object, so the change is only written
+    when manifest.commit() is called.
     '''
-    updated_lines = []
-    with open(manifest, 'r') as file_object:
-        checksums = file_object.readlines()
-        for line in checksums:
-            if old_path in line:
-                line = line.replace(old_path, new_path)
-                print(('the following path: %s has been updated with %s in the package manifest' % (old_path, new_path)))
-                ififuncs.generate_log(
-                    new_log_textfile,
-                    'EVENT = eventType=metadata modification,'
-                    ' agentName=package_update.py,'
-                    ' eventDetail=the following path: %s has been updated with %s in the package manifest' % (old_path, new_path)
-                )
-                updated_lines.append(line)
-            else:
-                updated_lines.append(line)
-    with open(manifest, 'w') as updated_manifest:
-        for updated_line in updated_lines:
-            updated_manifest.write(updated_line)
+    for _ in range(manifest.rename(old_path, new_path)):
+        print(('the following path: %s has been updated with %s in the package manifest' % (old_path, new_path)))
+        ififuncs.generate_log(
+            new_log_textfile,
+            'EVENT = eventType=metadata modification,'
+            ' agentName=package_update.py,'
+            ' eventDetail=the following path: %s has been updated with %s in the package manifest' % (old_path, new_path)
+        )
 
 
 def main(args_):
@@ -117,6 +108,10 @@ def main(args_):
         os.makedirs(args.new_folder)
     if isinstance(args.i[0], (list,)):
         args.i = args.i[0]
+    if not args.copy:
+        # consolidate_manifests() appends to the manifest on disk when copying,
+        # so moves are the only changes that can be batched into one commit.
+        package_manifest = ififuncs.Manifest(sip_manifest)
     for filenames in args.i:
         if args.copy:
             copyit.main([filenames, args.new_folder])
@@ -136,7 +131,6 @@ def main(args_):
             sipcreator.consolidate_manifests(sip_path, relative_new_path, new_log_textfile)
             log_manifest = os.path.join(os.path.dirname(new_log_textfile), os.path.basename(filenames) + '_manifest.md5')
             ififuncs.manifest_update(sip_manifest, log_manifest)
-            ififuncs.sort_manifest(sip_manifest)
         else:
             # add test to see if it actually deleted - what if read only?
             shutil.move(filenames, args.new_folder)
@@ -153,7 +147,7 @@ def main(args_):
             relative_new_folder = args.new_folder.replace(os.path.dirname(args.input) + '/', '').replace('\\', '/')
             relative_new_folder = args.new_folder.replace(os.path.dirname(args.input) + '\\', '').replace('\\', '/')
             update_manifest(
-                sip_manifest,
+                package_manifest,
                 relative_filename,
                 os.path.join(relative_new_folder, os.path.basename(relative_filename)).replace('\\', '/'),
                 new_log_textfile
@@ -162,7 +156,10 @@ def main(args_):
         new_log_textfile,
         'EVENT = package_update.py finished'
     )
-    ififuncs.checksum_replace(sip_manifest, new_log_textfile, 'md5')
+    if args.copy:
+        package_manifest = ififuncs.Manifest(sip_manifest)
+    ififuncs.checksum_replace(package_manifest, new_log_textfile, 'md5')
+    package_manifest.commit()
     finish = datetime.datetime.now()
     print('\n- %s ran this script at %s and it finished at %s' % (user, start, finish))
 
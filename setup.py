@@ -31,6 +31,7 @@ NOTE: Objects.py has been copied from https://github.com/simsong/dfxml. walk_to_
         'dcpfixity.py',
         'deletefiles.py',
         'dfxml.py',
+        'diffdfxml.py',
         'durationcheck.py',
         'ffv1mkvvalidate.py',
         'framemd5.py',
@@ -115,6 +115,11 @@ def move_files(inputs, sip_path, args, user):
             cmd.append('-move')
         if args.l:
             cmd.append('-l')
+        cmd.extend(['-j', str(args.jobs)])
+        if args.cache is not None:
+            cmd.extend(['-cache', args.cache])
+        if args.no_cache:
+            cmd.append('-no_cache')
         log_name = copyit.main(cmd)
         log_names.append(log_name)
         if args.rename_uuid:
@@ -212,6 +217,23 @@ def parse_args(args_):
         '-l', action='store_true',
         help='invokes the -lto argument in copyit.py - uses gcp instead of rsync.'
     )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of files to hash at the same time when generating manifests. Default is 1.'
+    )
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Reuse checksums from a persistent cache for files whose device, inode, size and modification time have not changed. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. Setting the IFISCRIPTS_CHECKSUM_CACHE environment variable has the same effect.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-chunks', nargs='?', const=ififuncs.CHUNK_SIZE,
+        type=ififuncs.parse_block_size, metavar='CHUNK_SIZE',
+        help='Also write a chunk manifest beside the package manifest, containing an MD5 for every 4M chunk of each file, or every CHUNK_SIZE chunk if a size is given, eg 16M. This is used by validate.py -sample for quick spot checks. With -sc or -accession the chunk digests are calculated in the same read as the sha512 manifest, otherwise the package is read once more at the end.'
+    )
     parser.add_argument(
         '-sc', action='store_true',
         help='special collections workflow'
@@ -375,8 +397,10 @@ def process_dcp(sip_path, content_title, args, new_manifest_textfile, new_log_te
     )
     with open(clairmeta_xml, 'w') as fo:
         fo.write(xml_pretty)
-    ififuncs.checksum_replace(new_manifest_textfile, new_log_textfile, 'md5')
-    ififuncs.manifest_update(new_manifest_textfile, clairmeta_xml)
+    package_manifest = ififuncs.Manifest(new_manifest_textfile)
+    ififuncs.checksum_replace(package_manifest, new_log_textfile, 'md5')
+    ififuncs.manifest_update(package_manifest, clairmeta_xml)
+    package_manifest.commit()
     print(status)
     print(report)
 
@@ -453,6 +477,7 @@ def main(args_):
         new_log_textfile,
         uuid_event
     )
+    ififuncs.setup_checksum_cache(args.cache, args.no_cache, new_log_textfile)
     if not args.sc:
         ififuncs.generate_log(
             new_log_textfile,
@@ -486,7 +511,7 @@ def main(args_):
                 new_log_textfile,
                 'EVENT = message digest calculation, status=started, eventType=messageDigestCalculation, agentName=hashlib, eventDetail=MD5 checksum of source files within ZIP'
             )
-            ififuncs.hashlib_manifest(args.i[0], source_manifest, os.path.dirname(args.i[0]))
+            ififuncs.hashlib_manifest(args.i[0], source_manifest, os.path.dirname(args.i[0]), args.jobs)
             ififuncs.generate_log(
                 new_log_textfile,
                 'EVENT = message digest calculation, status=finished, eventType=messageDigestCalculation, agentName=hashlib, eventDetail=MD5 checksum of source files within ZIP'
@@ -516,7 +541,7 @@ def main(args_):
         log_names = move_files(inputs, sip_path, args, user)
     ififuncs.get_technical_metadata(sip_path, new_log_textfile)
     ififuncs.hashlib_manifest(
-        metadata_dir, metadata_dir + '/metadata_manifest.md5', metadata_dir
+        metadata_dir, metadata_dir + '/metadata_manifest.md5', metadata_dir, args.jobs
     )
     if args.sc:
         normalise_objects_manifest(sip_path)
@@ -542,7 +567,7 @@ def main(args_):
     consolidate_manifests(sip_path, 'metadata', new_log_textfile)
     ififuncs.hashlib_append(
         logs_dir, new_manifest_textfile,
-        os.path.dirname(os.path.dirname(logs_dir))
+        os.path.dirname(os.path.dirname(logs_dir)), args.jobs
     )
     if args.supplement:
         os.makedirs(supplemental_dir)
@@ -552,6 +577,7 @@ def main(args_):
         os.makedirs(supplemental_dir)
         supplement_cmd = ['-i', [inputxml, inputtracexml, dfxml, source_manifest], '-user', user, '-new_folder', supplemental_dir, os.path.dirname(sip_path), '-copy']
         package_update.main(supplement_cmd)
+    package_manifest = ififuncs.Manifest(new_manifest_textfile)
     if args.sc:
         print('Generating Digital Forensics XML')
         dfxml = accession.make_dfxml(args, sip_path, uuid)
@@ -559,15 +585,34 @@ def main(args_):
             new_log_textfile,
             'EVENT = Metadata extraction - eventDetail=File system metadata extraction using Digital Forensics XML, eventOutcome=%s, agentName=makedfxml' % (dfxml)
         )
-        ififuncs.manifest_update(new_manifest_textfile, dfxml)
-        sha512_log = manifest.main([sip_path, '-sha512', '-s'])
+        ififuncs.manifest_update(package_manifest, dfxml)
+        sha512_cmd = [sip_path, '-sha512', '-s', '-j', str(args.jobs)]
+        if args.cache is not None:
+            sha512_cmd.extend(['-cache', args.cache])
+        if args.no_cache:
+            sha512_cmd.append('-no_cache')
+        if args.chunks:
+            sha512_cmd.extend(['-chunks', str(args.chunks)])
+        sha512_log = manifest.main(sha512_cmd)
         sha512_manifest = os.path.join(
             os.path.dirname(sip_path), uuid + '_manifest-sha512.txt'
         )
-        ififuncs.merge_logs_append(sha512_log, new_log_textfile, new_manifest_textfile)
+        ififuncs.merge_logs_append(sha512_log, new_log_textfile, package_manifest)
         ififuncs.checksum_replace(sha512_manifest, new_log_textfile, 'sha512')
         os.remove(sha512_log)
-    ififuncs.sort_manifest(new_manifest_textfile)
+    package_manifest.sort()
+    package_manifest.commit()
+    if args.chunks and not args.sc and not args.accession:
+        # -sc and accession.py calculate these while making the sha512 manifest
+        chunk_manifest = ififuncs.get_chunk_manifest_path(new_manifest_textfile)
+        ififuncs.multi_manifest(
+            sip_path, {}, os.path.dirname(sip_path), jobs=args.jobs,
+            chunk_manifest_path=chunk_manifest, chunk_size=args.chunks
+        )
+        ififuncs.generate_log(
+            new_log_textfile,
+            'EVENT = Chunk manifest created in %s - chunk size %d bytes' % (chunk_manifest, args.chunks)
+        )
     if not args.quiet:
         if 'log_names' in locals():
             log_report(log_names)
@@ -602,6 +647,13 @@ def main(args_):
         accession_cmd.extend(['-acquisition_type', acquisition_type[2]])
         accession_cmd.extend(['-donation_date', donation_date])
         accession_cmd.extend(['-reproduction_creator', reproduction_creator])
+        if args.cache is not None:
+            accession_cmd.extend(['-cache', args.cache])
+        if args.no_cache:
+            accession_cmd.append('-no_cache')
+        if args.chunks:
+            accession_cmd.extend(['-chunks', str(args.chunks)])
+        accession_cmd.extend(['-j', str(args.jobs)])
         print(accession_cmd)
         accession.main(accession_cmd)
     return new_log_textfile, new_manifest_textfile
@@ -0,0 +1,36 @@
+'''
+Shared fixtures for the IFIscripts tests. The scripts are flat modules in
+the root of the repository, so it is added to the import path.
+'''
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    '''
+    Points ~ at a temporary directory, so that the logs and manifests that
+    the scripts write to ~/Desktop don't end up in the real home directory.
+    The working directory is restored afterwards, as some scripts change it.
+    '''
+    home_dir = tmp_path / 'home'
+    home_dir.mkdir()
+    monkeypatch.setenv('HOME', str(home_dir))
+    monkeypatch.setenv('USERPROFILE', str(home_dir))
+    monkeypatch.delenv('IFISCRIPTS_CHECKSUM_CACHE', raising=False)
+    monkeypatch.chdir(tmp_path)
+    return home_dir
+
+
+def write_files(directory, files):
+    '''
+    Writes a dictionary of relative path: bytes under directory.
+    '''
+    for relative_path, data in files.items():
+        path = os.path.join(str(directory), relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fo:
+            fo.write(data)
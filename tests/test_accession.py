@@ -0,0 +1,15 @@
+'''
+Tests for accession.py.
+'''
+import accession
+import ififuncs
+import makedfxml
+
+
+def test_make_dfxml_passes_the_jobs_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    commands = []
+    monkeypatch.setattr(makedfxml, 'main', commands.append)
+    args = accession.parse_args([str(tmp_path), '-j', '4'])
+    accession.make_dfxml(args, str(tmp_path), 'uuid')
+    assert commands[0][commands[0].index('-j') + 1] == '4'
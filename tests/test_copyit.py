@@ -0,0 +1,116 @@
+'''
+Tests for copyit.py.
+'''
+import os
+import copyit
+from conftest import write_files
+
+
+def make_source(tmp_path):
+    source = tmp_path / 'source'
+    write_files(source, dict(
+        ('reel_%d/frame_%d.dpx' % (number % 2, number), os.urandom(1000 + number))
+        for number in range(8)
+    ))
+    return source
+
+
+def read_tree(directory):
+    '''
+    Returns a dictionary of relative path: bytes for every file in directory.
+    '''
+    tree = {}
+    for root, _, filenames in os.walk(str(directory)):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as fo:
+                tree[os.path.relpath(path, str(directory))] = fo.read()
+    return tree
+
+
+def read_log(log_name):
+    with open(log_name) as fo:
+        return fo.read()
+
+
+def test_tee_with_several_hashing_jobs(tmp_path, home):
+    '''
+    -j hashes the destination manifest in worker threads, which call
+    TransferJournal.hashlib_md5 with progress=False.
+    '''
+    source = make_source(tmp_path)
+    destination = tmp_path / 'destination'
+    destination.mkdir()
+    log_name = copyit.main([str(source), str(destination), '-tee', '-j', '3'])
+    assert read_tree(destination / 'source') == read_tree(source)
+    assert 'File Transfer Judgement - Success' in read_log(log_name)
+
+
+def test_move_within_a_filesystem_logs_reused_checksums(tmp_path, home):
+    '''
+    A renamed source is not hashed again, so no message digest calculation
+    may be logged for the destination manifest.
+    '''
+    source = make_source(tmp_path)
+    expected = read_tree(source)
+    destination = tmp_path / 'destination'
+    destination.mkdir()
+    log = read_log(copyit.main([str(source), str(destination), '-move']))
+    assert read_tree(destination / 'source') == expected
+    assert not source.exists()
+    assert 'the source was renamed, so the checksums in the source manifest are reused' in log
+    assert 'Generating destination manifest: status=started' not in log
+    assert 'File Transfer Judgement - Success' in log
+
+
+def test_verified_move_logs_reused_checksums(tmp_path, home):
+    '''
+    An existing destination directory takes the verified move path, where
+    each file is checked as it is moved and the checksums are reused.
+    '''
+    source = make_source(tmp_path)
+    expected = read_tree(source)
+    destination = tmp_path / 'destination'
+    (destination / 'source').mkdir(parents=True)
+    log = read_log(copyit.main([str(source), str(destination), '-move']))
+    assert read_tree(destination / 'source') == expected
+    assert 'the checksums of files that were verified during the move are reused' in log
+    assert 'Generating destination manifest: status=started' not in log
+    assert 'File Transfer Judgement - Success' in log
+
+
+def test_verified_move_removes_unwanted_files_that_appear(tmp_path, home, monkeypatch):
+    '''
+    A .DS_Store that the Finder writes while the source is being moved
+    must not stop the source directories from being removed.
+    '''
+    source = make_source(tmp_path)
+    destination = tmp_path / 'destination'
+    (destination / 'source').mkdir(parents=True)
+    tee_copy = copyit.ififuncs.tee_copy
+    def finder_tee_copy(path, destination_file, *args, **kwargs):
+        (source / 'reel_0' / '.DS_Store').write_bytes(b'finder')
+        return tee_copy(path, destination_file, *args, **kwargs)
+    monkeypatch.setattr(copyit.ififuncs, 'tee_copy', finder_tee_copy)
+    log = read_log(copyit.main([str(source), str(destination), '-move']))
+    assert not source.exists()
+    assert 'Unwanted file removal - %s was removed' % (source / 'reel_0' / '.DS_Store') in log
+    assert 'File Transfer, status=completed' in log
+
+
+def test_verified_move_reports_leftovers(tmp_path, home, monkeypatch):
+    '''
+    Any other file that is left in the source makes the move incomplete.
+    '''
+    source = make_source(tmp_path)
+    destination = tmp_path / 'destination'
+    (destination / 'source').mkdir(parents=True)
+    tee_copy = copyit.ififuncs.tee_copy
+    def late_tee_copy(path, destination_file, *args, **kwargs):
+        (source / 'reel_1' / 'late.dpx').write_bytes(b'late')
+        return tee_copy(path, destination_file, *args, **kwargs)
+    monkeypatch.setattr(copyit.ififuncs, 'tee_copy', late_tee_copy)
+    log = read_log(copyit.main([str(source), str(destination), '-move']))
+    assert (source / 'reel_1' / 'late.dpx').exists()
+    assert 'File Transfer, status=incomplete' in log
+    assert '1 files are still in %s' % source in log
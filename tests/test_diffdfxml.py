@@ -0,0 +1,151 @@
+'''
+Tests for diffdfxml.py.
+'''
+import os
+import re
+import diffdfxml
+import walk_to_dfxml
+from conftest import write_files
+
+
+def make_dfxml(source, dfxml):
+    '''
+    Writes a DFXML walk of source with walk_to_dfxml.py, as makedfxml.py does.
+    '''
+    cwd = os.getcwd()
+    os.chdir(str(source))
+    try:
+        with open(str(dfxml), 'w') as fo:
+            walk_to_dfxml.main([], fo)
+    finally:
+        os.chdir(cwd)
+    return str(dfxml)
+
+
+def unsort_dfxml(dfxml, repeat=None):
+    '''
+    Rewrites a DFXML file with its fileobjects in reverse order, and the
+    fileobject of the repeat filename twice.
+    '''
+    with open(dfxml) as fo:
+        text = fo.read()
+    fileobjects = re.findall(r'[ \t]*<fileobject>.*?</fileobject>\n', text, re.S)
+    start = text.index(fileobjects[0])
+    end = text.index(fileobjects[-1]) + len(fileobjects[-1])
+    fileobjects.reverse()
+    if repeat is not None:
+        fileobjects.extend(
+            fileobject for fileobject in list(fileobjects)
+            if '<filename>%s</filename>' % repeat in fileobject
+        )
+    with open(dfxml, 'w') as fo:
+        fo.write(text[:start] + ''.join(fileobjects) + text[end:])
+
+
+def record(filename, inode=None, filesize=10, md5=None, name_type='r', mtime=None):
+    return diffdfxml.FileRecord(
+        filename, name_type, filesize, inode, mtime, md5, None, None, None
+    )
+
+
+def summarise(differences):
+    return {
+        'modified': sorted((old.filename, changes) for old, _, changes in differences['modified']),
+        'renamed': sorted((old.filename, new.filename) for old, new, _ in differences['renamed']),
+        'deleted': sorted(old.filename for old in differences['deleted']),
+        'new': sorted(new.filename for new in differences['new']),
+    }
+
+
+def make_package(tmp_path):
+    '''
+    Writes a package and its DFXML, then modifies, renames, deletes and
+    adds files and writes a second DFXML.
+    '''
+    source = tmp_path / 'package'
+    write_files(source, {
+        'objects/a.mov': b'a' * 100,
+        'objects/b.mov': b'b' * 100,
+        'objects/unchanged.mov': b'u' * 100,
+        'objects/touched.mov': b't' * 100,
+        'docs/d.txt': b'd' * 10,
+    })
+    old_dfxml = make_dfxml(source, tmp_path / 'old.xml')
+    with open(str(source / 'objects' / 'a.mov'), 'wb') as fo:
+        fo.write(b'A' * 100)
+    os.rename(str(source / 'objects' / 'b.mov'), str(source / 'objects' / 'b_renamed.mov'))
+    os.remove(str(source / 'docs' / 'd.txt'))
+    write_files(source, {'objects/e.mov': b'e' * 100})
+    touched = str(source / 'objects' / 'touched.mov')
+    stat_result = os.stat(touched)
+    os.utime(touched, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**10))
+    new_dfxml = make_dfxml(source, tmp_path / 'new.xml')
+    return old_dfxml, new_dfxml
+
+
+EXPECTED = {
+    'modified': [('objects/a.mov', ['md5', 'sha512']), ('objects/touched.mov', ['mtime'])],
+    'renamed': [('objects/b.mov', 'objects/b_renamed.mov')],
+    'deleted': ['docs/d.txt'],
+    'new': ['objects/e.mov'],
+}
+
+
+def test_sorted_dfxml_files_are_merged(tmp_path, home):
+    old_dfxml, new_dfxml = make_package(tmp_path)
+    differences = diffdfxml.main([old_dfxml, new_dfxml])
+    assert differences['method'] == 'sort-merge'
+    assert summarise(differences) == EXPECTED
+    assert differences['duplicates'] == []
+
+
+def test_ignore_skips_properties(tmp_path, home):
+    old_dfxml, new_dfxml = make_package(tmp_path)
+    differences = diffdfxml.main([old_dfxml, new_dfxml, '-ignore', 'mtime'])
+    assert summarise(differences)['modified'] == [('objects/a.mov', ['md5', 'sha512'])]
+
+
+def test_unsorted_dfxml_falls_back_to_an_index(tmp_path, home, capsys):
+    old_dfxml, new_dfxml = make_package(tmp_path)
+    unsort_dfxml(new_dfxml, repeat='objects/unchanged.mov')
+    report = str(tmp_path / 'report.csv')
+    differences = diffdfxml.main([old_dfxml, new_dfxml, '-csv', report])
+    assert differences['method'] == 'index'
+    assert summarise(differences) == EXPECTED
+    assert [(side, duplicate.filename) for side, duplicate in differences['duplicates']] == [
+        ('new', 'objects/unchanged.mov')
+    ]
+    assert 'DUPLICATE: objects/unchanged.mov (repeated in the new DFXML)' in capsys.readouterr().out
+    with open(report) as fo:
+        assert 'duplicate,objects/unchanged.mov' in fo.read()
+
+
+def test_merge_sorted_pairs_filenames():
+    old = [record('a'), record('b'), record('d')]
+    new = [record('b'), record('c'), record('d'), record('e')]
+    pairs = list(diffdfxml.merge_sorted(iter(old), iter(new)))
+    assert [
+        (o.filename if o else None, n.filename if n else None) for o, n in pairs
+    ] == [('a', None), ('b', 'b'), (None, 'c'), ('d', 'd'), (None, 'e')]
+
+
+def test_find_renames():
+    deleted = [
+        # the inode is reused by a new file with other content
+        record('reused', inode=5, md5='aa'),
+        record('moved', inode=6, md5='bb'),
+        record('migrated', inode=7, md5='cc'),
+        record('empty', inode=8, filesize=0, md5='d41d8cd98f00b204e9800998ecf8427e'),
+    ]
+    added = [
+        record('other', inode=5, md5='ff'),
+        record('moved_here', inode=6, md5='bb'),
+        record('migrated_here', inode=70, md5='cc'),
+        record('also_empty', inode=80, filesize=0, md5='d41d8cd98f00b204e9800998ecf8427e'),
+    ]
+    renamed, still_deleted, still_added = diffdfxml.find_renames(deleted, added)
+    assert [(old.filename, new.filename) for old, new, _ in renamed] == [
+        ('moved', 'moved_here'), ('migrated', 'migrated_here')
+    ]
+    assert [old.filename for old in still_deleted] == ['reused', 'empty']
+    assert [new.filename for new in still_added] == ['other', 'also_empty']
@@ -0,0 +1,94 @@
+'''
+Tests for ififuncs.py.
+'''
+import hashlib
+import pytest
+import copyit
+import ififuncs
+from conftest import write_files
+
+FILES = dict(
+    ('reel_%d/frame_%02d.dpx' % (number % 3, number), b'frame %d' % number)
+    for number in range(30)
+)
+
+
+def expected_lines(prefix):
+    return [
+        '%s  %s%s\n' % (hashlib.md5(FILES[path]).hexdigest(), prefix, path)
+        for path in sorted(FILES)
+    ]
+
+
+def refuse(*args, **kwargs):
+    raise AssertionError('every checksum was collected before spooling')
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_multi_manifest_streams_into_the_spool(tmp_path, home, monkeypatch, jobs):
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    monkeypatch.setattr(ififuncs, 'hash_files', refuse)
+    monkeypatch.setattr(ififuncs.ManifestSpool.__init__, '__defaults__', (32, 7))
+    write_files(tmp_path / 'source', FILES)
+    manifest = tmp_path / 'source_manifest.md5'
+    ififuncs.multi_manifest(str(tmp_path / 'source'), {'md5': str(manifest)}, str(tmp_path), jobs=jobs)
+    with open(str(manifest)) as fo:
+        assert fo.readlines() == expected_lines('source/')
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_copyit_manifest_streams_into_the_spool(tmp_path, home, monkeypatch, jobs):
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    monkeypatch.setattr(ififuncs, 'hash_files', refuse)
+    monkeypatch.setattr(ififuncs.ManifestSpool.__init__, '__defaults__', (32, 7))
+    write_files(tmp_path / 'source', FILES)
+    manifest = tmp_path / 'source_manifest.md5'
+    assert copyit.make_manifest(str(tmp_path / 'source'), str(manifest), str(tmp_path), jobs) == len(FILES)
+    with open(str(manifest)) as fo:
+        assert fo.readlines() == expected_lines('source/')
+
+
+def test_chunk_manifest_comes_from_the_manifest_read(tmp_path, home, monkeypatch):
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    # reads that don't line up with the chunks
+    monkeypatch.setattr(ififuncs, 'READ_BLOCK_SIZE', 3)
+    reads = []
+    read_blocks = ififuncs.ReadAheadReader.read_blocks
+    def count_reads(self, fo):
+        reads.append(self.filename)
+        return read_blocks(self, fo)
+    monkeypatch.setattr(ififuncs.ReadAheadReader, 'read_blocks', count_reads)
+    files = {'a.mov': b'0123456789abc', 'b.mov': b'', 'c/d.mov': b'01234'}
+    write_files(tmp_path / 'source', files)
+    manifest = str(tmp_path / 'source_manifest.md5')
+    chunk_manifest = ififuncs.get_chunk_manifest_path(manifest)
+    ififuncs.multi_manifest(
+        str(tmp_path / 'source'), {'md5': manifest}, str(tmp_path),
+        chunk_manifest_path=chunk_manifest, chunk_size=5
+    )
+    assert len(reads) == len(files)
+    records = ififuncs.read_chunk_manifest(chunk_manifest)
+    for path, data in files.items():
+        record = records['source/' + path]
+        assert record['size'] == len(data)
+        assert record['chunk_size'] == 5
+        assert record['md5'] == [
+            hashlib.md5(data[offset:offset + 5]).hexdigest()
+            for offset in range(0, len(data), 5)
+        ]
+
+
+def test_tree_scan_counts_like_count_stuff(tmp_path):
+    write_files(tmp_path / 'source', {
+        'objects/a.mov': b'a',
+        'objects/.hidden': b'b',
+        '.hidden_dir/c.mov': b'c',
+        'System Volume Information/IndexerVolumeGuid': b'd',
+        '$RECYCLE.BIN/desktop.ini': b'e',
+        'Seagate/f.txt': b'f',
+    })
+    for top in (tmp_path / 'source', tmp_path / 'source' / 'objects' / 'a.mov'):
+        expected_count, expected_list = ififuncs.count_stuff(str(top))
+        source_count, file_list = ififuncs.TreeScan(str(top)).count_stuff()
+        assert source_count == expected_count
+        assert sorted(file_list) == sorted(expected_list)
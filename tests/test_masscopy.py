@@ -0,0 +1,98 @@
+'''
+Tests for the concurrent copy jobs that masscopy.py and multicopy.py run.
+'''
+import os
+import sys
+import copyit
+import ififuncs
+import multicopy
+from conftest import write_files
+
+
+def test_concurrent_jobs_do_not_ask_questions(tmp_path, home, monkeypatch, capsys):
+    '''
+    Concurrent copyit.py jobs run in a process pool where input() raises
+    EOFError, so an existing destination manifest stops that copy with a
+    logged exit instead of a prompt, and the other copies carry on.
+    '''
+    write_files(tmp_path, {
+        'first/objects/a.mov': b'a' * 1000,
+        'second/objects/b.mov': b'b' * 1000,
+        'third/objects/c.mov': b'c' * 1000,
+    })
+    destination = tmp_path / 'destination'
+    destination.mkdir()
+    (destination / 'second_manifest.md5').write_text('existing\n')
+    monkeypatch.setattr(sys, 'argv', [
+        'multicopy.py', '-i', str(tmp_path / 'first'), str(tmp_path / 'second'),
+        str(tmp_path / 'third'), '-o', str(destination), '-device_jobs', '2'
+    ])
+    multicopy.main()
+    for name, content in (('first', b'a'), ('third', b'c')):
+        with open(str(destination / name / 'objects' / (content.decode() + '.mov')), 'rb') as fo:
+            assert fo.read() == content * 1000
+    logs_dir = ififuncs.make_desktop_logs_dir()
+    logs = {}
+    for log in os.listdir(logs_dir):
+        with open(os.path.join(logs_dir, log)) as fo:
+            logs[log.split('_')[0]] = fo.read()
+    assert 'File Transfer Judgement - Success' in logs['first']
+    assert 'File Transfer Judgement - Success' in logs['third']
+    assert 'already exists and -batch does not allow overwriting' in logs['second']
+    assert (destination / 'second_manifest.md5').read_text() == 'existing\n'
+    assert not (destination / 'second').exists()
+    summary = capsys.readouterr().out.split('SUMMARY REPORT')[-1]
+    summary = dict(
+        [part.strip() for part in line.lstrip(' -').split(':', 1)]
+        for line in summary.splitlines() if ':' in line
+    )
+    assert summary['second'].startswith('failure')
+    assert summary['first'] == 'success'
+    assert summary['third'] == 'success'
+
+
+def test_serial_jobs_can_still_ask(tmp_path, home, monkeypatch):
+    '''
+    Jobs that run one at a time in this process keep the prompts.
+    '''
+    asked = []
+    monkeypatch.setattr(copyit, 'main', lambda args_: asked.append(args_))
+    jobs = [([str(tmp_path), str(tmp_path)], [str(tmp_path)])]
+    list(ififuncs.run_device_jobs(jobs, copyit.main, 1, ['-batch']))
+    assert asked == [[str(tmp_path), str(tmp_path)]]
+
+
+def test_jobs_that_share_a_drive_run_in_process(tmp_path, monkeypatch):
+    '''
+    Sources on two drives that are copied to a third drive can still only
+    run one at a time, so they run in this process without pool_args, and
+    a job that exits does not stop the jobs after it.
+    '''
+    devices = {'first': 1, 'second': 2, 'third': 2, 'destination': 3}
+    monkeypatch.setattr(ififuncs, 'get_device', lambda path: devices[path])
+    ran = []
+
+    def job(args_):
+        ran.append(args_)
+        if args_[0] == 'second':
+            sys.exit('no room')
+        return args_[0] + '.log'
+    jobs = [([source], [source, 'destination']) for source in ('first', 'second', 'third')]
+    results = list(ififuncs.run_device_jobs(jobs, job, 1, ['-batch']))
+    assert ran == [['first'], ['second'], ['third']]
+    assert results == [
+        (['first'], 'first.log', None),
+        (['second'], None, 'exited early - no room'),
+        (['third'], 'third.log', None),
+    ]
+
+
+def test_max_concurrent_jobs():
+    '''
+    Only jobs that share no drive, or a drive with free slots, count.
+    '''
+    assert ififuncs.max_concurrent_jobs([{1, 3}, {2, 3}], 1) == 1
+    assert ififuncs.max_concurrent_jobs([{1, 3}, {2, 3}], 2) == 2
+    assert ififuncs.max_concurrent_jobs([{1}, {2}, {1, 2}], 1) == 2
+    assert ififuncs.max_concurrent_jobs([{1, 2}, {1, 3}, {2, 4}], 1) == 2
+    assert ififuncs.max_concurrent_jobs([], 1) == 0
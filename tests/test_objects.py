@@ -0,0 +1,125 @@
+'''
+Tests for Objects.py.
+'''
+import pytest
+import Objects
+
+
+@pytest.mark.parametrize('value', [
+    '2020-01-02T03:04:05Z',
+    '2020-01-02T03:04:05.123456+01:00',
+    '2020-12-31 23:59:59',
+])
+def test_timestamp_accepts_iso8601(value):
+    timestamp = Objects.TimestampObject(name='mtime')
+    timestamp.time = value
+    assert str(timestamp.time) == value
+
+
+@pytest.mark.parametrize('value', ['2020-13-45Tgarbage', '2020-01-02', '2020-01-02T03:04:05junk'])
+def test_timestamp_rejects_malformed_iso8601_when_set(value):
+    timestamp = Objects.TimestampObject(name='mtime')
+    with pytest.raises(ValueError):
+        timestamp.time = value
+
+
+DFXML = '''<?xml version="1.0" encoding="UTF-8"?>
+<dfxml xmlns="http://www.forensicswiki.org/wiki/Category:Digital_Forensics_XML"
+  xmlns:dc="http://purl.org/dc/elements/1.1/"
+  xmlns:ifi="http://example.org/ifi"
+  version="1.1.1">
+  <metadata>
+    <dc:type>Disk image walk</dc:type>
+  </metadata>
+  <creator>
+    <program>walk_to_dfxml.py</program>
+    <version>0.4.0</version>
+  </creator>
+  <volume offset="0">
+    <partition_offset>1048576</partition_offset>
+    <sector_size>512</sector_size>
+    <block_size>4096</block_size>
+    <ftype_str>ntfs</ftype_str>
+    <block_count>2048</block_count>
+    <fileobject>
+      <filename>objects/a.mov</filename>
+      <name_type>r</name_type>
+      <filesize>100</filesize>
+      <inode>12</inode>
+      <mtime prec="100ns">2020-01-02T03:04:05Z</mtime>
+      <byte_runs>
+        <byte_run file_offset="0" fs_offset="4096" len="100"/>
+      </byte_runs>
+      <hashdigest type="md5">0cc175b9c0f1b6a831c399e269772661</hashdigest>
+      <hashdigest type="sha1">86f7e437faa5a7fce15d1ddcb9eaeaea377667b8</hashdigest>
+      <ifi:note>checked</ifi:note>
+    </fileobject>
+    <fileobject>
+      <filename>objects/b.mov</filename>
+      <name_type>r</name_type>
+      <filesize>0</filesize>
+      <inode>13</inode>
+      <mtime>2021-05-06T07:08:09Z</mtime>
+    </fileobject>
+  </volume>
+  <fileobject>
+    <filename>outside.txt</filename>
+    <filesize>7</filesize>
+    <hashdigest type="md5">e2fc714c4727ee9395f324cd2e7f331f</hashdigest>
+  </fileobject>
+</dfxml>
+'''
+FIELDS = ('filename', 'filesize', 'inode', 'mtime', 'md5', 'sha1', 'data_brs')
+VOLUME_FIELDS = ('partition_offset', 'sector_size', 'block_size', 'ftype_str', 'block_count')
+
+
+def project(dfxml_path, **kwargs):
+    '''
+    Returns the namespaces, document properties, volume properties and
+    the FIELDS of every fileobject that iterparse yields.
+    '''
+    volumes = []
+    files = []
+    dobj = None
+    for event, obj in Objects.iterparse(dfxml_path, events=('start', 'end'), **kwargs):
+        if isinstance(obj, Objects.DFXMLObject):
+            dobj = obj
+        elif isinstance(obj, Objects.VolumeObject) and event == 'start':
+            volumes.append(tuple(str(getattr(obj, field)) for field in VOLUME_FIELDS))
+        elif isinstance(obj, Objects.FileObject):
+            files.append(tuple(str(getattr(obj, field)) for field in FIELDS))
+    return {
+        'namespaces': list(dobj.iter_namespaces()),
+        'document': (dobj.version, dobj.program, dobj.program_version),
+        'volumes': volumes,
+        'files': files,
+    }
+
+
+@pytest.mark.parametrize('lxml', [True, False])
+def test_iterparse_fields_matches_full_parse(tmp_path, monkeypatch, lxml):
+    dfxml_path = str(tmp_path / 'sample_dfxml.xml')
+    with open(dfxml_path, 'w') as fo:
+        fo.write(DFXML)
+    if not lxml:
+        monkeypatch.setattr(Objects, '_lxml_etree', None)
+    elif Objects._lxml_etree is None:
+        pytest.skip('lxml is not installed')
+    else:
+        lxml_iterparse = Objects._lxml_etree.iterparse
+        lxml_calls = []
+        def spy(*args, **kwargs):
+            lxml_calls.append(args)
+            return lxml_iterparse(*args, **kwargs)
+        monkeypatch.setattr(Objects._lxml_etree, 'iterparse', spy)
+    full = project(dfxml_path)
+    projected = project(dfxml_path, fields=FIELDS)
+    assert projected == full
+    if lxml:
+        assert len(lxml_calls) == 1
+    assert full['volumes'] == [('1048576', '512', '4096', 'ntfs', '2048')]
+    assert [fileobject[0] for fileobject in full['files']] == [
+        'objects/a.mov', 'objects/b.mov', 'outside.txt'
+    ]
+    assert ('ifi', 'http://example.org/ifi') in full['namespaces']
+    assert full['document'] == ('1.1.1', 'walk_to_dfxml.py', '0.4.0')
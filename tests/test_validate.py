@@ -0,0 +1,89 @@
+'''
+Tests for validate.py.
+'''
+import os
+import hashlib
+import ififuncs
+import manifest
+import validate
+from conftest import write_files
+
+
+def test_triage_keeps_the_checkpoint_of_a_full_validation(tmp_path, home, monkeypatch):
+    '''
+    A -quick run must not truncate the checkpoint that a later -resume of
+    an interrupted full validation needs.
+    '''
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    write_files(tmp_path, {'package/objects/a.mov': b'a' * 1000})
+    manifest = tmp_path / 'package_manifest.md5'
+    manifest.write_text('%s  package/objects/a.mov\n' % hashlib.md5(b'a' * 1000).hexdigest())
+    checkpoint_path = validate.get_checkpoint_path(
+        str(manifest), ififuncs.make_desktop_logs_dir()
+    )
+    with open(checkpoint_path, 'w') as fo:
+        fo.write('{"path": "interrupted"}\n')
+    validate.main([str(manifest), '-quick'])
+    with open(checkpoint_path) as fo:
+        assert fo.read() == '{"path": "interrupted"}\n'
+    os.remove(checkpoint_path)
+    validate.main([str(manifest), '-quick'])
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_only_an_explicit_cache_is_trusted(tmp_path, home, monkeypatch):
+    '''
+    IFISCRIPTS_CHECKSUM_CACHE must not let a warm cache answer for a file
+    that validate.py was asked to read, and -cache logs how many files the
+    cache answered for.
+    '''
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    write_files(tmp_path, {'package/objects/a.mov': b'a' * 1000})
+    path = str(tmp_path / 'package' / 'objects' / 'a.mov')
+    manifest = tmp_path / 'package_manifest.md5'
+    manifest.write_text('%s  package/objects/a.mov\n' % hashlib.md5(b'a' * 1000).hexdigest())
+    cache_path = str(tmp_path / 'cache.sqlite')
+    ififuncs.setup_checksum_cache(cache_path, False)
+    ififuncs.hashlib_md5(path)
+    # silent corruption - same size and mtime, different bytes
+    stat_result = os.stat(path)
+    with open(path, 'wb') as fo:
+        fo.write(b'b' * 1000)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    monkeypatch.setenv('IFISCRIPTS_CHECKSUM_CACHE', cache_path)
+    logs_dir = ififuncs.make_desktop_logs_dir()
+
+    def read_logs():
+        text = ''
+        for log in os.listdir(logs_dir):
+            if log.endswith('_fixity_validation.log'):
+                with open(os.path.join(logs_dir, log)) as fo:
+                    text += fo.read()
+        return text
+    assert validate.main([str(manifest)]) == 1
+    assert 'Checksum cache' not in read_logs()
+    assert validate.main([str(manifest), '-cache', cache_path]) == 0
+    assert '1 files were checked against cached checksums' in read_logs()
+
+
+def test_sample_check_against_an_ingest_chunk_manifest(tmp_path, home, monkeypatch):
+    '''
+    A log that grew after ingest is unverified, a corrupted chunk is not.
+    '''
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    write_files(tmp_path, {
+        'package/objects/a.mov': b'a' * 1000,
+        'package/logs/package_sip_log.log': b'started\n',
+    })
+    manifest.main([str(tmp_path / 'package'), '-s', '-chunks', '100'])
+    package_manifest = str(tmp_path / 'package_manifest.md5')
+    chunk_manifest = ififuncs.get_chunk_manifest_path(package_manifest)
+    stat_result = os.stat(chunk_manifest)
+    os.utime(chunk_manifest, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns - 10**10))
+    with open(str(tmp_path / 'package' / 'logs' / 'package_sip_log.log'), 'a') as fo:
+        fo.write('finished\n')
+    assert validate.main([package_manifest, '-sample', '100']) == 0
+    with open(str(tmp_path / 'package' / 'objects' / 'a.mov'), 'r+b') as fo:
+        fo.seek(500)
+        fo.write(b'b')
+    assert validate.main([package_manifest, '-sample', '100']) == 1
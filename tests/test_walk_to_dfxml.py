@@ -0,0 +1,78 @@
+'''
+Tests for makedfxml.py and walk_to_dfxml.py.
+'''
+import os
+import hashlib
+import ififuncs
+import makedfxml
+import walk_to_dfxml
+import Objects
+from conftest import write_files
+
+
+def read_md5s(dfxml):
+    return dict(
+        (obj.filename, obj.md5) for obj in Objects.parse(dfxml)
+        if isinstance(obj, Objects.FileObject) and obj.name_type == 'r'
+    )
+
+
+def test_changed_file_is_rehashed_after_manifest_is_rewritten(tmp_path, home, monkeypatch):
+    '''
+    A manifest that is touched or rewritten after a file changes must not
+    vouch for the stale checksum of that file.
+    '''
+    source = tmp_path / 'source'
+    write_files(source, {
+        'objects/a.mov': b'a' * 1000,
+        'objects/b.mov': b'b' * 1000,
+    })
+    cache_path = str(tmp_path / 'cache.sqlite')
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    ififuncs.setup_checksum_cache(cache_path, False)
+    manifests = {
+        'md5': str(tmp_path / 'source_manifest.md5'),
+        'sha512': str(tmp_path / 'source_manifest-sha512.txt')
+    }
+    ififuncs.multi_manifest(str(source), manifests, str(tmp_path))
+    # same size, new content and mtime, then the manifests are rewritten
+    # later without hashing the file again
+    changed = str(source / 'objects' / 'b.mov')
+    stat_result = os.stat(changed)
+    with open(changed, 'wb') as fo:
+        fo.write(b'c' * 1000)
+    os.utime(changed, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9))
+    for manifest in manifests.values():
+        os.utime(manifest, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**10))
+    hashed = []
+    hash_file = walk_to_dfxml.hash_file
+
+    def recording_hash_file(filepath):
+        hashed.append(os.path.basename(filepath))
+        return hash_file(filepath)
+    monkeypatch.setattr(walk_to_dfxml, 'hash_file', recording_hash_file)
+    dfxml = str(tmp_path / 'dfxml.xml')
+    makedfxml.main([
+        str(source), '-o', dfxml, '-manifest', manifests['md5'],
+        '-manifest', manifests['sha512'], '-cache', cache_path
+    ])
+    assert hashed == ['b.mov']
+    md5s = read_md5s(dfxml)
+    assert md5s[os.path.join('objects', 'a.mov')] == hashlib.md5(b'a' * 1000).hexdigest()
+    assert md5s[os.path.join('objects', 'b.mov')] == hashlib.md5(b'c' * 1000).hexdigest()
+
+
+def test_manifests_are_not_trusted_without_a_cache(tmp_path, home, monkeypatch):
+    monkeypatch.setattr(ififuncs, 'CHECKSUM_CACHE', None)
+    source = tmp_path / 'source'
+    write_files(source, {'a.mov': b'a' * 1000})
+    manifest = tmp_path / 'source_manifest.md5'
+    manifest.write_text('%s  source/a.mov\n' % hashlib.md5(b'stale').hexdigest())
+    sha512_manifest = tmp_path / 'source_manifest-sha512.txt'
+    sha512_manifest.write_text('%s  source/a.mov\n' % hashlib.sha512(b'stale').hexdigest())
+    dfxml = str(tmp_path / 'dfxml.xml')
+    makedfxml.main([
+        str(source), '-o', dfxml, '-manifest', str(manifest),
+        '-manifest', str(sha512_manifest), '-no_cache'
+    ])
+    assert read_md5s(dfxml)['a.mov'] == hashlib.md5(b'a' * 1000).hexdigest()
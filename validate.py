@@ -6,9 +6,17 @@ import sys
 import os
 import argparse
 import time
+import itertools
+import json
+import datetime
+import hashlib
+import math
+import random
 import unicodedata
 import ififuncs
+import dfxml
 from ififuncs import make_desktop_logs_dir
+from lxml import etree
 
 
 def get_input(manifest):
@@ -96,9 +104,101 @@ def parse_manifest(manifest, log_name_source, args):
             )
     return manifest_dict, missing_files_list
 
-def validate(manifest_dict, manifest, log_name_source, missing_files_list):
+class ResultsFile(object):
+    '''
+    Appends one JSON object per line to a results file as soon as each
+    verdict is known, so that the outcome of an interrupted run can still be
+    reported.
+    '''
+    def __init__(self, results_path):
+        self.results_path = results_path
+        self.fo = open(results_path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        record['time'] = datetime.datetime.now().isoformat()
+        self.fo.write(json.dumps(record, sort_keys=True) + '\n')
+        self.fo.flush()
+
+    def close(self):
+        self.fo.close()
+
+
+class Checkpoint(object):
+    '''
+    A journal of the files that have been hashed so far in a validation run,
+    with the digest and the size and mtime of each file at the time. If the
+    run is killed, validate.py -resume reuses the verdicts of files that have
+    not changed since, instead of rehashing the whole package.
+    '''
+    def __init__(self, checkpoint_path, resume=False):
+        self.checkpoint_path = checkpoint_path
+        self.entries = {}
+        if resume and os.path.isfile(checkpoint_path):
+            with open(checkpoint_path, 'r', encoding='utf-8') as fo:
+                for line in fo:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line is cut short if the run was killed
+                        continue
+                    self.entries[entry['path']] = entry
+            self.fo = open(checkpoint_path, 'a', encoding='utf-8')
+        else:
+            self.fo = open(checkpoint_path, 'w', encoding='utf-8')
+
+    def lookup(self, path, expected):
+        '''
+        Returns the digest recorded for path if it was hashed against the same
+        expected checksum and its size and mtime have not changed since.
+        '''
+        entry = self.entries.get(path)
+        if entry is None or entry['expected'] != expected:
+            return None
+        stat_result = os.stat(path)
+        if entry['size'] != stat_result.st_size or entry['mtime_ns'] != stat_result.st_mtime_ns:
+            return None
+        return entry['hashed']
+
+    def record(self, path, expected, hashed):
+        stat_result = os.stat(path)
+        entry = {
+            'path': path,
+            'expected': expected,
+            'hashed': hashed,
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns
+        }
+        self.fo.write(json.dumps(entry, sort_keys=True) + '\n')
+        self.fo.flush()
+
+    def remove(self):
+        '''
+        Deletes the journal once the run has finished.
+        '''
+        self.fo.close()
+        os.remove(self.checkpoint_path)
+
+
+def get_checkpoint_path(manifest, desktop_logs_dir):
+    '''
+    Returns a checkpoint path in the desktop logs folder that is always the
+    same for the same manifest, so that a later run can find it.
+    '''
+    manifest = os.path.abspath(manifest)
+    path_hash = hashlib.md5(manifest.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(
+        desktop_logs_dir,
+        '%s_%s_validation_checkpoint.jsonl' % (os.path.basename(manifest), path_hash)
+    )
+
+
+def validate(manifest_dict, manifest, log_name_source, missing_files_list, jobs=1, results_path=None, checkpoint=None):
     '''
     Validates the files listed in the checksum manifest.
+    If jobs is greater than 1, files are hashed in a pool of worker threads,
+    largest files first. If results_path is given, each verdict is appended to
+    it as a line of JSON. If a Checkpoint is given, every digest is journaled
+    and files that were already verified in a previous run are not rehashed.
     '''
     ififuncs.generate_log(
         log_name_source,
@@ -108,14 +208,51 @@ def validate(manifest_dict, manifest, log_name_source, missing_files_list):
     manifest_directory = os.path.dirname(manifest)
     os.chdir(manifest_directory)
     error_list = []
-    for i in sorted(manifest_dict.keys()):
-        print(('Validating %s' % i))
-        if 'manifest-sha512.txt' in manifest:
-            current_hash = ififuncs.hashlib_sha512(i)
-        else:
-            current_hash = ififuncs.hashlib_md5(i)
+    if 'manifest-sha512.txt' in manifest:
+        hash_function = ififuncs.hashlib_sha512
+    else:
+        hash_function = ififuncs.hashlib_md5
+    results = None
+    if results_path is not None:
+        results = ResultsFile(results_path)
+        ififuncs.generate_log(
+            log_name_source,
+            'Validation results are being written to %s' % results_path
+        )
+        for i in missing_files_list:
+            results.write({'path': i, 'status': 'missing'})
+    resumed_hashes = {}
+    if checkpoint is not None:
+        for i in manifest_dict:
+            previous_hash = checkpoint.lookup(i, manifest_dict[i])
+            if previous_hash is not None:
+                resumed_hashes[i] = previous_hash
+        if resumed_hashes:
+            print(('Resuming - %d files were verified in a previous run and will not be rehashed' % len(resumed_hashes)))
+            ififuncs.generate_log(
+                log_name_source,
+                'Resuming from %s - %d unchanged files were verified in a previous run and are not rehashed' % (checkpoint.checkpoint_path, len(resumed_hashes))
+            )
+    if jobs > 1:
+        paths = sorted(manifest_dict.keys(), key=os.path.getsize, reverse=True)
+        print(('Validating %d files with %d workers, largest first' % (len(paths), jobs)))
+    else:
+        paths = sorted(manifest_dict.keys())
+        hash_one_file = hash_function
+        def hash_function(path):
+            print(('Validating %s' % path))
+            return hash_one_file(path)
+    paths = [i for i in paths if i not in resumed_hashes]
+    verdicts = itertools.chain(
+        sorted(resumed_hashes.items()),
+        ififuncs.iter_hashes(paths, hash_function, jobs)
+    )
+    for i, current_hash in verdicts:
+        if checkpoint is not None and i not in resumed_hashes:
+            checkpoint.record(i, manifest_dict[i], current_hash)
         if current_hash == manifest_dict[i]:
             print(('%s has validated' % i))
+            status = 'validated'
         else:
             print(('%s has mismatched checksum - %s expected - %s hashed' % (i, manifest_dict[i], current_hash)))
             ififuncs.generate_log(
@@ -124,6 +261,25 @@ def validate(manifest_dict, manifest, log_name_source, missing_files_list):
             )
             error_list.append('%s has mismatched checksum - %s expected - %s hashed' % (i, manifest_dict[i], current_hash))
             error_counter += 1
+            status = 'mismatch'
+        if results is not None:
+            results.write({
+                'path': i,
+                'status': status,
+                'expected': manifest_dict[i],
+                'hashed': current_hash,
+                'resumed': i in resumed_hashes
+            })
+    if results is not None:
+        results.write({
+            'status': 'finished',
+            'validated': len(manifest_dict) - error_counter,
+            'mismatched': error_counter,
+            'missing': len(missing_files_list)
+        })
+        results.close()
+    if checkpoint is not None:
+        checkpoint.remove()
     if error_counter > 0:
         print(('\n\n*****ERRORS***********!!!!\n***********\nThe number of mismatched checksums is: %s\n***********\n' % error_counter))
         ififuncs.generate_log(
@@ -150,6 +306,173 @@ def validate(manifest_dict, manifest, log_name_source, missing_files_list):
     return error_counter + len(missing_files_list)
 
 
+def get_package_basename(manifest):
+    '''
+    Returns the name of the package folder that a manifest describes,
+    eg the UUID or OE number of a sipcreator package.
+    '''
+    if 'manifest-sha512.txt' in manifest:
+        return os.path.basename(manifest).replace('_manifest-sha512.txt', '')
+    return os.path.basename(manifest).replace('_manifest.md5', '')
+
+
+def read_dfxml_records(dfxml_path):
+    '''
+    Returns a dictionary of filename: (filesize, mtime) for every file
+    recorded in a Digital Forensics XML file.
+    '''
+    namespace = '{http://www.forensicswiki.org/wiki/Category:Digital_Forensics_XML}'
+    records = {}
+    for _, fileobject in etree.iterparse(dfxml_path, tag=namespace + 'fileobject'):
+        filename = fileobject.findtext(namespace + 'filename')
+        filesize = fileobject.findtext(namespace + 'filesize')
+        mtime = fileobject.findtext(namespace + 'mtime')
+        if filename is not None and filesize is not None:
+            if mtime is not None:
+                mtime = dfxml.dftime(mtime).timestamp()
+            records[filename] = (int(filesize), mtime)
+        fileobject.clear()
+    return records
+
+
+def quick_check(manifest_dict, manifest, log_name_source, check_mtime=False):
+    '''
+    Yields (path, status, detail) for each file without reading any file
+    contents. The checksum cache is consulted first, then the size, and
+    optionally the mtime, recorded in the package DFXML.
+    Files that were modified after the DFXML was written, and files that
+    have no record at all, can not be judged and are reported as unverified.
+    '''
+    if 'manifest-sha512.txt' in manifest:
+        algorithm = 'sha512'
+    else:
+        algorithm = 'md5'
+    basename = get_package_basename(manifest)
+    dfxml_path = os.path.join(
+        os.path.dirname(manifest), basename, 'metadata', basename + '_dfxml.xml'
+    )
+    dfxml_records = {}
+    if os.path.isfile(dfxml_path):
+        dfxml_records = read_dfxml_records(dfxml_path)
+        dfxml_written = os.path.getmtime(dfxml_path)
+        ififuncs.generate_log(
+            log_name_source,
+            'Quick check - comparing file sizes against %s' % dfxml_path
+        )
+    for path in sorted(manifest_dict.keys()):
+        stat_result = os.stat(path)
+        if ififuncs.CHECKSUM_CACHE is not None:
+            cached_checksums = ififuncs.CHECKSUM_CACHE.get([algorithm], stat_result)
+            if cached_checksums is not None:
+                if cached_checksums[algorithm] == manifest_dict[path]:
+                    yield path, 'ok', 'cached checksum matches the manifest'
+                else:
+                    yield path, 'suspicious', 'cached checksum %s does not match the manifest' % cached_checksums[algorithm]
+                continue
+        record = dfxml_records.get(path.replace(basename + '/', '', 1))
+        if record is None:
+            yield path, 'unverified', 'no DFXML or cache record'
+            continue
+        filesize, mtime = record
+        problems = []
+        if stat_result.st_size != filesize:
+            problems.append('size is %d bytes, DFXML records %d bytes' % (stat_result.st_size, filesize))
+        if check_mtime and mtime is not None and abs(stat_result.st_mtime - mtime) >= 1:
+            problems.append('mtime has changed since the DFXML was written')
+        if not problems:
+            yield path, 'ok', 'size matches the DFXML'
+        elif stat_result.st_mtime > dfxml_written:
+            yield path, 'unverified', 'modified after the DFXML was written - ' + ', '.join(problems)
+        else:
+            yield path, 'suspicious', ', '.join(problems)
+
+
+def sample_file(path, record, percent, written=None):
+    '''
+    Hashes a random sample of percent % of the chunks of a file, at least one,
+    and returns (status, detail) after comparing them against the digests
+    in its chunk manifest record. written is the modification time of the
+    chunk manifest, so that files such as logs that were legitimately
+    changed afterwards are unverified rather than suspicious.
+    '''
+    if record is None:
+        return 'unverified', 'no chunk manifest record'
+    filesize = os.path.getsize(path)
+    if filesize != record['size']:
+        if written is not None and os.path.getmtime(path) > written:
+            return 'unverified', 'modified after the chunk manifest was written'
+        return 'suspicious', 'size is %d bytes, chunk manifest records %d bytes' % (filesize, record['size'])
+    chunk_count = len(record['md5'])
+    if chunk_count == 0:
+        return 'ok', 'empty file'
+    sample_count = min(chunk_count, max(1, int(math.ceil(chunk_count * percent / 100.0))))
+    mismatched_chunks = []
+    for chunk_index in sorted(random.sample(range(chunk_count), sample_count)):
+        if ififuncs.hashlib_chunk(path, chunk_index, record['chunk_size']) != record['md5'][chunk_index]:
+            mismatched_chunks.append(chunk_index)
+    if mismatched_chunks:
+        return 'suspicious', 'chunks %s do not match the chunk manifest' % ', '.join(str(i) for i in mismatched_chunks)
+    return 'ok', '%d of %d chunks match the chunk manifest' % (sample_count, chunk_count)
+
+
+def sample_check(manifest_dict, manifest, log_name_source, percent, jobs=1):
+    '''
+    Yields (path, status, detail) for each file after hashing a random
+    sample of its chunks. Reference digests come from the chunk manifest
+    written by manifest.py, sipcreator.py or accession.py -chunks.
+    '''
+    chunk_manifest = ififuncs.get_chunk_manifest_path(manifest)
+    if not os.path.isfile(chunk_manifest):
+        print(('No chunk manifest was found at %s - run manifest.py, sipcreator.py or accession.py with -chunks at ingest in order to use -sample' % chunk_manifest))
+        ififuncs.generate_log(
+            log_name_source,
+            'Sample check - no chunk manifest was found at %s' % chunk_manifest
+        )
+        sys.exit()
+    ififuncs.generate_log(
+        log_name_source,
+        'Sample check - hashing %s%% of the chunks of each file and comparing against %s' % (percent, chunk_manifest)
+    )
+    chunk_records = ififuncs.read_chunk_manifest(chunk_manifest)
+    written = os.path.getmtime(chunk_manifest)
+    def check_file(path, progress=False):
+        return sample_file(path, chunk_records.get(unicodedata.normalize('NFC', path)), percent, written)
+    paths = sorted(manifest_dict.keys())
+    for path, (status, detail) in ififuncs.iter_hashes(paths, check_file, jobs):
+        yield path, status, detail
+
+
+def triage(verdicts, log_name_source, missing_files_list, results_path):
+    '''
+    Reports the verdicts of a -quick or -sample check. Returns the number
+    of suspicious and missing files.
+    '''
+    results = ResultsFile(results_path)
+    for i in missing_files_list:
+        results.write({'path': i, 'status': 'missing'})
+    counts = {'ok': 0, 'suspicious': 0, 'unverified': 0}
+    for path, status, detail in verdicts:
+        counts[status] += 1
+        results.write({'path': path, 'status': status, 'detail': detail})
+        if status == 'ok':
+            print(('%s is ok - %s' % (path, detail)))
+        else:
+            print(('%s is %s - %s' % (path, status, detail)))
+            ififuncs.generate_log(
+                log_name_source,
+                '%s is %s - %s' % (path, status, detail)
+            )
+    counts['missing'] = len(missing_files_list)
+    results.write(dict(counts, status='finished'))
+    results.close()
+    summary = 'Triage results - %(ok)d ok, %(suspicious)d suspicious, %(unverified)d unverified, %(missing)d missing' % counts
+    print(summary)
+    ififuncs.generate_log(log_name_source, summary)
+    if counts['suspicious'] or counts['missing']:
+        print('Run a full validation of this package')
+    return counts['suspicious'] + counts['missing']
+
+
 def make_parser(args_):
     '''
     Creates command line arguments and help.
@@ -159,6 +482,59 @@ def make_parser(args_):
     parser.add_argument('input', help='file path of md5 checksum file')
     parser.add_argument('-update_log', help='updates the package log file with the fixity check information', action='store_true')
     parser.add_argument('-y', help='answer Y to user input questions regarding manifest issues', action='store_true')
+    parser.add_argument(
+        '-cache', nargs='?', const='', metavar='CACHE_PATH',
+        help='Reuse checksums from a persistent cache for files whose device, inode, size and modification time have not changed. Optionally enter the path of the SQLite cache, the default is ~/Desktop/ifiscripts_logs/checksum_cache.sqlite. The IFISCRIPTS_CHECKSUM_CACHE environment variable is ignored here, so a validation only trusts the cache when -cache is used.'
+    )
+    parser.add_argument(
+        '-no_cache', '--no-cache', action='store_true',
+        help='Never use the checksum cache - every file is reread. Use this for formal fixity events.'
+    )
+    parser.add_argument(
+        '-read_block_size', '--read-block-size',
+        type=ififuncs.parse_block_size, metavar='SIZE',
+        help='Size of each read when hashing files, in bytes or with a K, M or G suffix, eg 8M. The default is 1M, or 8M on LTFS and network shares.'
+    )
+    parser.add_argument(
+        '-max_read_mbps', '--max-read-mbps',
+        type=ififuncs.parse_mbps, metavar='MBPS',
+        help='Limit file reads to this many megabytes per second, eg 50, so that a long running job does not starve other users of shared storage. The default is unlimited.'
+    )
+    parser.add_argument(
+        '-physical_order',
+        action='store_true',
+        help='Read files in the order of their location on the storage instead of in directory order, using LTFS start blocks, FIEMAP extents or inode numbers. This avoids seeking on LTO tapes and fragmented hard drives. Manifests are still written in path order.'
+    )
+    parser.add_argument(
+        '-ionice', choices=['idle', 'best-effort'],
+        help='Set the IO scheduling class of the process with ionice on Linux. idle only uses the disk when nobody else is, best-effort is the normal class.'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int, default=1,
+        help='Number of files to hash at the same time. Files are hashed largest first. The default is 1.'
+    )
+    parser.add_argument(
+        '-results', metavar='RESULTS_PATH',
+        help='Path of the JSONL file that each verdict is appended to as soon as it is known. The default is a _results.jsonl file beside the validation log in ~/Desktop/ifiscripts_logs.'
+    )
+    parser.add_argument(
+        '-resume', action='store_true',
+        help='Carry on from where an interrupted validation of the same manifest stopped. Files that were verified in that run and whose size and modification time have not changed are not rehashed.'
+    )
+    triage_modes = parser.add_mutually_exclusive_group()
+    triage_modes.add_argument(
+        '-quick', action='store_true',
+        help='Quick triage without reading any files. Each file size is compared against the package DFXML, and checksums are reused from the checksum cache where available. The package log is not updated.'
+    )
+    triage_modes.add_argument(
+        '-sample', type=float, metavar='P',
+        help='Quick triage that hashes a random P%% of the chunks of each file, at least one, and compares them against the chunk manifest that manifest.py, sipcreator.py or accession.py -chunks wrote at ingest. The package log is not updated.'
+    )
+    parser.add_argument(
+        '-mtime', action='store_true',
+        help='With -quick, also compare each modification time against the DFXML.'
+    )
     parsed_args = parser.parse_args(args_)
     return parsed_args
 
@@ -167,9 +543,29 @@ def check_manifest(args, log_name_source):
     '''
     Launches other functions.
     '''
-    manifest = get_input(args.input)
+    manifest = os.path.abspath(get_input(args.input))
+    if args.results is None:
+        results_path = log_name_source.replace('.log', '_results.jsonl')
+    else:
+        results_path = os.path.abspath(args.results)
     manifest_dict, missing_files_list = parse_manifest(manifest, log_name_source, args)
-    error_counter = validate(manifest_dict, manifest, log_name_source, missing_files_list)
+    if args.quick or args.sample:
+        os.chdir(os.path.dirname(manifest))
+        if args.quick:
+            verdicts = quick_check(manifest_dict, manifest, log_name_source, args.mtime)
+        else:
+            verdicts = sample_check(manifest_dict, manifest, log_name_source, args.sample, args.jobs)
+        error_counter = triage(verdicts, log_name_source, missing_files_list, results_path)
+        return manifest, error_counter
+    # a triage run returns above, so it never touches the checkpoint of an
+    # interrupted full validation
+    checkpoint = Checkpoint(
+        get_checkpoint_path(manifest, make_desktop_logs_dir()), args.resume
+    )
+    error_counter = validate(
+        manifest_dict, manifest, log_name_source, missing_files_list,
+        jobs=args.jobs, results_path=results_path, checkpoint=checkpoint
+    )
     return manifest, error_counter
 
 
@@ -178,7 +574,6 @@ def log_results(manifest, log, args):
     If a sipcreator type log is found,validate will update the log with the
     results.
     '''
-    updated_manifest = []
     if 'manifest-sha512.txt' in manifest:
         basename = os.path.basename(manifest).replace('_manifest-sha512.txt', '')
     else:
@@ -197,19 +592,9 @@ def log_results(manifest, log, args):
                 ba.write(lines)
         for possible_manifest in possible_manifests:
             if os.path.isfile(possible_manifest):
-                with open(possible_manifest, 'r') as manifesto:
-                    manifest_lines = manifesto.readlines()
-                    for lines in manifest_lines:
-                        if logname in lines:
-                            if 'manifest-sha512.txt' in possible_manifest:
-                                lines = lines[:127].replace(lines[:127], ififuncs.hashlib_sha512(logfile)) + lines[128:]
-                            elif '_manifest.md5' in possible_manifest:
-                                lines = lines[:31].replace(lines[:31], ififuncs.hashlib_md5(logfile)) + lines[32:]
-                        updated_manifest.append(lines)
-                with open(possible_manifest, 'w') as fo:
-                    for lines in updated_manifest:
-                        fo.write(lines)
-                updated_manifest = []
+                package_manifest = ififuncs.Manifest(possible_manifest)
+                package_manifest.rehash(logfile)
+                package_manifest.commit()
 
 
 def main(args_):
@@ -232,9 +617,24 @@ def main(args_):
         log_name_source,
         'Command line arguments: %s' % args
     )
+    checksum_cache = ififuncs.setup_checksum_cache(
+        args.cache, args.no_cache, log_name_source, use_environment=False
+    )
+    ififuncs.setup_read_block_size(args.read_block_size, log_name_source)
+    ififuncs.setup_bandwidth_limits(args.max_read_mbps, None, args.ionice, log_name_source)
+    ififuncs.setup_physical_read_order(args.physical_order, log_name_source)
     manifest, error_counter = check_manifest(args, log_name_source)
+    if checksum_cache is not None:
+        print('%d files were checked against cached checksums instead of being read' % checksum_cache.hits)
+        ififuncs.generate_log(
+            log_name_source,
+            'EVENT = Checksum cache used - eventDetail=%d files were checked against cached checksums from %s instead of being read' % (checksum_cache.hits, checksum_cache.cache_path)
+        )
     if args.update_log:
-        log_results(manifest, log_name_source, args)
+        if args.quick or args.sample:
+            print('The package log is only updated after a full validation')
+        else:
+            log_results(manifest, log_name_source, args)
     return error_counter
 
 if __name__ == '__main__':
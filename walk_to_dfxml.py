@@ -11,7 +11,7 @@
 #
 # We would appreciate acknowledgement if the software is used.
 
-"""Walk current directory, writing DFXML to stdout."""
+"""Walk current directory, writing DFXML to stdout one fileobject at a time."""
 
 __version__ = "0.3.0"
 
@@ -22,12 +22,92 @@ import argparse
 import traceback
 import logging
 import sys
+import io
+import collections
+import concurrent.futures
+from lxml import etree
 
 _logger = logging.getLogger(os.path.basename(__file__))
 
 import Objects
+import ififuncs
 
-def filepath_to_fileobject(filepath, args):
+def hash_file(filepath):
+    """Returns a tuple of (md5, sha512, error) for a regular file.  The digests are None if the file could not be read in full.  This runs in worker processes, so it only takes and returns plain values."""
+    md5 = None
+    sha512 = None
+    error = None
+    try:
+        with open(filepath, "rb") as in_fh:
+            chunk_size = 2**23
+            md5obj = hashlib.md5()
+            sha512obj = hashlib.sha512()
+            any_error = False
+            while True:
+                buf = b""
+                try:
+                    buf = in_fh.read(chunk_size)
+                except Exception as e:
+                    any_error = True
+                    error = "".join(traceback.format_stack())
+                    if e.args:
+                        error += "\n" + str(e.args)
+                    buf = b""
+                if buf == b"":
+                    break
+
+                md5obj.update(buf)
+                sha512obj.update(buf)
+
+            if not any_error:
+                md5 = md5obj.hexdigest()
+                sha512 = sha512obj.hexdigest()
+    except Exception as e:
+        if error is None:
+            error = ""
+        else:
+            error += "\n"
+        error += "".join(traceback.format_stack())
+        if e.args:
+            error += "\n" + str(e.args)
+    return (md5, sha512, error)
+
+def read_manifest_digests(manifest_paths):
+    """Reads md5 and sha512 checksum manifests into a dictionary keyed by absolute filepath.  Each value maps the algorithm to the digest.  Manifest paths are relative to the directory holding the manifest, and the algorithm is told apart by the length of the digest."""
+    algorithms = {32: "md5", 128: "sha512"}
+    manifest_digests = {}
+    for manifest_path in manifest_paths:
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as manifest_fh:
+                lines = manifest_fh.read().splitlines()
+        except UnicodeDecodeError:
+            with open(manifest_path, "r", encoding="cp1252") as manifest_fh:
+                lines = manifest_fh.read().splitlines()
+        for line in lines:
+            (digest, _, relpath) = line.partition("  ")
+            algorithm = algorithms.get(len(digest))
+            if algorithm is None or relpath == "":
+                continue
+            filepath = os.path.abspath(os.path.join(manifest_dir, relpath))
+            manifest_digests.setdefault(filepath, {})[algorithm] = digest.lower()
+        _logger.debug("Read digests from %r." % manifest_path)
+    return manifest_digests
+
+def trusted_digests(filepath, manifest_digests, checksum_cache):
+    """Returns (md5, sha512, None) from the manifests if both digests are listed for filepath, and checksum_cache holds the same digests for the current device, inode, size and mtime of the file.  The cache entry is written when the file is hashed, so it vouches for each file on its own - unlike the modification time of a manifest, which changes whenever any line is rewritten.  Otherwise returns None, and the file has to be hashed."""
+    if checksum_cache is None:
+        return None
+    entry = manifest_digests.get(os.path.abspath(filepath))
+    if entry is None or "md5" not in entry or "sha512" not in entry:
+        return None
+    cached = checksum_cache.get(("md5", "sha512"), os.stat(filepath))
+    if cached is None or cached["md5"].lower() != entry["md5"] or cached["sha512"].lower() != entry["sha512"]:
+        return None
+    return (entry["md5"], entry["sha512"], None)
+
+def filepath_to_fileobject(filepath, args, digests=None):
+    """Builds a FileObject from the status of filepath.  digests is an optional (md5, sha512, error) tuple for a regular file that has already been hashed - otherwise the file is hashed here."""
     fobj = Objects.FileObject()
 
     #Determine type - done in three steps.
@@ -72,58 +152,91 @@ def filepath_to_fileobject(filepath, args):
     if not args.n:
         #Add hashes for regular files.
         if fobj.name_type == "r":
-            try:
-                with open(filepath, "rb") as in_fh:
-                    chunk_size = 2**22
-                    md5obj = hashlib.md5()
-                    sha512obj = hashlib.sha512()
-                    any_error = False
-                    while True:
-                        buf = b""
-                        try:
-                            buf = in_fh.read(chunk_size)
-                        except Exception as e:
-                            any_error = True
-                            fobj.error = "".join(traceback.format_stack())
-                            if e.args:
-                                fobj.error += "\n" + str(e.args)
-                            buf = b""
-                        if buf == b"":
-                            break
-
-                        md5obj.update(buf)
-                        sha512obj.update(buf)
-
-                    if not any_error:
-                        fobj.md5 = md5obj.hexdigest()
-                        fobj.sha512 = sha512obj.hexdigest()
-            except Exception as e:
-                if fobj.error is None:
-                    fobj.error = ""
-                else:
-                    fobj.error += "\n"
-                fobj.error += "".join(traceback.format_stack())
-                if e.args:
-                    fobj.error += "\n" + str(e.args)
+            if digests is None:
+                digests = hash_file(filepath)
+            (md5, sha512, error) = digests
+            if md5 is not None:
+                fobj.md5 = md5
+                fobj.sha512 = sha512
+            if error is not None:
+                fobj.error = error
     return fobj
 
-def main(args_):
-    #Determine whether we're going in threading mode or not.  (Some modules are not available by default.)
-    args = parse_args(args_)
-    using_threading = False
-    if args.jobs > 1:
-        using_threading = True  #(unless supporting modules are absent)
-        try:
-            import threading
-        except:
-            using_threading = False
-            _logger.warning("Threading support not available.  Running in single thread only.")
+class DFXMLWriter(object):
+    """Writes a DFXML document one fileobject at a time, so memory use does not grow with the number of files.  The output is indented the same way as lxml's pretty printer."""
 
+    def __init__(self, dobj, output_fh):
+        self.output_fh = output_fh
+        self.parser = etree.XMLParser(remove_blank_text=True)
+        head = self.to_pretty_xml(dobj.to_partial_Element(), level=0)
+        self.foot = "</dfxml>"
+        if head.endswith(self.foot):
+            head = head[:-len(self.foot)]
+        else:
+            #The partial element is empty, so it is written as <dfxml ... />.
+            head = head[:-2].rstrip() + ">\n"
+        self.output_fh.write(head)
+
+    def to_pretty_xml(self, element, level):
+        """Converts an ElementTree element to an indented string.  Non-ASCII characters are written as character references."""
         try:
-            import queue
-        except:
-            using_threading = False
-            _logger.warning("Python queue support not available.  (If running Ubuntu, this is in package python3-queuelib.)  Running in single thread only.")
+            lxml_element = self.to_lxml(element)
+        except ValueError:
+            #Prefixed tag names such as dc:type have to go through the parser.
+            lxml_element = etree.fromstring(Objects._ET_tostring(element), self.parser)
+        etree.indent(lxml_element, space="  ", level=level)
+        return etree.tostring(lxml_element, with_tail=False).decode("ascii")
+
+    def to_lxml(self, element):
+        """Copies an ElementTree element into an lxml element without serializing and parsing it."""
+        lxml_element = etree.Element(element.tag, element.attrib)
+        lxml_element.text = element.text
+        for child in element:
+            lxml_element.append(self.to_lxml(child))
+        return lxml_element
+
+    def write(self, fobj):
+        self.output_fh.write("  " + self.to_pretty_xml(fobj.to_Element(), level=1) + "\n")
+
+    def close(self):
+        self.output_fh.write(self.foot + "\n")
+
+
+def iter_fileobjects(filepaths, args, manifest_digests=None, checksum_cache=None):
+    """Yields a FileObject for each filepath, in the order of filepaths.  Digests are taken from manifest_digests where checksum_cache shows that they can be trusted.  With more than one job, the remaining regular files are hashed in a pool of processes, with only a few files per process in flight at a time, while the status of each file is read in this process."""
+    if manifest_digests is None:
+        manifest_digests = {}
+    def find_digests(filepath, submit):
+        if args.n or os.path.islink(filepath) or not os.path.isfile(filepath):
+            return None
+        digests = trusted_digests(filepath, manifest_digests, checksum_cache)
+        if digests is None and submit is not None:
+            digests = submit(hash_file, os.path.abspath(filepath))
+        return digests
+    if args.jobs <= 1:
+        for filepath in filepaths:
+            yield filepath_to_fileobject(filepath, args, find_digests(filepath, None))
+        return
+    def to_fileobject(filepath, digests):
+        if isinstance(digests, concurrent.futures.Future):
+            digests = digests.result()
+        return filepath_to_fileobject(filepath, args, digests)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        pending = collections.deque()
+        for filepath in filepaths:
+            pending.append((filepath, find_digests(filepath, executor.submit)))
+            if len(pending) >= args.jobs * 4:
+                yield to_fileobject(*pending.popleft())
+        while pending:
+            yield to_fileobject(*pending.popleft())
+
+def main(args_, output_fh=None):
+    """Walks the current directory and writes DFXML to output_fh as each file is processed.  If output_fh is None, the DFXML is returned as a string instead."""
+    args = parse_args(args_)
+    if output_fh is None:
+        string_fh = io.StringIO()
+        main(args_, string_fh)
+        return string_fh.getvalue()
 
     dobj = Objects.DFXMLObject(version="1.1.1")
     dobj.program = sys.argv[0]
@@ -147,59 +260,34 @@ def main(args_):
             filepath = os.path.relpath(os.path.join(dirpath, dirent_name))
             filepaths.add(filepath)
 
-    fileobjects_by_filepath = dict()
-
-    if using_threading:
-        #Threading syntax c/o: https://docs.python.org/3.5/library/queue.html
-        q = queue.Queue()
-        threads = []
-
-        def _worker():
-            while True:
-                filepath = q.get()
-                if filepath is None:
-                    break
-                fobj = filepath_to_fileobject(filepath, args)
-                fileobjects_by_filepath[filepath] = fobj
-                q.task_done()
-
-        for i in range(args.jobs):
-            t = threading.Thread(target=_worker)
-            t.start()
-            threads.append(t)
+    #Only the paths are held in memory - each fileobject is written as soon as it is ready.
+    writer = DFXMLWriter(dobj, output_fh)
+    manifest_digests = {}
+    checksum_cache = None
+    if args.manifest and not args.n:
+        if args.cache is None:
+            _logger.warning("Manifest digests can only be reused with --cache, so every file will be hashed.")
+        else:
+            manifest_digests = read_manifest_digests(args.manifest)
+            checksum_cache = ififuncs.ChecksumCache(args.cache)
+    for fobj in iter_fileobjects(sorted(filepaths), args, manifest_digests, checksum_cache):
+        writer.write(fobj)
+    writer.close()
 
-        for filepath in filepaths:
-            q.put(filepath)
-
-        # block until all tasks are done
-        q.join()
-
-        # stop workers
-        for i in range(args.jobs):
-            q.put(None)
-        for t in threads:
-            t.join()
-    else: #Not threading.
-        for filepath in sorted(filepaths):
-            fobj = filepath_to_fileobject(filepath, args)
-            fileobjects_by_filepath[filepath] = fobj
-
-    #Build output DFXML tree.
-    for filepath in sorted(fileobjects_by_filepath.keys()):
-        dobj.append(fileobjects_by_filepath[filepath])
-    return dobj.to_dfxml()
 def parse_args(args_):
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--debug", action="store_true")
     parser.add_argument("-n", action="store_true", help="Do not calculate any hashes")
-    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of file-processing threads to run.")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of hashing processes to run.")
+    parser.add_argument("-m", "--manifest", action="append", default=[], help="An md5 or sha512 checksum manifest.  Digests are reused for files that the --cache shows have not changed since they were hashed, instead of rehashing them.  Give this once per manifest - files are only skipped if both digests are found.")
+    parser.add_argument("-c", "--cache", help="Path of an ififuncs checksum cache.  A manifest digest is only reused if the cache holds the same digest for the current device, inode, size and mtime of the file.")
     args = parser.parse_args(args_)
 
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
 
     if args.jobs <= 0:
-        raise ValueError("If requesting multiple jobs, please request 1 or more worker threads.")
+        raise ValueError("If requesting multiple jobs, please request 1 or more worker processes.")
     return args
 if __name__ == "__main__":
-    main(sys.argv[1:])
+    main(sys.argv[1:], sys.stdout)
 